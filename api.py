@@ -1,127 +1,105 @@
 from flask import Flask, request, jsonify, send_file, Response
 from flask_cors import CORS
-import asyncio
-from scraper import HiyaScraper
-import tempfile
+from scraper import HiyaScraper, decode_cookies, is_production_env
+from runtime import runtime, env_flag
+from changes import load_latest_diff
+from snapshots import SnapshotStore
+from store import get_store
+from scheduler import Scheduler, load_schedule
+from exporters import normalize_format, format_mimetype
+from jobs import jobs, CANCEL_GRACE_SECONDS
+from mfa import pending_logins, MfaRequired, TooManyPendingLogins
+from sessions import get_sessions, remember_outcome
+from service import (
+    EXPOSED_HEADERS, STREAM_PROGRESS_SECONDS, NO_ENV_COOKIES_ERROR,
+    load_cookies_from_env, scrape_options, configure_scraper, scrape_headers, snapshot_headers,
+    export_filename, open_export, remove_file, stream_export_events, fresh_snapshot, scraper_for_request,
+    env_scraper, session_scraper, create_session as store_session, verify_cookies, preflight, SessionRejected,
+    authorized_account, Unauthorized,
+    sse_event, progress_payload, final_stream_event, home_payload, ready_payload, metrics_payload,
+    phones_etag, phones_payload, traces_payload, captured_payload, mfa_required_payload,
+    authenticate_and_capture, verify_pending_login,
+)
 import os
-from datetime import datetime
-import json
-import sys
-import base64
+import atexit
+import time
 
 app = Flask(__name__)
-CORS(app)  # Enable CORS for GitHub Pages
-
-def load_cookies_from_env():
-    """Load cookies from environment variable"""
-    cookies_b64 = os.environ.get('HIYA_COOKIES')
-    if not cookies_b64:
-        return None
-
+# Enable CORS for GitHub Pages, letting the page read our status headers
+CORS(app, expose_headers=EXPOSED_HEADERS)
+
+# Launch the shared browser in the background when the worker boots
+# (defaults to on in production) and optionally check the env cookies
+PREWARM_ENABLED = env_flag('HIYA_PREWARM', default=is_production_env())
+PREWARM_VALIDATE = env_flag('HIYA_PREWARM_VALIDATE')
+
+# Background scheduler, created in start_lifecycle() when schedules are configured
+scheduler = None
+
+def send_export(filename, fmt, cleanup=True):
+    """Send an export file as a download, deleting it afterwards if it is temporary"""
+    response = send_file(
+        filename,
+        mimetype=format_mimetype(fmt),
+        as_attachment=True,
+        download_name=export_filename(fmt)
+    )
+
+    # Clean up temp file after sending
+    if cleanup:
+        response.call_on_close(lambda: remove_file(filename))
+
+    return response
+
+def run_export(scraper, fmt):
+    """Scrape straight into an export file and send it - the rows collected so far if the scrape fails part-way"""
+    # Fail fast on cookies that cannot log in, before a browser context is opened
+    preflight(scraper)
+    filename = open_export(scraper, fmt)
+
+    # Run async scraper on the shared browser runtime
     try:
-        cookies_json = base64.b64decode(cookies_b64).decode()
-        cookies = json.loads(cookies_json)
-        return cookies
+        runtime.run(runtime.scrape(scraper))
     except Exception as e:
-        print(f"Error loading cookies from environment: {e}")
-        return None
-
-def check_cookie_health(cookies):
-    """Check the health status of cookies"""
-    if not cookies:
-        return {
-            'status': 'missing',
-            'message': 'No cookies configured',
-            'session_valid': False,
-            'device_trust_valid': False
-        }
-
-    import time
-    current_time = time.time()
-
-    # Check session cookies
-    session_cookies = ['auth0', 'auth0_compat', 'appSession.0', 'appSession.1']
-    session_valid = False
-    session_expires_in = 0
-
-    for cookie in cookies:
-        if cookie.get('name') in session_cookies:
-            expires = cookie.get('expires', -1)
-            if expires == -1 or expires > current_time:
-                session_valid = True
-                if expires > 0:
-                    session_expires_in = max(session_expires_in, expires - current_time)
-
-    # Check device trust cookies (auth0-mf for 2FA skip)
-    device_cookies = ['auth0-mf', 'auth0-mf_compat', 'did', 'did_compat']
-    device_trust_valid = False
-    device_expires_in = 0
-
-    for cookie in cookies:
-        if cookie.get('name') in device_cookies:
-            expires = cookie.get('expires', -1)
-            if expires == -1 or expires > current_time:
-                device_trust_valid = True
-                if expires > 0:
-                    device_expires_in = max(device_expires_in, expires - current_time)
-
-    # Determine status
-    if session_valid and device_trust_valid:
-        status = 'healthy'
-        message = 'All cookies valid'
-    elif session_valid and not device_trust_valid:
-        status = 'warning'
-        message = 'Session valid but device trust expired (2FA may be required)'
-    elif not session_valid and device_trust_valid:
-        status = 'auto_refresh'
-        message = 'Session expired but can auto-refresh (device trusted)'
-    else:
-        status = 'expired'
-        message = 'All cookies expired'
-
-    return {
-        'status': status,
-        'message': message,
-        'session_valid': session_valid,
-        'session_expires_in_hours': round(session_expires_in / 3600, 1) if session_expires_in > 0 else 0,
-        'device_trust_valid': device_trust_valid,
-        'device_expires_in_days': round(device_expires_in / 86400, 1) if device_expires_in > 0 else 0
-    }
+        if not scraper.record_count:
+            remove_file(filename)
+            raise
+        print(f"⚠️  Scrape failed after {scraper.pages_completed} pages - "
+              f"returning {scraper.record_count} partial records: {e}")
+    finally:
+        remember_outcome(scraper)
+
+    response = send_export(filename, fmt)
+    response.headers.update(scrape_headers(scraper))
+    return response
+
+def reader_account():
+    """Verified account for a read-only route, from its session handle or the API token"""
+    return authorized_account(request.headers.get('X-Hiya-Session') or request.args.get('session'),
+                              request.headers.get('Authorization'))
+
+def send_snapshot(store, meta, fmt, filters=None):
+    """Serve the newest snapshot, reporting its age in response headers"""
+    filename, is_temporary = store.export(fmt, filters)
+    response = send_export(filename, fmt, cleanup=is_temporary)
+    response.headers.update(snapshot_headers(meta))
+    return response
 
 # Add a root route for health check
 @app.route('/')
 def home():
-    cookies = load_cookies_from_env()
-    cookie_health = check_cookie_health(cookies)
-
-    # Check if credentials are configured for auto-refresh
-    has_credentials = bool(os.environ.get('HIYA_EMAIL') and os.environ.get('HIYA_PASSWORD'))
-
-    response = {
-        'status': 'running',
-        'message': 'Hiya Scraper API is running',
-        'cookie_health': cookie_health,
-        'auto_refresh_enabled': has_credentials,
-        'endpoints': {
-            'scrape': '/scrape (POST)',
-            'scrape_stream': '/scrape-stream (POST)'
-        }
-    }
-
-    # Add helpful messages based on status
-    if cookie_health['status'] == 'missing':
-        response['action_required'] = 'Run capture_cookies.py and set HIYA_COOKIES environment variable'
-    elif cookie_health['status'] == 'expired':
-        response['action_required'] = 'Run capture_cookies.py to refresh all cookies'
-    elif cookie_health['status'] == 'auto_refresh':
-        if has_credentials:
-            response['info'] = 'Session will auto-refresh on next scrape (credentials configured)'
-        else:
-            response['action_required'] = 'Set HIYA_EMAIL and HIYA_PASSWORD for auto-refresh, or run capture_cookies.py'
-    elif cookie_health['status'] == 'warning':
-        response['warning'] = f"Device trust expires in {cookie_health['device_expires_in_days']} days. Run capture_cookies.py before expiration."
+    return jsonify(home_payload(scheduler))
+
+@app.route('/ready')
+def ready():
+    """Readiness check - 200 once the shared browser is warm (liveness stays on /)"""
+    status = ready_payload(PREWARM_ENABLED)
+    return jsonify(status), 200 if status['ready'] else 503
 
-    return jsonify(response)
+@app.route('/metrics')
+def metrics():
+    """Runtime metrics - shared portal rate limiter state and wait times"""
+    return jsonify(metrics_payload())
 
 @app.route('/scrape', methods=['POST'])
 def scrape_hiya():
@@ -131,54 +109,130 @@ def scrape_hiya():
         cookies = load_cookies_from_env()
 
         if not cookies:
-            return jsonify({
-                'error': 'No cookies configured. Please run capture_cookies.py and add HIYA_COOKIES to Railway environment variables.'
-            }), 503
-
-        # Load credentials for auto-refresh
-        email = os.environ.get('HIYA_EMAIL')
-        password = os.environ.get('HIYA_PASSWORD')
+            return jsonify({'error': NO_ENV_COOKIES_ERROR}), 503
 
         data = request.json
-        pages = data.get('pages', 20)
+
+        try:
+            fmt, filters = scrape_options(data)
+        except ValueError as e:
+            return jsonify({'error': str(e)}), 400
 
         # Create scraper instance with cookies AND credentials for auto-refresh
-        scraper = HiyaScraper(email=email, password=password, cookies=cookies)
-        scraper.total_pages = pages
-        
-        # Run async scraper
-        loop = asyncio.new_event_loop()
-        asyncio.set_event_loop(loop)
-        result = loop.run_until_complete(scraper.scrape())
-        loop.close()
-        
-        # Save to temporary CSV
-        with tempfile.NamedTemporaryFile(mode='w', delete=False, suffix='.csv', newline='', encoding='utf-8') as tmp:
-            filename = tmp.name
-        
-        scraper.save_to_csv(filename)
-        
-        # Send file and clean up
-        response = send_file(
-            filename,
-            mimetype='text/csv',
-            as_attachment=True,
-            download_name=f'hiya_phones_{datetime.now().strftime("%Y%m%d_%H%M%S")}.csv'
-        )
-        
-        # Clean up temp file after sending
-        @response.call_on_close
-        def cleanup():
-            try:
-                os.unlink(filename)
-            except:
-                pass
+        scraper = env_scraper(cookies)
+
+        # Serve the precomputed snapshot when it is fresh enough for the client
+        store, meta = fresh_snapshot(data, scraper.account)
+        if meta:
+            return send_snapshot(store, meta, fmt, filters)
+
+        try:
+            configure_scraper(scraper, data)
+        except ValueError as e:
+            return jsonify({'error': str(e)}), 400
         
-        return response
+        # Stream rows into the export file while scraping
+        return run_export(scraper, fmt)
         
+    except SessionRejected as e:
+        return jsonify(e.payload()), 401
+    except Exception as e:
+        return jsonify({'error': str(e)}), 500
+
+@app.route('/scrape-diff', methods=['POST'])
+def scrape_diff():
+    """Scrape with the configured cookies and return only what changed since the previous run"""
+    try:
+        cookies = load_cookies_from_env()
+
+        if not cookies:
+            return jsonify({'error': NO_ENV_COOKIES_ERROR}), 503
+
+        data = request.json or {}
+        data['diff'] = True
+
+        # No export file - rows are only fingerprinted against the previous index
+        scraper = env_scraper(cookies)
+        try:
+            configure_scraper(scraper, data)
+        except ValueError as e:
+            return jsonify({'error': str(e)}), 400
+        scraper.keep_data = False
+
+        preflight(scraper)
+        runtime.run(runtime.scrape(scraper))
+
+        return jsonify(scraper.change_report)
+
+    except SessionRejected as e:
+        return jsonify(e.payload()), 401
     except Exception as e:
         return jsonify({'error': str(e)}), 500
 
+@app.route('/diff/latest')
+def latest_diff():
+    """Return the most recent change report for the caller's account"""
+    try:
+        account = reader_account()
+    except Unauthorized as e:
+        return jsonify({'error': str(e)}), 401
+
+    report = load_latest_diff(account)
+    if report is None:
+        return jsonify({'error': 'No change report yet. Run a scrape with diff enabled first.'}), 404
+    return jsonify(report)
+
+@app.route('/snapshot')
+def download_snapshot():
+    """Download the newest scheduled snapshot for the caller's account"""
+    try:
+        account = reader_account()
+    except Unauthorized as e:
+        return jsonify({'error': str(e)}), 401
+
+    try:
+        fmt = normalize_format(request.args.get('format'))
+        max_age = float(request.args['max_age']) if request.args.get('max_age') else None
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
+
+    # With ?max_age= only a snapshot at most that many seconds old is served
+    store = SnapshotStore(account)
+    meta = store.latest() if max_age is None else store.fresh(max_age)
+    if meta is None:
+        return jsonify({'error': 'No recent enough snapshot available for this account'}), 404
+    return send_snapshot(store, meta, fmt)
+
+@app.route('/phones')
+def query_phones():
+    """Read-only query over the indexed copy of the latest results (no browser involved)"""
+    args = request.args
+    try:
+        account = reader_account()
+    except Unauthorized as e:
+        return jsonify({'error': str(e)}), 401
+
+    meta = get_store().meta(account)
+    if meta is None:
+        return jsonify({'error': 'No indexed results for this account yet. Run a scrape first.'}), 404
+
+    # ETag covers the data version and the exact query, so unchanged polls are 304s
+    etag = phones_etag(meta, request.query_string)
+    if request.if_none_match.contains(etag):
+        not_modified = Response(status=304)
+        not_modified.set_etag(etag)
+        return not_modified
+
+    try:
+        payload = phones_payload(args, account, meta)
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
+
+    response = jsonify(payload)
+    response.set_etag(etag)
+    response.headers['Cache-Control'] = 'no-cache'
+    return response
+
 @app.route('/auth-and-capture', methods=['POST'])
 def auth_and_capture():
     """Authenticate user and capture cookies with device trust"""
@@ -194,247 +248,216 @@ def auth_and_capture():
         # Create scraper with manual login mode
         scraper = HiyaScraper(email=email, password=password, manual_login=False, cookies=None)
 
-        # Run async authentication and cookie capture
-        loop = asyncio.new_event_loop()
-        asyncio.set_event_loop(loop)
-
-        # Custom authentication with 2FA support
-        cookies = loop.run_until_complete(authenticate_and_capture(scraper, twofa_code))
-        loop.close()
+        # Custom authentication with 2FA support, run on the shared browser runtime
+        cookies = runtime.run(authenticate_and_capture(scraper, twofa_code))
 
         if not cookies:
             return jsonify({'error': 'Authentication failed. Please check your credentials.'}), 401
 
-        # Encode cookies to base64
-        cookies_json = json.dumps(cookies, indent=2)
-        cookies_base64 = base64.b64encode(cookies_json.encode()).decode()
-
-        return jsonify({
-            'status': 'success',
-            'cookies': cookies_base64,
-            'cookie_count': len(cookies),
-            'message': 'Authentication successful! Device remembered for 30 days.'
-        })
+        return jsonify(captured_payload(cookies))
 
+    except MfaRequired as e:
+        # The login waits at the MFA prompt - the code goes to /auth-and-capture/verify
+        return jsonify(mfa_required_payload(e)), 202
+    except TooManyPendingLogins as e:
+        return jsonify({'error': str(e)}), 429
     except Exception as e:
         return jsonify({'error': str(e)}), 500
 
-async def authenticate_and_capture(scraper, twofa_code=None):
-    """Authenticate with Hiya and capture cookies with device trust"""
-    from playwright.async_api import async_playwright, TimeoutError as PlaywrightTimeout
-
-    async with async_playwright() as p:
-        # Launch browser in headless mode
-        browser = await p.chromium.launch(
-            headless=True,
-            args=[
-                '--no-sandbox',
-                '--disable-setuid-sandbox',
-                '--disable-dev-shm-usage',
-                '--disable-gpu'
-            ]
-        )
-
-        context = await browser.new_context(
-            viewport={'width': 1920, 'height': 1080},
-            user_agent='Mozilla/5.0 (Macintosh; Intel Mac OS X 10_15_7) AppleWebKit/537.36'
-        )
-
-        page = await context.new_page()
+@app.route('/auth-and-capture/verify', methods=['POST'])
+def verify_auth_code():
+    """Second step of a 2FA login - submit the code into the login waiting under pending_token"""
+    data = request.json or {}
+    token = data.get('pending_token')
+    twofa_code = data.get('twofa_code')
 
-        try:
-            print(f"🔐 Authenticating user: {scraper.email}")
-
-            # Navigate to login page
-            await page.goto(scraper.login_url, wait_until="domcontentloaded", timeout=60000)
-            await asyncio.sleep(2)
-
-            # Wait for login form
-            await page.wait_for_selector('input[type="email"], input[type="text"]', timeout=10000)
-
-            # Fill in credentials
-            print("📝 Entering credentials...")
-            email_input = page.locator('input[type="email"], input[name="username"], input[name="email"]').first
-            await email_input.fill(scraper.email)
-
-            password_input = page.locator('input[type="password"], input[name="password"]').first
-            await password_input.fill(scraper.password)
-
-            # Click login button
-            print("👆 Clicking login button...")
-            login_button = page.locator('button[type="submit"], button:has-text("Log in"), button:has-text("Continue")').first
-            await login_button.click()
-
-            # Wait for navigation
-            await asyncio.sleep(5)
-
-            # Check if 2FA is required
-            current_url = page.url
-            print(f"📍 Current URL: {current_url}")
-
-            if "mfa" in current_url.lower() or "verify" in current_url.lower():
-                print("📱 2FA required")
-
-                if not twofa_code:
-                    raise Exception("2FA code required but not provided")
-
-                # Enter 2FA code
-                print(f"🔢 Entering 2FA code...")
-                twofa_input = page.locator('input[type="text"], input[name="code"], input[placeholder*="code"]').first
-                await twofa_input.fill(twofa_code)
-
-                # Look for "Remember this device" checkbox and check it
-                try:
-                    # Strategy 1: Try to find by ID (most reliable)
-                    remember_checkbox = page.locator('#rememberBrowser')
-                    if await remember_checkbox.count() > 0:
-                        # Try clicking the label first (common pattern when label overlays checkbox)
-                        try:
-                            label = page.locator('label[for="rememberBrowser"]')
-                            if await label.count() > 0:
-                                await label.click()
-                                print("✅ Checked 'Remember this device' via label")
-                            else:
-                                # Fallback: force click the checkbox
-                                await remember_checkbox.check(force=True)
-                                print("✅ Checked 'Remember this device' via force click")
-                        except Exception as label_error:
-                            print(f"⚠️ Label click failed, trying JavaScript: {label_error}")
-                            # Fallback: Use JavaScript to check the box
-                            await page.evaluate('document.getElementById("rememberBrowser").checked = true')
-                            print("✅ Checked 'Remember this device' via JavaScript")
-                    else:
-                        # Fallback to generic checkbox selector
-                        generic_checkbox = page.locator('input[type="checkbox"]').first
-                        if await generic_checkbox.count() > 0:
-                            await generic_checkbox.check(force=True)
-                            print("✅ Checked checkbox via generic selector")
-                except Exception as e:
-                    print(f"⚠️ Could not check remember device: {e}")
-                    # Continue anyway - checkbox might not be required
-
-                # Click verify/continue button
-                verify_button = page.locator('button[type="submit"], button:has-text("Verify"), button:has-text("Continue")').first
-                await verify_button.click()
-
-                await asyncio.sleep(5)
-
-            # Check for additional "Remember device" buttons
-            try:
-                remember_buttons = [
-                    'button:has-text("Remember")',
-                    'button:has-text("Trust")',
-                    'button:has-text("Yes")',
-                ]
-
-                for selector in remember_buttons:
-                    button = page.locator(selector).first
-                    if await button.count() > 0:
-                        is_visible = await button.is_visible()
-                        if is_visible:
-                            print(f"Found and clicking: {selector}")
-                            await button.click()
-                            await asyncio.sleep(3)
-                            break
-            except Exception as e:
-                print(f"No additional remember buttons found: {e}")
-
-            # Wait for successful login
-            await page.wait_for_url("**/business.hiya.com/**", timeout=20000)
-            print("✅ Login successful!")
-
-            # Capture all cookies
-            print("🍪 Capturing cookies...")
-            all_cookies = await context.cookies()
-
-            # Filter for Hiya-related cookies
-            important_domains = ['hiya.com', 'auth-console.hiya.com', 'business.hiya.com']
-            filtered_cookies = [
-                cookie for cookie in all_cookies
-                if any(domain in cookie.get('domain', '') for domain in important_domains)
-            ]
-
-            print(f"✅ Captured {len(filtered_cookies)} cookies")
-
-            # Print cookie expiration info
-            for cookie in filtered_cookies:
-                if cookie.get('name') in ['auth0-mf', 'did', 'auth0']:
-                    expires = cookie.get('expires', -1)
-                    if expires > 0:
-                        from datetime import datetime
-                        expire_date = datetime.fromtimestamp(expires)
-                        print(f"   {cookie.get('name')}: expires {expire_date}")
-
-            await browser.close()
-            return filtered_cookies
-
-        except PlaywrightTimeout as e:
-            print(f"❌ Timeout during authentication: {e}")
-            await browser.close()
-            raise Exception("Authentication timeout. Please try again.")
-        except Exception as e:
-            print(f"❌ Authentication error: {e}")
-            await browser.close()
-            raise
+    if not token or not twofa_code:
+        return jsonify({'error': 'pending_token and twofa_code are required'}), 400
+
+    try:
+        cookies = runtime.run(verify_pending_login(token, twofa_code))
+        return jsonify(captured_payload(cookies))
+    except LookupError as e:
+        return jsonify({'error': str(e)}), 410
+    except Exception as e:
+        # Still pending after a rejected code - the client can retry with the same token
+        return jsonify({'error': str(e), 'retry': token in pending_logins}), 401
 
 @app.route('/scrape-with-cookies', methods=['POST'])
 def scrape_with_user_cookies():
-    """Scrape endpoint that accepts cookies from the request body (user-specific)"""
+    """Scrape endpoint that accepts a session handle or cookies from the request body (user-specific)"""
     try:
         data = request.json
-        pages = data.get('pages', 20)
+        session = data.get('session')
         cookies_b64 = data.get('cookies')
 
-        if not cookies_b64:
+        try:
+            fmt, filters = scrape_options(data)
+        except ValueError as e:
+            return jsonify({'error': str(e)}), 400
+
+        if not session and not cookies_b64:
             return jsonify({
                 'error': 'No cookies provided. Please authenticate first.'
             }), 401
 
-        # Decode user's cookies
-        try:
-            cookies_json = base64.b64decode(cookies_b64).decode()
-            cookies = json.loads(cookies_json)
-        except Exception as e:
-            return jsonify({
-                'error': 'Invalid cookies format. Please re-authenticate.'
-            }), 400
-
-        # Create scraper instance with user's cookies
-        scraper = HiyaScraper(cookies=cookies)
-        scraper.total_pages = pages
-
-        # Run async scraper
-        loop = asyncio.new_event_loop()
-        asyncio.set_event_loop(loop)
-        result = loop.run_until_complete(scraper.scrape())
-        loop.close()
-
-        # Save to temporary CSV
-        with tempfile.NamedTemporaryFile(mode='w', delete=False, suffix='.csv', newline='', encoding='utf-8') as tmp:
-            filename = tmp.name
-
-        scraper.save_to_csv(filename)
-
-        # Send file and clean up
-        response = send_file(
-            filename,
-            mimetype='text/csv',
-            as_attachment=True,
-            download_name=f'hiya_phones_{datetime.now().strftime("%Y%m%d_%H%M%S")}.csv'
-        )
-
-        # Clean up temp file after sending
-        @response.call_on_close
-        def cleanup():
+        if session:
+            # Cookies stored server-side by POST /sessions - no decoding, and no login check while verified
+            try:
+                scraper = session_scraper(session)
+            except LookupError as e:
+                return jsonify({'error': str(e)}), 410
+        else:
+            # Decode user's cookies
             try:
-                os.unlink(filename)
-            except:
-                pass
+                cookies = decode_cookies(cookies_b64)
+            except Exception as e:
+                return jsonify({
+                    'error': 'Invalid cookies format. Please re-authenticate.'
+                }), 400
+            scraper = HiyaScraper(cookies=cookies)
+
+        # The session's cookies must still work before its account's snapshot is served
+        preflight(scraper)
+
+        # Serve the precomputed snapshot when it is fresh enough for the client
+        store, meta = fresh_snapshot(data, scraper.account)
+        if meta:
+            return send_snapshot(store, meta, fmt, filters)
 
-        return response
+        try:
+            configure_scraper(scraper, data)
+        except ValueError as e:
+            return jsonify({'error': str(e)}), 400
+
+        # Stream rows into the export file while scraping
+        return run_export(scraper, fmt)
+
+    except SessionRejected as e:
+        return jsonify(e.payload()), 401
+    except Exception as e:
+        return jsonify({'error': str(e)}), 500
+
+@app.route('/sessions', methods=['POST'])
+def create_session():
+    """Exchange a cookie blob for an opaque session handle, verifying the cookies once"""
+    data = request.json or {}
+    if not data.get('cookies'):
+        return jsonify({'error': 'No cookies provided. Please authenticate first.'}), 401
 
+    try:
+        cookies = decode_cookies(data['cookies'])
+    except Exception:
+        return jsonify({'error': 'Invalid cookies format. Please re-authenticate.'}), 400
+
+    try:
+        valid = runtime.run(verify_cookies(cookies))
     except Exception as e:
         return jsonify({'error': str(e)}), 500
+    if not valid:
+        return jsonify({'error': 'Cookies expired or invalid - please re-authenticate'}), 401
+
+    return jsonify(store_session(cookies)), 201
+
+@app.route('/sessions/<handle>', methods=['GET'])
+def get_session(handle):
+    sessions = get_sessions()
+    session = sessions.get(handle)
+    if not session:
+        return jsonify({'error': 'Unknown or expired session. Please authenticate again.'}), 404
+    return jsonify(sessions.describe(handle, session))
+
+@app.route('/sessions/<handle>', methods=['DELETE'])
+def delete_session(handle):
+    if not get_sessions().delete(handle):
+        return jsonify({'error': 'Unknown or expired session'}), 404
+    return jsonify({'session': handle, 'status': 'deleted'})
+
+@app.route('/jobs', methods=['POST'])
+def create_job():
+    """Start a scrape in the background and return its job id"""
+    data = request.json or {}
+
+    try:
+        fmt, filters = scrape_options(data)
+        scraper = scraper_for_request(data)
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
+    except LookupError as e:
+        return jsonify({'error': str(e)}), 410
+    except Exception:
+        return jsonify({'error': 'Invalid cookies format. Please re-authenticate.'}), 400
+
+    if not scraper:
+        return jsonify({'error': 'No cookies provided or configured. Please authenticate first.'}), 401
+
+    try:
+        preflight(scraper)
+    except SessionRejected as e:
+        return jsonify(e.payload()), 401
+
+    try:
+        configure_scraper(scraper, data)
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
+    job = jobs.start(scraper, open_export(scraper, fmt), fmt, scraper.account)
+
+    response = jsonify(job.to_dict())
+    response.headers['Location'] = f'/jobs/{job.id}'
+    return response, 202
+
+@app.route('/jobs/<job_id>', methods=['GET'])
+def get_job(job_id):
+    job = jobs.get(job_id)
+    if not job:
+        return jsonify({'error': 'Job not found'}), 404
+    return jsonify(job.to_dict())
+
+@app.route('/jobs/<job_id>', methods=['DELETE'])
+def cancel_job(job_id):
+    """Cancel a running job (stops at the next page boundary), or forget a finished one"""
+    job = jobs.get(job_id)
+    if not job:
+        return jsonify({'error': 'Job not found'}), 404
+    if job.done:
+        jobs.remove(job_id)
+        return jsonify({'job_id': job_id, 'status': 'deleted'})
+    job.cancel('cancelled by client')
+    return jsonify(job.to_dict()), 202
+
+@app.route('/jobs/<job_id>/result', methods=['GET'])
+def job_result(job_id):
+    job = jobs.get(job_id)
+    if not job:
+        return jsonify({'error': 'Job not found'}), 404
+    if not job.done:
+        return jsonify({'error': 'Job is still running', **job.to_dict()}), 409
+    if not job.filename or (job.status != 'complete' and not job.scraper.record_count):
+        return jsonify({'error': job.error or 'Job has no result', **job.to_dict()}), 410
+    # Failed and cancelled jobs still hand back the rows they collected
+    response = send_export(job.filename, job.format, cleanup=False)
+    response.headers.update(scrape_headers(job.scraper))
+    return response
+
+@app.route('/jobs/<job_id>/traces', methods=['GET'])
+def job_traces(job_id):
+    """List the Playwright traces saved for a job's slow pages"""
+    job = jobs.get(job_id)
+    if not job:
+        return jsonify({'error': 'Job not found'}), 404
+    payload = traces_payload(job)
+    if payload is None:
+        return jsonify({'error': 'Tracing was not enabled for this job (set HIYA_TRACING=1)'}), 404
+    return jsonify(payload)
+
+@app.route('/jobs/<job_id>/traces/<name>', methods=['GET'])
+def job_trace_file(job_id, name):
+    """Download one trace - open it with 'playwright show-trace' or trace.playwright.dev"""
+    job = jobs.get(job_id)
+    path = job.scraper.tracer.path(name) if job and job.scraper.tracer else None
+    if not path:
+        return jsonify({'error': 'Trace not found'}), 404
+    return send_file(path, mimetype='application/zip', as_attachment=True, download_name=f'{job_id}-{name}')
 
 @app.route('/scrape-stream', methods=['POST'])
 def scrape_hiya_stream():
@@ -444,79 +467,96 @@ def scrape_hiya_stream():
         cookies = load_cookies_from_env()
 
         if not cookies:
-            return jsonify({
-                'error': 'No cookies configured. Please run capture_cookies.py and add HIYA_COOKIES to Railway environment variables.'
-            }), 503
-
-        # Load credentials for auto-refresh
-        email = os.environ.get('HIYA_EMAIL')
-        password = os.environ.get('HIYA_PASSWORD')
+            return jsonify({'error': NO_ENV_COOKIES_ERROR}), 503
 
         data = request.json
-        pages = data.get('pages', 20)
+
+        try:
+            fmt, filters = scrape_options(data)
+        except ValueError as e:
+            return jsonify({'error': str(e)}), 400
+
+        # Create scraper with cookies AND credentials for auto-refresh
+        scraper = env_scraper(cookies)
+        try:
+            configure_scraper(scraper, data)
+        except ValueError as e:
+            return jsonify({'error': str(e)}), 400
+        preflight(scraper)
 
         def generate():
             """Generator function for SSE stream"""
+            job = None
             try:
-                # Create scraper with cookies AND credentials for auto-refresh
-                scraper = HiyaScraper(email=email, password=password, cookies=cookies)
-                scraper.total_pages = pages
-                
-                # Override print to capture logs
-                class LogCapture:
-                    def write(self, message):
-                        if message.strip():
-                            # Send log as SSE event
-                            yield f"event: log\ndata: {json.dumps({'message': message.strip()})}\n\n"
-                    
-                    def flush(self):
-                        pass
-                
-                # Capture stdout
-                old_stdout = sys.stdout
-                
                 # Send starting event
-                yield f"event: status\ndata: {json.dumps({'status': 'starting', 'message': 'Initializing scraper...'})}\n\n"
-                
-                # Run scraper (logs will be captured)
-                sys.stdout = LogCapture()
-                
-                loop = asyncio.new_event_loop()
-                asyncio.set_event_loop(loop)
-                result = loop.run_until_complete(scraper.scrape())
-                loop.close()
-                
-                # Restore stdout
-                sys.stdout = old_stdout
-                
-                # Save to temporary CSV
-                with tempfile.NamedTemporaryFile(mode='w', delete=False, suffix='.csv', newline='', encoding='utf-8') as tmp:
-                    filename = tmp.name
-                
-                scraper.save_to_csv(filename)
-                
-                # Read CSV content
-                with open(filename, 'r', encoding='utf-8') as f:
-                    csv_content = f.read()
-                
-                # Clean up temp file
-                try:
-                    os.unlink(filename)
-                except:
-                    pass
-                
-                # Send completion event with CSV data
-                yield f"event: complete\ndata: {json.dumps({'status': 'complete', 'records': len(result), 'csv': csv_content})}\n\n"
-                
+                yield sse_event('status', {'status': 'starting', 'message': 'Initializing scraper...'})
+
+                # Run the scrape as a job, streaming rows into a temporary file in the requested format
+                job = jobs.start(scraper, open_export(scraper, fmt), fmt, scraper.account)
+                yield sse_event('status', {'status': 'running', 'job_id': job.id})
+
+                # Progress events double as the probe that notices a dropped connection
+                while not job.wait(STREAM_PROGRESS_SECONDS):
+                    yield sse_event('progress', progress_payload(scraper))
+
+                if job.status != 'complete' and not scraper.record_count:
+                    raise Exception(job.error)
+
+                # Stream the export in chunks rather than one event holding the whole file
+                chunks = yield from stream_export_events(job.filename, fmt)
+
+                # The final event marks the end of the chunk sequence - 'partial' when the scrape failed part-way
+                yield final_stream_event(job, fmt, chunks)
+
+            except GeneratorExit:
+                # Client went away - stop the scrape and free its browser context
+                if job:
+                    job.cancel('client disconnected')
+                raise
             except Exception as e:
-                sys.stdout = old_stdout
-                yield f"event: error\ndata: {json.dumps({'error': str(e)})}\n\n"
-        
+                yield sse_event('error', {'error': str(e)})
+            finally:
+                if job and job.done:
+                    jobs.remove(job.id)
+
         return Response(generate(), mimetype='text/event-stream')
         
+    except SessionRejected as e:
+        return jsonify(e.payload()), 401
     except Exception as e:
         return jsonify({'error': str(e)}), 500
 
+def shutdown():
+    """Process exit: cancel running scrapes and give them the grace period to finish before the browser closes"""
+    jobs.cancel_all()
+    if scheduler:
+        scheduler.stop()
+    deadline = time.time() + CANCEL_GRACE_SECONDS
+    while jobs.running() and time.time() < deadline:
+        time.sleep(0.1)
+    runtime.shutdown()
+
+
+def start_lifecycle():
+    """Worker boot: kick off the browser prewarm and scheduler, and register shutdown"""
+    global scheduler
+
+    if PREWARM_ENABLED:
+        print("🔥 Prewarming shared browser in the background...")
+        validate_cookies = load_cookies_from_env() if PREWARM_VALIDATE else None
+        runtime.prewarm(validate_cookies=validate_cookies)
+
+    # Background scrapes that keep snapshots hot (HIYA_SCHEDULE / HIYA_SCHEDULE_INTERVAL)
+    accounts = load_schedule()
+    if accounts:
+        scheduler = Scheduler(accounts)
+        scheduler.start()
+
+    # Scrapes stop before the browser closes
+    atexit.register(shutdown)
+
+start_lifecycle()
+
 if __name__ == '__main__':
     import os
     port = int(os.environ.get('PORT', 8000))
@@ -0,0 +1,627 @@
+"""
+ASGI entry point for the Hiya Scraper API
+Serves the same routes and payloads as api.py, but handlers await scrapes
+on the browser runtime's loop instead of blocking a worker thread, and
+the SSE stream is an async generator that stops the scrape on disconnect.
+Scrapes keep their own loop thread, so their file and SQLite writes never
+stall the server's loop
+
+Run with: uvicorn asgi:app --host 0.0.0.0 --port $PORT
+"""
+
+import asyncio
+import os
+import time
+from contextlib import asynccontextmanager
+
+try:
+    from starlette.applications import Starlette
+    from starlette.background import BackgroundTask
+    from starlette.concurrency import run_in_threadpool
+    from starlette.middleware import Middleware
+    from starlette.middleware.cors import CORSMiddleware
+    from starlette.responses import JSONResponse, FileResponse, Response, StreamingResponse
+    from starlette.routing import Route
+except ImportError:
+    raise ImportError("ASGI mode requires starlette and uvicorn - install them with 'pip install starlette uvicorn'")
+
+from scraper import HiyaScraper, decode_cookies, is_production_env
+from runtime import runtime, env_flag
+from changes import load_latest_diff
+from snapshots import SnapshotStore
+from store import get_store
+from scheduler import Scheduler, load_schedule
+from exporters import normalize_format, format_mimetype
+from jobs import jobs, CANCEL_GRACE_SECONDS
+from mfa import pending_logins, MfaRequired, TooManyPendingLogins
+from sessions import get_sessions, remember_outcome
+from service import (
+    EXPOSED_HEADERS, STREAM_PROGRESS_SECONDS, NO_ENV_COOKIES_ERROR,
+    load_cookies_from_env, scrape_options, configure_scraper, scrape_headers, snapshot_headers,
+    export_filename, open_export, remove_file, stream_export_events, fresh_snapshot, scraper_for_request,
+    env_scraper, session_scraper, create_session as store_session, verify_cookies, preflight, SessionRejected,
+    authorized_account, Unauthorized,
+    sse_event, progress_payload, final_stream_event, home_payload, ready_payload, metrics_payload,
+    phones_etag, phones_payload, traces_payload, captured_payload, mfa_required_payload,
+    authenticate_and_capture, verify_pending_login,
+)
+
+PREWARM_ENABLED = env_flag('HIYA_PREWARM', default=is_production_env())
+PREWARM_VALIDATE = env_flag('HIYA_PREWARM_VALIDATE')
+
+# Seconds between checks for a client that went away while a blocking scrape runs
+DISCONNECT_POLL_SECONDS = float(os.environ.get('HIYA_DISCONNECT_POLL_SECONDS', 1))
+
+scheduler = None
+
+
+class ClientDisconnected(Exception):
+    pass
+
+
+def error(message, status=500):
+    return JSONResponse({'error': message}, status_code=status)
+
+
+async def read_json(request):
+    try:
+        return await request.json()
+    except ValueError:
+        return None
+
+
+async def scrape_until_disconnect(request, scraper, coro=None):
+    """Await a scrape, cancelling it (page boundary first, then outright) if the client disconnects"""
+    task = asyncio.ensure_future(runtime.call(coro or runtime.scrape(scraper)))
+    while True:
+        done, _ = await asyncio.wait({task}, timeout=DISCONNECT_POLL_SECONDS)
+        if done:
+            return task.result()
+        if await request.is_disconnected():
+            print("🛑 Client disconnected - cancelling scrape")
+            scraper.cancel()
+            done, _ = await asyncio.wait({task}, timeout=CANCEL_GRACE_SECONDS)
+            if not done:
+                task.cancel()
+                await asyncio.gather(task, return_exceptions=True)
+            raise ClientDisconnected()
+
+
+def send_export(filename, fmt, cleanup=True, headers=None):
+    """Send an export file as a download, deleting it afterwards if it is temporary"""
+    return FileResponse(
+        filename,
+        media_type=format_mimetype(fmt),
+        filename=export_filename(fmt),
+        headers=headers,
+        background=BackgroundTask(remove_file, filename) if cleanup else None,
+    )
+
+
+async def run_export(request, scraper, fmt):
+    """Scrape straight into an export file and send it - the rows collected so far if the scrape fails part-way"""
+    # Fail fast on cookies that cannot log in, before a browser context is opened
+    await run_in_threadpool(preflight, scraper)
+    filename = open_export(scraper, fmt)
+
+    try:
+        await scrape_until_disconnect(request, scraper)
+    except ClientDisconnected:
+        remove_file(filename)
+        raise
+    except Exception as e:
+        if not scraper.record_count:
+            remove_file(filename)
+            raise
+        print(f"⚠️  Scrape failed after {scraper.pages_completed} pages - "
+              f"returning {scraper.record_count} partial records: {e}")
+    finally:
+        remember_outcome(scraper)
+
+    return send_export(filename, fmt, headers=scrape_headers(scraper))
+
+
+def reader_account(request):
+    """Verified account for a read-only route, from its session handle or the API token"""
+    return authorized_account(request.headers.get('x-hiya-session') or request.query_params.get('session'),
+                              request.headers.get('authorization'))
+
+
+async def send_snapshot(store, meta, fmt, filters=None):
+    """Serve the newest snapshot, reporting its age in response headers"""
+    filename, is_temporary = await run_in_threadpool(store.export, fmt, filters)
+    return send_export(filename, fmt, cleanup=is_temporary, headers=snapshot_headers(meta))
+
+
+async def home(request):
+    # Reads cookie files and the probe cache - keep it off the event loop
+    return JSONResponse(await run_in_threadpool(home_payload, scheduler))
+
+
+async def ready(request):
+    """Readiness check - 200 once the shared browser is warm (liveness stays on /)"""
+    status = ready_payload(PREWARM_ENABLED)
+    return JSONResponse(status, status_code=200 if status['ready'] else 503)
+
+
+async def metrics(request):
+    return JSONResponse(metrics_payload())
+
+
+async def scrape_hiya(request):
+    """Scrape endpoint - uses cookie-based authentication with auto-refresh"""
+    try:
+        cookies = load_cookies_from_env()
+        if not cookies:
+            return error(NO_ENV_COOKIES_ERROR, 503)
+
+        data = await read_json(request) or {}
+
+        try:
+            fmt, filters = scrape_options(data)
+        except ValueError as e:
+            return error(str(e), 400)
+
+        scraper = env_scraper(cookies)
+
+        # Serve the precomputed snapshot when it is fresh enough for the client
+        store, meta = fresh_snapshot(data, scraper.account)
+        if meta:
+            return await send_snapshot(store, meta, fmt, filters)
+
+        try:
+            configure_scraper(scraper, data)
+        except ValueError as e:
+            return error(str(e), 400)
+
+        return await run_export(request, scraper, fmt)
+
+    except ClientDisconnected:
+        return Response(status_code=499)
+    except SessionRejected as e:
+        return JSONResponse(e.payload(), status_code=401)
+    except Exception as e:
+        return error(str(e))
+
+
+async def scrape_diff(request):
+    """Scrape with the configured cookies and return only what changed since the previous run"""
+    try:
+        cookies = load_cookies_from_env()
+        if not cookies:
+            return error(NO_ENV_COOKIES_ERROR, 503)
+
+        data = await read_json(request) or {}
+        data['diff'] = True
+
+        # No export file - rows are only fingerprinted against the previous index
+        scraper = env_scraper(cookies)
+        try:
+            configure_scraper(scraper, data)
+        except ValueError as e:
+            return error(str(e), 400)
+        scraper.keep_data = False
+
+        await run_in_threadpool(preflight, scraper)
+        await scrape_until_disconnect(request, scraper)
+
+        return JSONResponse(scraper.change_report)
+
+    except ClientDisconnected:
+        return Response(status_code=499)
+    except SessionRejected as e:
+        return JSONResponse(e.payload(), status_code=401)
+    except Exception as e:
+        return error(str(e))
+
+
+async def latest_diff(request):
+    """Return the most recent change report for the caller's account"""
+    try:
+        account = reader_account(request)
+    except Unauthorized as e:
+        return error(str(e), 401)
+
+    report = await run_in_threadpool(load_latest_diff, account)
+    if report is None:
+        return error('No change report yet. Run a scrape with diff enabled first.', 404)
+    return JSONResponse(report)
+
+
+async def download_snapshot(request):
+    """Download the newest scheduled snapshot for the caller's account"""
+    try:
+        account = reader_account(request)
+    except Unauthorized as e:
+        return error(str(e), 401)
+
+    args = request.query_params
+    try:
+        fmt = normalize_format(args.get('format'))
+        max_age = float(args['max_age']) if args.get('max_age') else None
+    except ValueError as e:
+        return error(str(e), 400)
+
+    # With ?max_age= only a snapshot at most that many seconds old is served
+    store = SnapshotStore(account)
+    meta = await run_in_threadpool(store.latest) if max_age is None else await run_in_threadpool(store.fresh, max_age)
+    if meta is None:
+        return error('No recent enough snapshot available for this account', 404)
+    return await send_snapshot(store, meta, fmt)
+
+
+def etag_matches(header, etag):
+    """Whether an If-None-Match header lists the (strong) etag"""
+    if not header:
+        return False
+    tags = [tag.strip() for tag in header.split(',')]
+    return '*' in tags or f'"{etag}"' in tags or f'W/"{etag}"' in tags
+
+
+async def query_phones(request):
+    """Read-only query over the indexed copy of the latest results (no browser involved)"""
+    args = request.query_params
+    try:
+        account = reader_account(request)
+    except Unauthorized as e:
+        return error(str(e), 401)
+
+    meta = await run_in_threadpool(get_store().meta, account)
+    if meta is None:
+        return error('No indexed results for this account yet. Run a scrape first.', 404)
+
+    # ETag covers the data version and the exact query, so unchanged polls are 304s
+    etag = phones_etag(meta, request.url.query.encode())
+    if etag_matches(request.headers.get('if-none-match'), etag):
+        return Response(status_code=304, headers={'ETag': f'"{etag}"'})
+
+    try:
+        payload = await run_in_threadpool(phones_payload, args, account, meta)
+    except ValueError as e:
+        return error(str(e), 400)
+
+    return JSONResponse(payload, headers={'ETag': f'"{etag}"', 'Cache-Control': 'no-cache'})
+
+
+async def auth_and_capture(request):
+    """Authenticate user and capture cookies with device trust"""
+    try:
+        data = await read_json(request) or {}
+        email = data.get('email')
+        password = data.get('password')
+
+        if not email or not password:
+            return error('Email and password are required', 400)
+
+        scraper = HiyaScraper(email=email, password=password, manual_login=False, cookies=None)
+        cookies = await runtime.call(authenticate_and_capture(scraper, data.get('twofa_code')))
+
+        if not cookies:
+            return error('Authentication failed. Please check your credentials.', 401)
+
+        return JSONResponse(captured_payload(cookies))
+
+    except MfaRequired as e:
+        # The login waits at the MFA prompt - the code goes to /auth-and-capture/verify
+        return JSONResponse(mfa_required_payload(e), status_code=202)
+    except TooManyPendingLogins as e:
+        return error(str(e), 429)
+    except Exception as e:
+        return error(str(e))
+
+
+async def verify_auth_code(request):
+    """Second step of a 2FA login - submit the code into the login waiting under pending_token"""
+    data = await read_json(request) or {}
+    token = data.get('pending_token')
+    twofa_code = data.get('twofa_code')
+
+    if not token or not twofa_code:
+        return error('pending_token and twofa_code are required', 400)
+
+    try:
+        cookies = await runtime.call(verify_pending_login(token, twofa_code))
+        return JSONResponse(captured_payload(cookies))
+    except LookupError as e:
+        return error(str(e), 410)
+    except Exception as e:
+        # Still pending after a rejected code - the client can retry with the same token
+        return JSONResponse({'error': str(e), 'retry': token in pending_logins}, status_code=401)
+
+
+async def scrape_with_user_cookies(request):
+    """Scrape endpoint that accepts a session handle or cookies from the request body (user-specific)"""
+    try:
+        data = await read_json(request) or {}
+        session = data.get('session')
+        cookies_b64 = data.get('cookies')
+
+        try:
+            fmt, filters = scrape_options(data)
+        except ValueError as e:
+            return error(str(e), 400)
+
+        if not session and not cookies_b64:
+            return error('No cookies provided. Please authenticate first.', 401)
+
+        if session:
+            # Cookies stored server-side by POST /sessions - no decoding, and no login check while verified
+            try:
+                scraper = session_scraper(session)
+            except LookupError as e:
+                return error(str(e), 410)
+        else:
+            try:
+                cookies = decode_cookies(cookies_b64)
+            except Exception:
+                return error('Invalid cookies format. Please re-authenticate.', 400)
+            scraper = HiyaScraper(cookies=cookies)
+
+        # The session's cookies must still work before its account's snapshot is served
+        await run_in_threadpool(preflight, scraper)
+
+        # Serve the precomputed snapshot when it is fresh enough for the client
+        store, meta = fresh_snapshot(data, scraper.account)
+        if meta:
+            return await send_snapshot(store, meta, fmt, filters)
+
+        try:
+            configure_scraper(scraper, data)
+        except ValueError as e:
+            return error(str(e), 400)
+
+        return await run_export(request, scraper, fmt)
+
+    except ClientDisconnected:
+        return Response(status_code=499)
+    except SessionRejected as e:
+        return JSONResponse(e.payload(), status_code=401)
+    except Exception as e:
+        return error(str(e))
+
+
+async def create_session(request):
+    """Exchange a cookie blob for an opaque session handle, verifying the cookies once"""
+    data = await read_json(request) or {}
+    if not data.get('cookies'):
+        return error('No cookies provided. Please authenticate first.', 401)
+
+    try:
+        cookies = decode_cookies(data['cookies'])
+    except Exception:
+        return error('Invalid cookies format. Please re-authenticate.', 400)
+
+    try:
+        valid = await runtime.call(verify_cookies(cookies))
+    except Exception as e:
+        return error(str(e))
+    if not valid:
+        return error('Cookies expired or invalid - please re-authenticate', 401)
+
+    # Asks the portal whose cookies these are - a blocking HTTP request
+    return JSONResponse(await run_in_threadpool(store_session, cookies), status_code=201)
+
+
+async def session_detail(request):
+    """GET describes a session handle (never its cookies); DELETE forgets it"""
+    handle = request.path_params['handle']
+    sessions = get_sessions()
+    if request.method == 'DELETE':
+        if not sessions.delete(handle):
+            return error('Unknown or expired session', 404)
+        return JSONResponse({'session': handle, 'status': 'deleted'})
+    session = sessions.get(handle)
+    if not session:
+        return error('Unknown or expired session. Please authenticate again.', 404)
+    return JSONResponse(sessions.describe(handle, session))
+
+
+async def create_job(request):
+    """Start a scrape in the background and return its job id"""
+    data = await read_json(request) or {}
+
+    try:
+        fmt, filters = scrape_options(data)
+        scraper = scraper_for_request(data)
+    except ValueError as e:
+        return error(str(e), 400)
+    except LookupError as e:
+        return error(str(e), 410)
+    except Exception:
+        return error('Invalid cookies format. Please re-authenticate.', 400)
+
+    if not scraper:
+        return error('No cookies provided or configured. Please authenticate first.', 401)
+
+    try:
+        await run_in_threadpool(preflight, scraper)
+    except SessionRejected as e:
+        return JSONResponse(e.payload(), status_code=401)
+
+    try:
+        configure_scraper(scraper, data)
+    except ValueError as e:
+        return error(str(e), 400)
+    job = jobs.start(scraper, open_export(scraper, fmt), fmt, scraper.account)
+
+    return JSONResponse(job.to_dict(), status_code=202, headers={'Location': f'/jobs/{job.id}'})
+
+
+async def job_detail(request):
+    """GET reports a job; DELETE cancels a running job or forgets a finished one"""
+    job_id = request.path_params['job_id']
+    job = jobs.get(job_id)
+    if not job:
+        return error('Job not found', 404)
+    if request.method == 'GET':
+        return JSONResponse(job.to_dict())
+    if job.done:
+        jobs.remove(job_id)
+        return JSONResponse({'job_id': job_id, 'status': 'deleted'})
+    job.cancel('cancelled by client')
+    return JSONResponse(job.to_dict(), status_code=202)
+
+
+async def job_result(request):
+    job = jobs.get(request.path_params['job_id'])
+    if not job:
+        return error('Job not found', 404)
+    if not job.done:
+        return JSONResponse({'error': 'Job is still running', **job.to_dict()}, status_code=409)
+    if not job.filename or (job.status != 'complete' and not job.scraper.record_count):
+        return JSONResponse({'error': job.error or 'Job has no result', **job.to_dict()}, status_code=410)
+    # Failed and cancelled jobs still hand back the rows they collected
+    return send_export(job.filename, job.format, cleanup=False, headers=scrape_headers(job.scraper))
+
+
+async def job_traces(request):
+    """List the Playwright traces saved for a job's slow pages"""
+    job = jobs.get(request.path_params['job_id'])
+    if not job:
+        return error('Job not found', 404)
+    payload = traces_payload(job)
+    if payload is None:
+        return error('Tracing was not enabled for this job (set HIYA_TRACING=1)', 404)
+    return JSONResponse(payload)
+
+
+async def job_trace_file(request):
+    """Download one trace - open it with 'playwright show-trace' or trace.playwright.dev"""
+    job_id, name = request.path_params['job_id'], request.path_params['name']
+    job = jobs.get(job_id)
+    path = job.scraper.tracer.path(name) if job and job.scraper.tracer else None
+    if not path:
+        return error('Trace not found', 404)
+    return FileResponse(path, media_type='application/zip', filename=f'{job_id}-{name}')
+
+
+async def scrape_hiya_stream(request):
+    """Streaming endpoint with real-time progress updates via Server-Sent Events"""
+    try:
+        cookies = load_cookies_from_env()
+        if not cookies:
+            return error(NO_ENV_COOKIES_ERROR, 503)
+
+        data = await read_json(request) or {}
+
+        try:
+            fmt, filters = scrape_options(data)
+        except ValueError as e:
+            return error(str(e), 400)
+
+        scraper = env_scraper(cookies)
+        try:
+            configure_scraper(scraper, data)
+        except ValueError as e:
+            return error(str(e), 400)
+        await run_in_threadpool(preflight, scraper)
+
+    except SessionRejected as e:
+        return JSONResponse(e.payload(), status_code=401)
+    except Exception as e:
+        return error(str(e))
+
+    async def generate():
+        """SSE stream - each yield waits until the client has taken the previous event"""
+        job = None
+        try:
+            yield sse_event('status', {'status': 'starting', 'message': 'Initializing scraper...'})
+
+            job = jobs.start(scraper, open_export(scraper, fmt), fmt, scraper.account)
+            yield sse_event('status', {'status': 'running', 'job_id': job.id})
+
+            finished = asyncio.wrap_future(job.future)
+            while True:
+                done, _ = await asyncio.wait({finished}, timeout=STREAM_PROGRESS_SECONDS)
+                if done:
+                    break
+                if await request.is_disconnected():
+                    raise ClientDisconnected()
+                yield sse_event('progress', progress_payload(scraper))
+
+            if job.status != 'complete' and not scraper.record_count:
+                raise Exception(job.error)
+
+            chunks = 0
+            for event in stream_export_events(job.filename, fmt):
+                yield event
+                chunks += 1
+
+            yield final_stream_event(job, fmt, chunks)
+
+        except (ClientDisconnected, asyncio.CancelledError):
+            # Client went away - stop the scrape and free its browser context
+            if job:
+                job.cancel('client disconnected')
+            raise
+        except Exception as e:
+            yield sse_event('error', {'error': str(e)})
+        finally:
+            if job and job.done:
+                jobs.remove(job.id)
+
+    return StreamingResponse(generate(), media_type='text/event-stream',
+                             headers={'Cache-Control': 'no-cache', 'X-Accel-Buffering': 'no'})
+
+
+@asynccontextmanager
+async def lifespan(app):
+    """Server boot: prewarm the browser runtime and start the scheduler"""
+    global scheduler
+
+    if PREWARM_ENABLED:
+        print("🔥 Prewarming shared browser in the background...")
+        validate_cookies = load_cookies_from_env() if PREWARM_VALIDATE else None
+        runtime.prewarm(validate_cookies=validate_cookies)
+
+    accounts = load_schedule()
+    if accounts:
+        scheduler = Scheduler(accounts)
+        scheduler.start()
+
+    try:
+        yield
+    finally:
+        # Scrapes stop before the browser closes
+        jobs.cancel_all()
+        if scheduler:
+            await run_in_threadpool(scheduler.stop)
+        deadline = time.time() + CANCEL_GRACE_SECONDS
+        while jobs.running() and time.time() < deadline:
+            await asyncio.sleep(0.1)
+        await runtime.call(pending_logins.close_all())
+        await run_in_threadpool(runtime.shutdown)
+
+
+routes = [
+    Route('/', home),
+    Route('/ready', ready),
+    Route('/metrics', metrics),
+    Route('/scrape', scrape_hiya, methods=['POST']),
+    Route('/scrape-diff', scrape_diff, methods=['POST']),
+    Route('/diff/latest', latest_diff),
+    Route('/snapshot', download_snapshot),
+    Route('/phones', query_phones),
+    Route('/auth-and-capture', auth_and_capture, methods=['POST']),
+    Route('/auth-and-capture/verify', verify_auth_code, methods=['POST']),
+    Route('/scrape-with-cookies', scrape_with_user_cookies, methods=['POST']),
+    Route('/sessions', create_session, methods=['POST']),
+    Route('/sessions/{handle}', session_detail, methods=['GET', 'DELETE']),
+    Route('/jobs', create_job, methods=['POST']),
+    Route('/jobs/{job_id}', job_detail, methods=['GET', 'DELETE']),
+    Route('/jobs/{job_id}/result', job_result),
+    Route('/jobs/{job_id}/traces', job_traces),
+    Route('/jobs/{job_id}/traces/{name}', job_trace_file),
+    Route('/scrape-stream', scrape_hiya_stream, methods=['POST']),
+]
+
+# Enable CORS for GitHub Pages, letting the page read our status headers
+middleware = [Middleware(CORSMiddleware, allow_origins=['*'], allow_methods=['*'], allow_headers=['*'],
+                         expose_headers=EXPOSED_HEADERS)]
+
+app = Starlette(routes=routes, middleware=middleware, lifespan=lifespan)
+
+if __name__ == '__main__':
+    import uvicorn
+
+    uvicorn.run(app, host='0.0.0.0', port=int(os.environ.get('PORT', 8000)))
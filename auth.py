@@ -0,0 +1,186 @@
+"""
+Event-driven Hiya login flow
+Waits on concrete portal signals (URL changes, the MFA page, the landing
+table, auth responses, error messages) instead of fixed sleeps, racing
+every candidate outcome and acting on whichever happens first
+"""
+
+import asyncio
+import time
+from urllib.parse import urlparse
+
+from latency import latency
+from ratelimit import throttle
+
+LOGIN_FORM_SELECTOR = 'input[type="email"], input[type="text"]'
+EMAIL_SELECTOR = 'input[type="email"], input[name="username"], input[name="email"]'
+PASSWORD_SELECTOR = 'input[type="password"], input[name="password"]'
+SUBMIT_SELECTOR = 'button[type="submit"], button:has-text("Log in"), button:has-text("Continue")'
+MFA_CODE_SELECTOR = 'input[name="code"], input[autocomplete="one-time-code"], input[placeholder*="code" i]'
+VERIFY_SELECTOR = 'button[type="submit"], button:has-text("Verify"), button:has-text("Continue")'
+TRUST_DEVICE_SELECTOR = 'button:has-text("Remember"), button:has-text("Trust"), button:has-text("Yes")'
+ERROR_SELECTOR = ('#error-element-password, #error-element-username, #error-element-code, '
+                  '.ulp-input-error-message, .ulp-error-info')
+TABLE_SELECTOR = 'tbody.MuiTableBody-root'
+
+# Interstitial "trust this device" prompts clicked through before giving up
+MAX_TRUST_PROMPTS = 3
+
+
+def is_portal_url(url):
+    return urlparse(url).hostname == 'business.hiya.com' and 'login' not in url
+
+
+def is_mfa_url(url):
+    path = urlparse(url).path.lower()
+    return 'mfa' in path or 'verify' in path
+
+
+def is_login_url(url):
+    host = urlparse(url).hostname or ''
+    return host.startswith('auth') or 'login' in urlparse(url).path
+
+
+async def rejected_response(page):
+    """Resolve with the first auth POST the portal answers with a client error"""
+    while True:
+        response = await page.wait_for_event(
+            'response',
+            predicate=lambda r: r.request.method == 'POST' and is_login_url(r.url),
+            timeout=0
+        )
+        if 400 <= response.status < 500:
+            return response
+
+
+async def race(outcomes, timeout):
+    """Run (name, awaitable) waiters together and return the name of the first to succeed, or None on timeout"""
+    tasks = {asyncio.ensure_future(awaitable): name for name, awaitable in outcomes}
+    order = list(tasks)
+    pending = set(tasks)
+    deadline = time.monotonic() + timeout / 1000
+    try:
+        while pending:
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                return None
+            done, pending = await asyncio.wait(pending, timeout=remaining, return_when=asyncio.FIRST_COMPLETED)
+            # Waiters that fail (e.g. on navigation) just drop out of the race
+            winners = [task for task in order if task in done and not task.cancelled() and task.exception() is None]
+            if winners:
+                return tasks[winners[0]]
+        return None
+    finally:
+        for task in pending:
+            task.cancel()
+        await asyncio.gather(*pending, return_exceptions=True)
+
+
+def login_outcomes(page, allow_mfa=True):
+    """Everything that can happen after submitting credentials (or an MFA code)"""
+    outcomes = [
+        ('portal', page.wait_for_url(is_portal_url, wait_until='commit', timeout=0)),
+        ('error', page.wait_for_selector(ERROR_SELECTOR, state='visible', timeout=0)),
+        ('rejected', rejected_response(page)),
+        ('trust', page.wait_for_selector(TRUST_DEVICE_SELECTOR, state='visible', timeout=0)),
+    ]
+    if allow_mfa:
+        outcomes.append(('mfa', page.wait_for_url(is_mfa_url, wait_until='commit', timeout=0)))
+        outcomes.append(('mfa', page.wait_for_selector(MFA_CODE_SELECTOR, state='visible', timeout=0)))
+    return outcomes
+
+
+async def error_message(page):
+    try:
+        locator = page.locator(ERROR_SELECTOR).first
+        if await locator.count() > 0:
+            return (await locator.inner_text()).strip()
+    except Exception:
+        pass
+    return "credentials were rejected"
+
+
+async def submit_credentials(page, login_url, email, password):
+    """Open the login form, fill it in and submit it"""
+    await throttle(login_url)
+    await latency.wait('goto', lambda timeout: page.goto(login_url, wait_until="domcontentloaded", timeout=timeout))
+    await latency.wait('login_form', lambda timeout: page.wait_for_selector(LOGIN_FORM_SELECTOR, timeout=timeout))
+
+    print(f"🔑 Entering credentials for: {email}")
+    await page.locator(EMAIL_SELECTOR).first.fill(email)
+    await page.locator(PASSWORD_SELECTOR).first.fill(password)
+
+    print("👆 Clicking login button...")
+    await throttle(login_url)
+    await page.locator(SUBMIT_SELECTOR).first.click()
+
+
+async def wait_for_login(page, timeout=None, allow_mfa=True):
+    """Follow the portal after a submit until it lands on 'portal' or 'mfa'"""
+    started = time.monotonic()
+    deadline = started + (timeout or latency.timeout('login')) / 1000
+    trust_prompts = 0
+    while True:
+        remaining = (deadline - time.monotonic()) * 1000
+        outcome = await race(login_outcomes(page, allow_mfa), remaining) if remaining > 0 else None
+        print(f"📍 Login step: {outcome or 'timeout'} ({page.url})")
+
+        if outcome == 'trust' and trust_prompts < MAX_TRUST_PROMPTS:
+            trust_prompts += 1
+            await throttle(page.url)
+            await page.locator(TRUST_DEVICE_SELECTOR).first.click()
+            print("✓ Clicked 'trust this device' prompt")
+            continue
+        if outcome in ('error', 'rejected'):
+            raise Exception(f"Login failed - {await error_message(page)}")
+        if outcome in ('portal', 'mfa'):
+            latency.observe('login', time.monotonic() - started)
+            return outcome
+        raise Exception(f"Login failed - unexpected URL: {page.url}")
+
+
+async def check_remember_device(page):
+    """Tick the MFA page's 'Remember this device' box so later logins skip 2FA"""
+    try:
+        remember_checkbox = page.locator('#rememberBrowser')
+        if await remember_checkbox.count() > 0:
+            # The label overlays the checkbox, so click it rather than the input
+            label = page.locator('label[for="rememberBrowser"]')
+            try:
+                if await label.count() > 0:
+                    await label.click()
+                else:
+                    await remember_checkbox.check(force=True)
+            except Exception:
+                await page.evaluate('document.getElementById("rememberBrowser").checked = true')
+            print("✅ Checked 'Remember this device'")
+        else:
+            generic_checkbox = page.locator('input[type="checkbox"]').first
+            if await generic_checkbox.count() > 0:
+                await generic_checkbox.check(force=True)
+                print("✅ Checked checkbox via generic selector")
+    except Exception as e:
+        # Not required to log in - the device just won't be remembered
+        print(f"⚠️ Could not check remember device: {e}")
+
+
+async def submit_mfa_code(page, login_url, code, timeout=None):
+    """Enter a 2FA code, remember the device and wait until the portal accepts it"""
+    print("🔢 Entering 2FA code...")
+    await page.locator(MFA_CODE_SELECTOR + ', input[type="text"]').first.fill(code)
+    await check_remember_device(page)
+    await throttle(login_url)
+    await page.locator(VERIFY_SELECTOR).first.click()
+    return await wait_for_login(page, timeout=timeout, allow_mfa=False)
+
+
+async def wait_for_landing(page, timeout=None):
+    """After opening the phones page with cookies: 'table' once it renders, 'login' if redirected to auth"""
+    started = time.monotonic()
+    landing = await race([
+        ('table', page.wait_for_selector(TABLE_SELECTOR, timeout=0)),
+        ('login', page.wait_for_url(is_login_url, wait_until='commit', timeout=0)),
+    ], timeout or latency.timeout('table'))
+    if landing == 'table':
+        latency.observe('table', time.monotonic() - started)
+    return landing
@@ -0,0 +1,156 @@
+"""
+Row-level change detection between scrape runs
+Fingerprints each row and diffs it against the previous run's index,
+producing a compact report of added, removed and changed numbers
+"""
+
+import json
+import os
+import re
+import time
+from datetime import datetime
+
+from records import FIELDS
+from settings import state_path
+
+# spam_labeling values that mean "not flagged" - anything else counts as flagged
+CLEAN_LABELS = frozenset(['', '-', 'no', 'none', 'n/a', 'clean', 'not flagged', 'not labeled', 'unlabeled'])
+
+
+def is_flagged(spam_labeling):
+    return (spam_labeling or '').strip().lower() not in CLEAN_LABELS
+
+
+def account_key(account):
+    """Make an account name safe for use as a file name"""
+    return re.sub(r'[^A-Za-z0-9_.@-]+', '_', account or 'default')
+
+
+class FingerprintIndex:
+    """phone_number -> (fingerprint, list fields) from the previous run of one account"""
+
+    def __init__(self, account='default'):
+        self.account = account_key(account)
+        self.filename = state_path('fingerprints', f'{self.account}.json')
+        self.entries = {}
+        self.created_at = None
+        if os.path.exists(self.filename):
+            try:
+                with open(self.filename, 'r', encoding='utf-8') as f:
+                    data = json.load(f)
+                self.entries = data.get('entries', {})
+                self.created_at = data.get('created_at')
+            except Exception as e:
+                print(f"⚠️  Could not load fingerprint index {self.filename}: {e}")
+
+    def save(self, entries):
+        tmp = self.filename + '.tmp'
+        with open(tmp, 'w', encoding='utf-8') as f:
+            json.dump({'created_at': time.time(), 'entries': entries}, f)
+        os.replace(tmp, self.filename)
+        self.entries = entries
+
+
+class ChangeTracker:
+    """Compares rows against the previous run page by page while the scrape is running"""
+
+    def __init__(self, account='default'):
+        self.index = FingerprintIndex(account)
+        self.account = self.index.account
+        self.seen = {}
+        self.added = []
+        self.changed = []
+        self.unchanged = 0
+
+    def observe(self, records):
+        """Fingerprint a batch of records and record any differences"""
+        previous = self.index.entries
+        for record in records:
+            phone = record.phone_number
+            fingerprint = record.fingerprint()
+            fields = record.list_fields()
+            self.seen[phone] = [fingerprint, list(fields)]
+
+            old = previous.get(phone)
+            if old is None:
+                self.added.append(record.to_dict())
+            elif old[0] == fingerprint:
+                self.unchanged += 1
+            else:
+                self.changed.append(self._delta(phone, old[1], fields))
+
+    def _delta(self, phone, old_fields, new_fields):
+        deltas = {
+            name: {'old': old, 'new': new}
+            for name, old, new in zip(FIELDS, old_fields, new_fields)
+            if old != new
+        }
+        change = {'phone_number': phone, 'fields': deltas}
+
+        labeling = deltas.get('spam_labeling')
+        if labeling and is_flagged(labeling['new']) and not is_flagged(labeling['old']):
+            change['newly_flagged'] = True
+
+        status = deltas.get('registration_status')
+        if status:
+            change['status_transition'] = f"{status['old'] or '(none)'} -> {status['new'] or '(none)'}"
+        return change
+
+    def finish(self, complete=True):
+        """Build the diff report and save the new index"""
+        # Removed numbers are only reported when the scrape covered the whole
+        # table - otherwise unseen rows are kept in the index unchanged
+        previous = self.index.entries
+        removed = []
+        if complete:
+            removed = [
+                dict(zip(FIELDS, entry[1]))
+                for phone, entry in previous.items()
+                if phone not in self.seen
+            ]
+            entries = self.seen
+        else:
+            entries = dict(previous)
+            entries.update(self.seen)
+
+        report = {
+            'account': self.account,
+            'generated_at': datetime.now().isoformat(timespec='seconds'),
+            'previous_run_at': datetime.fromtimestamp(self.index.created_at).isoformat(timespec='seconds') if self.index.created_at else None,
+            'complete': complete,
+            'summary': {
+                'added': len(self.added),
+                'removed': len(removed),
+                'changed': len(self.changed),
+                'unchanged': self.unchanged,
+                'newly_flagged': sum(1 for change in self.changed if change.get('newly_flagged')),
+                'status_transitions': sum(1 for change in self.changed if 'status_transition' in change),
+            },
+            'added': self.added,
+            'removed': removed,
+            'changed': self.changed,
+        }
+
+        self.index.save(entries)
+        save_diff(report)
+        print(f"✓ Change report: {report['summary']['added']} added, {report['summary']['removed']} removed, "
+              f"{report['summary']['changed']} changed")
+        return report
+
+
+def save_diff(report):
+    """Write the report as <account>/latest.json plus a timestamped copy"""
+    timestamp = datetime.now().strftime("%Y%m%d_%H%M%S")
+    for name in (f'diff_{timestamp}.json', 'latest.json'):
+        filename = state_path('diffs', report['account'], name)
+        with open(filename, 'w', encoding='utf-8') as f:
+            json.dump(report, f, ensure_ascii=False)
+    return filename
+
+
+def load_latest_diff(account='default'):
+    filename = state_path('diffs', account_key(account), 'latest.json')
+    if not os.path.exists(filename):
+        return None
+    with open(filename, 'r', encoding='utf-8') as f:
+        return json.load(f)
@@ -0,0 +1,194 @@
+"""
+Detail-page enrichment for scraped Hiya phone records
+Visits /phones/<id> pages through a bounded pool of browser pages and merges
+the extra attributes into each record, cached per account by phone and list-row hash
+"""
+
+import asyncio
+import json
+import os
+import re
+import tempfile
+import threading
+import time
+
+from changes import account_key
+from latency import latency
+from ratelimit import throttle
+from settings import state_path
+
+# Collects label/value pairs from the detail page: definition lists, two-column
+# table rows and MUI label/value blocks
+EXTRACT_DETAILS_JS = """
+() => {
+    const pairs = {};
+    const text = (el) => (el && el.innerText || '').trim();
+    const add = (label, value) => {
+        label = text(label); value = text(value);
+        if (label && value && label.length < 80 && !(label in pairs)) pairs[label] = value;
+    };
+    document.querySelectorAll('dl').forEach(dl => {
+        dl.querySelectorAll('dt').forEach(dt => add(dt, dt.nextElementSibling));
+    });
+    document.querySelectorAll('main tr, [role="main"] tr').forEach(tr => {
+        const cells = tr.querySelectorAll('th, td');
+        if (cells.length === 2) add(cells[0], cells[1]);
+    });
+    document.querySelectorAll('[class*="label" i], .MuiTypography-caption, .MuiFormLabel-root').forEach(el => {
+        if (el.nextElementSibling) add(el, el.nextElementSibling);
+    });
+    return pairs;
+}
+"""
+
+
+# Serialises the read-merge-write in DetailCache.save between concurrent scrapes
+_save_lock = threading.Lock()
+
+
+def detail_key(label):
+    """Turn a detail-page label into a column name that cannot clash with schema fields"""
+    return 'detail_' + re.sub(r'[^a-z0-9]+', '_', label.lower()).strip('_')
+
+
+class DetailCache:
+    """Detail results keyed by phone number, valid while the list row hash is unchanged"""
+
+    def __init__(self, filename=None):
+        self.filename = filename
+        self.entries = self._load() if filename else {}
+        self.updated = set()  # Phones fetched by this scrape - only these are merged into the file
+
+    def _load(self):
+        if not os.path.exists(self.filename):
+            return {}
+        try:
+            with open(self.filename, 'r', encoding='utf-8') as f:
+                return json.load(f)
+        except Exception as e:
+            print(f"⚠️  Could not load detail cache {self.filename}: {e}")
+            return {}
+
+    def get(self, phone, row_hash):
+        entry = self.entries.get(phone)
+        if entry and entry.get('hash') == row_hash:
+            return entry['details']
+        return None
+
+    def put(self, phone, row_hash, details):
+        self.entries[phone] = {'hash': row_hash, 'details': details, 'fetched_at': time.time()}
+        self.updated.add(phone)
+
+    def save(self):
+        if not self.filename or not self.updated:
+            return
+        with _save_lock:
+            # Merge into what is on disk now, so a concurrent scrape's fetches are not overwritten
+            entries = self._load()
+            entries.update({phone: self.entries[phone] for phone in self.updated})
+            fd, tmp = tempfile.mkstemp(dir=os.path.dirname(self.filename) or '.', suffix='.tmp')
+            try:
+                with os.fdopen(fd, 'w', encoding='utf-8') as f:
+                    json.dump(entries, f)
+                os.replace(tmp, self.filename)
+                self.entries = entries
+                self.updated = set()
+            except OSError as e:
+                print(f"⚠️  Could not save detail cache {self.filename}: {e}")
+                try:
+                    os.unlink(tmp)
+                except OSError:
+                    pass
+
+
+def default_cache(account=None):
+    """The account's persistent cache - cookies of an unknown account only get an in-memory one"""
+    if not account:
+        return DetailCache()
+    return DetailCache(state_path('detail_cache', f'{account_key(account)}.json'))
+
+
+class DetailEnricher:
+    """Fetches detail pages for records through a bounded pool of pages in one browser context"""
+
+    def __init__(self, context, base_url, concurrency=4, cache=None, timeout=None):
+        self.context = context
+        self.base_url = base_url
+        self.concurrency = max(1, concurrency)
+        self.cache = cache if cache is not None else default_cache()
+        self.timeout = timeout
+        self.pages = []
+        self.fetched = 0
+        self.cache_hits = 0
+        self.failed = 0
+
+    async def _get_pages(self, count):
+        while len(self.pages) < count:
+            self.pages.append(await self.context.new_page())
+        return self.pages[:count]
+
+    async def fetch_details(self, page, record):
+        """Load one record's detail page and return its attributes"""
+        url = record.detail_path
+        if url.startswith('/'):
+            url = self.base_url + url
+        await throttle(url)
+        # Without a fixed timeout, detail loads get one derived from recent loads
+        await latency.wait('detail', lambda timeout: page.goto(url, wait_until="domcontentloaded",
+                                                               timeout=self.timeout or timeout))
+        try:
+            await page.wait_for_load_state("networkidle", timeout=self.timeout or latency.timeout('network_idle'))
+        except Exception:
+            pass
+        pairs = await page.evaluate(EXTRACT_DETAILS_JS)
+        return {detail_key(label): value for label, value in pairs.items()}
+
+    async def enrich(self, records):
+        """Merge detail attributes into records in place, fetching only uncached or changed rows"""
+        pending = []
+        for record in records:
+            if not record.detail_path:
+                continue
+            row_hash = record.fingerprint()
+            cached = self.cache.get(record.phone_number, row_hash)
+            if cached is not None:
+                record.details = dict(cached)
+                self.cache_hits += 1
+            else:
+                pending.append((record, row_hash))
+
+        if not pending:
+            return records
+
+        queue = asyncio.Queue()
+        for item in pending:
+            queue.put_nowait(item)
+
+        async def worker(page):
+            while True:
+                try:
+                    record, row_hash = queue.get_nowait()
+                except asyncio.QueueEmpty:
+                    return
+                try:
+                    details = await self.fetch_details(page, record)
+                    record.details = details
+                    self.cache.put(record.phone_number, row_hash, details)
+                    self.fetched += 1
+                except Exception as e:
+                    self.failed += 1
+                    print(f"⚠️  Detail fetch failed for {record.phone_number}: {e}")
+
+        pages = await self._get_pages(min(self.concurrency, len(pending)))
+        await asyncio.gather(*(worker(page) for page in pages))
+        print(f"✓ Fetched details for {len(pending)} records ({self.cache_hits} from cache, {self.failed} failed)")
+        return records
+
+    async def close(self):
+        for page in self.pages:
+            try:
+                await page.close()
+            except Exception:
+                pass
+        self.pages = []
+        self.cache.save()
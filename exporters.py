@@ -0,0 +1,269 @@
+"""
+Export writers for scraped Hiya phone records
+Streaming writers for CSV, gzip CSV, NDJSON and Parquet over a fixed schema
+"""
+
+import csv
+import gzip
+import importlib.util
+import json
+from datetime import datetime
+
+# Fixed, ordered output schema: (column name, logical type)
+SCHEMA = [
+    ('phone_number', 'string'),
+    ('submitted_date', 'string'),
+    ('submitted_email', 'string'),
+    ('registration_job_name', 'string'),
+    ('branded_call', 'string'),
+    ('spam_labeling', 'string'),
+    ('spam_category', 'string'),
+    ('registration_status', 'string'),
+]
+
+# Typed columns derived from the raw display strings by normalize.py
+NORMALIZED_SCHEMA = [
+    ('phone_e164', 'string'),
+    ('submitted_at', 'timestamp'),
+    ('registration_status_code', 'string'),
+    ('spam_labeling_code', 'string'),
+    ('spam_category_code', 'string'),
+]
+
+# Default output: raw values followed by their normalized counterparts
+OUTPUT_SCHEMA = SCHEMA + NORMALIZED_SCHEMA
+
+
+# What writers do with keys that are not part of the schema:
+#   ignore - drop them silently
+#   raise  - fail the write with ValueError
+#   pack   - serialize them as JSON into a trailing 'extras' column
+EXTRAS_POLICIES = ('ignore', 'raise', 'pack')
+EXTRAS_COLUMN = ('extras', 'string')
+
+
+def schema_fieldnames(schema=None):
+    """Return the column names of a schema in declared order"""
+    return [name for name, _ in (schema or SCHEMA)]
+
+
+class RecordWriter:
+    """Base class for streaming record writers - subclasses implement _open/_write/_close"""
+
+    def __init__(self, filename, schema=None, extras='ignore'):
+        if extras not in EXTRAS_POLICIES:
+            raise ValueError(f"Unknown extras policy '{extras}'. Choose one of: {', '.join(EXTRAS_POLICIES)}")
+
+        self.filename = filename
+        self.extras = extras
+        self.schema = list(schema or OUTPUT_SCHEMA)
+        self._columns = tuple(schema_fieldnames(self.schema))
+        self._known = frozenset(self._columns)
+        if extras == 'pack':
+            self.schema.append(EXTRAS_COLUMN)
+        self.fieldnames = schema_fieldnames(self.schema)
+        self.rows_written = 0
+        self._opened = False
+
+    def open(self):
+        if not self._opened:
+            self._open()
+            self._opened = True
+        return self
+
+    def write_rows(self, rows):
+        """Append a batch of record dicts to the output"""
+        self.open()
+        count = 0
+        for row in rows:
+            self._write(self._project(row))
+            count += 1
+        self.rows_written += count
+        return count
+
+    def _project(self, row):
+        """Map a record onto the schema columns, applying the extras policy"""
+        out = {name: row.get(name, '') for name in self._columns}
+        if self.extras != 'ignore':
+            extra = {key: row[key] for key in row if key not in self._known}
+            if extra and self.extras == 'raise':
+                raise ValueError(f"Record has fields outside the schema: {', '.join(sorted(extra))}")
+            if self.extras == 'pack':
+                out['extras'] = json.dumps(extra, ensure_ascii=False, sort_keys=True) if extra else ''
+        return out
+
+    def flush(self):
+        pass
+
+    def close(self):
+        self.open()
+        self._close()
+
+    def __enter__(self):
+        return self.open()
+
+    def __exit__(self, exc_type, exc, tb):
+        self.close()
+
+
+class CsvWriter(RecordWriter):
+    """Plain UTF-8 CSV with a header row"""
+
+    def _open_stream(self):
+        return open(self.filename, 'w', newline='', encoding='utf-8')
+
+    def _open(self):
+        self._file = self._open_stream()
+        self._writer = csv.DictWriter(self._file, fieldnames=self.fieldnames)
+        self._writer.writeheader()
+
+    def _write(self, row):
+        self._writer.writerow(row)
+
+    def flush(self):
+        if self._opened:
+            self._file.flush()
+
+    def _close(self):
+        self._file.close()
+
+
+class GzipCsvWriter(CsvWriter):
+    """Gzip-compressed CSV"""
+
+    def _open_stream(self):
+        return gzip.open(self.filename, 'wt', newline='', encoding='utf-8')
+
+
+class NdjsonWriter(RecordWriter):
+    """Newline-delimited JSON, one record per line"""
+
+    def _open(self):
+        self._file = open(self.filename, 'w', encoding='utf-8')
+
+    def _write(self, row):
+        self._file.write(json.dumps(row, ensure_ascii=False))
+        self._file.write('\n')
+
+    def flush(self):
+        if self._opened:
+            self._file.flush()
+
+    def _close(self):
+        self._file.close()
+
+
+class ParquetWriter(RecordWriter):
+    """Columnar Parquet output - requires pyarrow, rows are buffered into row groups"""
+
+    ARROW_TYPES = {
+        'string': 'string',
+        'int': 'int64',
+        'float': 'float64',
+        'bool': 'bool_',
+        'timestamp': 'timestamp',
+    }
+
+    def __init__(self, filename, schema=None, extras='ignore', row_group_size=5000):
+        super().__init__(filename, schema, extras)
+        self.row_group_size = row_group_size
+        self._buffer = []
+        # Timestamps travel as ISO strings through the other writers
+        self._timestamps = frozenset(name for name, logical_type in self.schema if logical_type == 'timestamp')
+
+    def _arrow_schema(self, pa):
+        fields = []
+        for name, logical_type in self.schema:
+            if logical_type == 'timestamp':
+                arrow_type = pa.timestamp('s', tz='UTC')
+            else:
+                arrow_type = getattr(pa, self.ARROW_TYPES.get(logical_type, 'string'))()
+            fields.append(pa.field(name, arrow_type))
+        return pa.schema(fields)
+
+    def _open(self):
+        try:
+            import pyarrow as pa
+            import pyarrow.parquet as pq
+        except ImportError:
+            raise Exception("Parquet export requires pyarrow - install it with 'pip install pyarrow'")
+
+        self._pa = pa
+        self._arrow = self._arrow_schema(pa)
+        self._writer = pq.ParquetWriter(self.filename, self._arrow, compression='snappy')
+
+    def _write(self, row):
+        self._buffer.append(row)
+        if len(self._buffer) >= self.row_group_size:
+            self._write_row_group()
+
+    def flush(self):
+        # Called per scraped page - a row group is only written once it is full, the rest waits for close()
+        if self._opened and len(self._buffer) >= self.row_group_size:
+            self._write_row_group()
+
+    def _write_row_group(self):
+        if not self._buffer:
+            return
+        columns = {
+            name: [row[name] if row[name] != '' else None for row in self._buffer]
+            for name in self.fieldnames
+        }
+        for name in self._timestamps:
+            columns[name] = [datetime.fromisoformat(value) if isinstance(value, str) else value
+                             for value in columns[name]]
+        table = self._pa.Table.from_pydict(columns, schema=self._arrow)
+        self._writer.write_table(table)
+        self._buffer = []
+
+    def _close(self):
+        self._write_row_group()
+        self._writer.close()
+
+
+# Format name -> (writer class, mimetype, file extension)
+FORMATS = {
+    'csv': (CsvWriter, 'text/csv', '.csv'),
+    'csv.gz': (GzipCsvWriter, 'application/gzip', '.csv.gz'),
+    'ndjson': (NdjsonWriter, 'application/x-ndjson', '.ndjson'),
+    'parquet': (ParquetWriter, 'application/vnd.apache.parquet', '.parquet'),
+}
+
+FORMAT_ALIASES = {
+    'gzip': 'csv.gz',
+    'csv_gz': 'csv.gz',
+    'jsonl': 'ndjson',
+}
+
+
+def normalize_format(fmt):
+    """Resolve a user-supplied format name, raising ValueError if unsupported"""
+    fmt = (fmt or 'csv').strip().lower()
+    fmt = FORMAT_ALIASES.get(fmt, fmt)
+    if fmt not in FORMATS:
+        raise ValueError(f"Unsupported format '{fmt}'. Choose one of: {', '.join(FORMATS)}")
+    if fmt == 'parquet' and importlib.util.find_spec('pyarrow') is None:
+        # Fail the request up front rather than after the browser is set up
+        raise ValueError("Parquet export requires pyarrow - install it with 'pip install pyarrow'")
+    return fmt
+
+
+def get_writer(fmt, filename, schema=None, extras='ignore'):
+    """Create a writer for the given format"""
+    writer_class = FORMATS[normalize_format(fmt)][0]
+    return writer_class(filename, schema=schema, extras=extras)
+
+
+def format_mimetype(fmt):
+    return FORMATS[normalize_format(fmt)][1]
+
+
+def format_extension(fmt):
+    return FORMATS[normalize_format(fmt)][2]
+
+
+def export_records(records, filename, fmt='csv', schema=None, extras='ignore'):
+    """Write an iterable of record dicts to filename in the given format"""
+    with get_writer(fmt, filename, schema=schema, extras=extras) as writer:
+        writer.write_rows(records)
+    return writer.rows_written
@@ -0,0 +1,144 @@
+"""
+Scrape filters for the Hiya phones table
+Pushed down to the portal (query state, search box, date sort) where
+possible, with a client-side filter that always runs as a fallback
+"""
+
+import json
+import os
+from datetime import datetime, date, timezone
+from functools import lru_cache
+from urllib.parse import urlencode
+
+# Display formats the portal has been seen to use for submitted dates
+DATE_FORMATS = (
+    '%b %d, %Y',
+    '%B %d, %Y',
+    '%m/%d/%Y',
+    '%m/%d/%y',
+    '%Y-%m-%d',
+    '%d %b %Y',
+    '%b %d, %Y %I:%M %p',
+    '%m/%d/%Y %I:%M %p',
+    '%m/%d/%Y, %I:%M:%S %p',
+    '%Y-%m-%dT%H:%M:%S',
+)
+
+# Optional mapping of filter name -> portal URL query parameter, e.g.
+# HIYA_FILTER_QUERY_PARAMS='{"status": "status", "job_name": "jobName"}'
+QUERY_PARAMS = json.loads(os.environ.get('HIYA_FILTER_QUERY_PARAMS', '{}'))
+
+
+@lru_cache(maxsize=4096)
+def parse_date(value):
+    """Parse a portal date string into a datetime, or None if it is not recognised"""
+    value = (value or '').strip()
+    if not value:
+        return None
+    for fmt in DATE_FORMATS:
+        try:
+            return datetime.strptime(value, fmt)
+        except ValueError:
+            continue
+    return None
+
+
+def parse_bound(value):
+    """Parse an ISO date filter bound"""
+    if value in (None, ''):
+        return None
+    if isinstance(value, date):
+        bound = value if isinstance(value, datetime) else datetime(value.year, value.month, value.day)
+    else:
+        try:
+            bound = datetime.fromisoformat(str(value))
+        except ValueError:
+            raise ValueError(f"Invalid date filter {value!r} - use ISO format, e.g. 2024-01-31")
+    if bound.tzinfo is not None:
+        # Portal dates parse naive - compare in UTC rather than fail on aware vs naive
+        bound = bound.astimezone(timezone.utc).replace(tzinfo=None)
+    return bound
+
+
+class ScrapeFilters:
+    """Subset of the phones table a caller wants"""
+
+    def __init__(self, status=None, spam_labeling=None, job_name=None, date_from=None, date_to=None):
+        self.status = (status or '').strip().lower() or None
+        self.spam_labeling = (spam_labeling or '').strip().lower() or None
+        self.job_name = (job_name or '').strip() or None
+        self.date_from = parse_bound(date_from)
+        self.date_to = parse_bound(date_to)
+        if self.date_to and self.date_to.time() == datetime.min.time():
+            # A bare end date includes the whole day
+            self.date_to = self.date_to.replace(hour=23, minute=59, second=59)
+
+    @classmethod
+    def from_dict(cls, data):
+        """Build filters from a request body's 'filters' object, or None when empty"""
+        if not data:
+            return None
+        filters = cls(
+            status=data.get('status'),
+            spam_labeling=data.get('spam_labeling'),
+            job_name=data.get('job_name'),
+            date_from=data.get('date_from'),
+            date_to=data.get('date_to'),
+        )
+        return filters if filters.active() else None
+
+    def active(self):
+        return any([self.status, self.spam_labeling, self.job_name, self.date_from, self.date_to])
+
+    def has_date_range(self):
+        return bool(self.date_from or self.date_to)
+
+    def matches(self, record):
+        """Client-side check of one record (PhoneRecord or plain dict)"""
+        if self.status and record['registration_status'].lower() != self.status:
+            return False
+        if self.spam_labeling and record['spam_labeling'].lower() != self.spam_labeling:
+            return False
+        if self.job_name and self.job_name.lower() not in record['registration_job_name'].lower():
+            return False
+        if self.has_date_range():
+            submitted = parse_date(record['submitted_date'])
+            if submitted is None:
+                # Keep rows whose date cannot be parsed rather than silently dropping them
+                return True
+            if self.date_from and submitted < self.date_from:
+                return False
+            if self.date_to and submitted > self.date_to:
+                return False
+        return True
+
+    def apply(self, records):
+        return [record for record in records if self.matches(record)]
+
+    def older_than_range(self, records):
+        """True if every record on a page was submitted before date_from"""
+        if not self.date_from or not records:
+            return False
+        dates = [parse_date(record['submitted_date']) for record in records]
+        return all(d is not None and d < self.date_from for d in dates)
+
+    def query_string(self):
+        """Portal query state for the filters that have a configured URL parameter"""
+        values = {
+            'status': self.status,
+            'spam_labeling': self.spam_labeling,
+            'job_name': self.job_name,
+            'date_from': self.date_from.date().isoformat() if self.date_from else None,
+            'date_to': self.date_to.date().isoformat() if self.date_to else None,
+        }
+        params = {QUERY_PARAMS[name]: value for name, value in values.items() if value and name in QUERY_PARAMS}
+        return urlencode(params)
+
+    def to_dict(self):
+        return {
+            'status': self.status,
+            'spam_labeling': self.spam_labeling,
+            'job_name': self.job_name,
+            'date_from': self.date_from.isoformat() if self.date_from else None,
+            'date_to': self.date_to.isoformat() if self.date_to else None,
+        }
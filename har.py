@@ -0,0 +1,200 @@
+"""
+HAR record and replay for offline scrapes
+Records a scrape's portal traffic into a HAR archive with cookies and
+credentials scrubbed, and replays a later run entirely from that archive
+so extraction and pagination can be tested and profiled without the portal
+
+Usage:
+    HIYA_COOKIES=... python har.py record portal.har --pages 3
+    python har.py replay portal.har --pages 3 --format csv
+"""
+
+import argparse
+import asyncio
+import base64
+import contextvars
+import json
+import os
+import re
+import time
+from urllib.parse import parse_qsl, urlencode, urlsplit, urlunsplit
+
+REDACTED = 'REDACTED'
+
+# Request/response headers that carry the session
+SCRUBBED_HEADERS = {'cookie', 'set-cookie', 'authorization', 'proxy-authorization'}
+
+# Form, JSON and auth query fields that carry credentials, tokens or who is logged in (compared lowercased)
+SCRUBBED_FIELDS = {'password', 'username', 'email', 'code', 'state', 'token', 'access_token',
+                   'id_token', 'refresh_token', 'client_secret', 'otp', 'accesstoken', 'idtoken',
+                   'refreshtoken', 'sub', 'sid', 'user_id', 'userid', 'nickname', 'picture', 'given_name',
+                   'family_name'}
+
+# JWTs turn up under all sorts of keys
+JWT_PATTERN = re.compile(r'^eyJ[\w-]+\.[\w-]+\.[\w-]*$')
+
+# Set for the task of a scrape served from an archive - its timings and traffic say nothing about the portal
+replaying = contextvars.ContextVar('har_replaying', default=False)
+
+
+def record_options(path):
+    """new_context() options that record the context's traffic into path (written when it closes)"""
+    return {'record_har_path': path, 'record_har_content': 'embed'}
+
+
+async def replay(context, path):
+    """Serve every request in the context from the archive - anything not recorded is aborted"""
+    if not os.path.exists(path):
+        raise FileNotFoundError(f"HAR archive not found: {path}")
+    await context.route_from_har(path, not_found='abort')
+
+
+def is_auth_host(url):
+    return (urlsplit(url).hostname or '').startswith('auth')
+
+
+def scrub_headers(headers):
+    for header in headers:
+        if header.get('name', '').lower() in SCRUBBED_HEADERS:
+            header['value'] = REDACTED
+
+
+def scrub_params(params):
+    for param in params:
+        if param.get('name', '').lower() in SCRUBBED_FIELDS:
+            param['value'] = REDACTED
+
+
+def scrub_json(value):
+    if isinstance(value, dict):
+        return {key: REDACTED if key.lower() in SCRUBBED_FIELDS else scrub_json(item) for key, item in value.items()}
+    if isinstance(value, list):
+        return [scrub_json(item) for item in value]
+    if isinstance(value, str) and JWT_PATTERN.match(value):
+        return REDACTED
+    return value
+
+
+def scrub_query(url):
+    parts = urlsplit(url)
+    if not parts.query:
+        return url
+    query = [(name, REDACTED if name.lower() in SCRUBBED_FIELDS else value)
+             for name, value in parse_qsl(parts.query, keep_blank_values=True)]
+    return urlunsplit(parts._replace(query=urlencode(query)))
+
+
+def scrub_post_data(post):
+    scrub_params(post.get('params', []))
+    text = post.get('text')
+    if not text:
+        return
+    mime = post.get('mimeType', '')
+    if 'json' in mime:
+        try:
+            post['text'] = json.dumps(scrub_json(json.loads(text)))
+        except ValueError:
+            post['text'] = REDACTED
+    elif 'x-www-form-urlencoded' in mime:
+        fields = parse_qsl(text, keep_blank_values=True)
+        post['text'] = urlencode([(name, REDACTED if name.lower() in SCRUBBED_FIELDS else value)
+                                  for name, value in fields])
+
+
+def scrub_json_content(content):
+    """Scrub a JSON response body in place, keeping its text or base64 encoding"""
+    text = content.get('text')
+    if not text or 'json' not in content.get('mimeType', ''):
+        return
+    encoded = content.get('encoding') == 'base64'
+    try:
+        body = json.loads(base64.b64decode(text) if encoded else text)
+    except ValueError:
+        content['text'] = ''
+        content['size'] = 0
+        return
+    text = json.dumps(scrub_json(body))
+    content['text'] = base64.b64encode(text.encode()).decode() if encoded else text
+    content['size'] = len(text.encode())
+
+
+def scrub_entry(entry):
+    """Remove the session and credentials from one HAR entry in place"""
+    request = entry.get('request', {})
+    response = entry.get('response', {})
+    scrub_headers(request.get('headers', []))
+    scrub_headers(response.get('headers', []))
+    request['cookies'] = []
+    response['cookies'] = []
+    if request.get('postData'):
+        scrub_post_data(request['postData'])
+    # Portal APIs (e.g. /api/auth/me) answer with the user's email and tokens on every host
+    scrub_json_content(response.get('content', {}))
+
+    if is_auth_host(request.get('url', '')):
+        # Replays never log in, so the auth pages only need to exist - drop their query tokens and bodies
+        request['url'] = scrub_query(request['url'])
+        scrub_params(request.get('queryString', []))
+        content = response.get('content', {})
+        if content.get('text'):
+            content['text'] = ''
+            content['size'] = 0
+
+
+def scrub_har(path):
+    """Scrub a recorded archive in place, returning the number of entries"""
+    with open(path, 'r', encoding='utf-8') as f:
+        har = json.load(f)
+
+    entries = har.get('log', {}).get('entries', [])
+    for entry in entries:
+        scrub_entry(entry)
+
+    tmp = f'{path}.tmp'
+    with open(tmp, 'w', encoding='utf-8') as f:
+        json.dump(har, f)
+    os.replace(tmp, path)
+    print(f"🧽 Scrubbed cookies and credentials from {len(entries)} HAR entries in {path}")
+    return len(entries)
+
+
+async def run(args):
+    from playwright.async_api import async_playwright
+    from scraper import HiyaScraper, decode_cookies, launch_browser
+
+    if args.mode == 'record':
+        cookies = decode_cookies(os.environ['HIYA_COOKIES']) if os.environ.get('HIYA_COOKIES') else None
+        scraper = HiyaScraper(email=os.environ.get('HIYA_EMAIL'), password=os.environ.get('HIYA_PASSWORD'),
+                              cookies=cookies)
+        scraper.record_har(args.path)
+    else:
+        scraper = HiyaScraper()
+        scraper.replay_har(args.path)
+    scraper.total_pages = args.pages
+
+    async with async_playwright() as p:
+        browser = await launch_browser(p, headless=True)
+        try:
+            started = time.perf_counter()
+            await scraper.scrape(browser=browser)
+            elapsed = time.perf_counter() - started
+        finally:
+            await browser.close()
+
+    print(f"✓ {args.mode}: {scraper.record_count} records from {scraper.pages_completed} pages in {elapsed:.2f}s")
+    if args.output:
+        scraper.export(args.output, args.format)
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Record a scrape into a HAR archive, or replay one offline')
+    parser.add_argument('mode', choices=['record', 'replay'])
+    parser.add_argument('path', help='HAR archive to write (record) or read (replay)')
+    parser.add_argument('--pages', type=int, default=3, help='Table pages to scrape')
+    parser.add_argument('--output', help='Also export the extracted rows to this file')
+    parser.add_argument('--format', default='csv', help='Export format for --output')
+    asyncio.run(run(parser.parse_args()))
+
+
+if __name__ == '__main__':
+    main()
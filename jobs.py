@@ -0,0 +1,175 @@
+"""
+Background scrape jobs
+Runs scrapes on the shared browser runtime so the HTTP layer can poll,
+stream or cancel them instead of blocking a worker thread until they finish
+"""
+
+import asyncio
+import os
+import threading
+import time
+import uuid
+
+from runtime import runtime
+from scraper import ScrapeCancelled
+from sessions import remember_outcome
+
+# Seconds a cancelled scrape gets to stop at a page boundary before its task is cancelled outright
+CANCEL_GRACE_SECONDS = float(os.environ.get('HIYA_CANCEL_GRACE_SECONDS', 5))
+
+# Finished jobs (and their export files) are kept this long for result downloads
+JOB_TTL_SECONDS = float(os.environ.get('HIYA_JOB_TTL_SECONDS', 3600))
+
+
+def remove_file(filename):
+    try:
+        os.unlink(filename)
+    except OSError:
+        pass
+
+
+class ScrapeJob:
+    """One scrape running on the browser runtime, streaming into an export file"""
+
+    def __init__(self, scraper, filename=None, fmt=None, account=None):
+        self.id = uuid.uuid4().hex
+        self.scraper = scraper
+        self.filename = filename
+        self.format = fmt
+        self.account = account
+        self.status = 'pending'  # pending -> running -> complete, failed or cancelled
+        self.error = None
+        self.created_at = time.time()
+        self.finished_at = None
+        self.future = None
+        self.task = None
+        self._done = threading.Event()
+
+    def start(self):
+        self.status = 'running'
+        self.future = runtime.submit(self._run())
+        self.future.add_done_callback(self._never_started)
+        return self
+
+    async def _run(self):
+        """Run the scrape and report the job done from here - only once the scraper has closed its export file"""
+        self.task = asyncio.current_task()
+        try:
+            await runtime.scrape(self.scraper)
+            self.status = 'complete'
+        except (ScrapeCancelled, asyncio.CancelledError) as e:
+            self.status = 'cancelled'
+            self.error = str(e) or 'Scrape cancelled'
+        except Exception as e:
+            self.status = 'failed'
+            self.error = str(e)
+        finally:
+            self._finish()
+
+    def _never_started(self, future):
+        # Cancelled before _run() got to run, so nothing else will finish the job
+        if future.cancelled() and self.task is None:
+            self.status = 'cancelled'
+            self.error = self.error or 'Scrape cancelled'
+            self._finish()
+
+    def _finish(self):
+        if self.done:
+            return
+        self.finished_at = time.time()
+        remember_outcome(self.scraper)
+        self._done.set()
+
+    def _cancel_task(self):
+        """On the runtime loop: cancel the scrape task itself, so its cleanup runs before the job is done"""
+        if self.task:
+            self.task.cancel()
+        else:
+            self.future.cancel()
+
+    def wait(self, timeout=None):
+        """Block until the job finishes, returning False if timeout expires first"""
+        return self._done.wait(timeout)
+
+    @property
+    def done(self):
+        return self._done.is_set()
+
+    def cancel(self, reason='cancelled'):
+        """Stop at the next page boundary, or cancel the task outright after the grace period"""
+        if self.done:
+            return False
+        print(f"🛑 Cancelling job {self.id} ({reason})")
+        self.scraper.cancel()
+        if self.future:
+            timer = threading.Timer(CANCEL_GRACE_SECONDS, runtime.loop.call_soon_threadsafe, (self._cancel_task,))
+            timer.daemon = True
+            timer.start()
+        return True
+
+    def discard(self):
+        """Delete the job's export file"""
+        if self.filename:
+            remove_file(self.filename)
+            self.filename = None
+
+    def to_dict(self):
+        return {
+            'job_id': self.id,
+            'status': self.status,
+            'error': self.error,
+            'result': self.scraper.status,
+            'format': self.format,
+            'account': self.account,
+            'records': self.scraper.record_count,
+            'pages_completed': self.scraper.pages_completed,
+            'total_pages': self.scraper.total_pages,
+            'created_at': self.created_at,
+            'finished_at': self.finished_at,
+        }
+
+
+class JobRegistry:
+    """Process-wide table of scrape jobs, pruned once finished jobs expire"""
+
+    def __init__(self, ttl=JOB_TTL_SECONDS):
+        self.ttl = ttl
+        self.jobs = {}
+        self._lock = threading.Lock()
+
+    def start(self, scraper, filename=None, fmt=None, account=None):
+        job = ScrapeJob(scraper, filename, fmt, account)
+        with self._lock:
+            self._prune()
+            self.jobs[job.id] = job
+        return job.start()
+
+    def get(self, job_id):
+        with self._lock:
+            return self.jobs.get(job_id)
+
+    def remove(self, job_id):
+        with self._lock:
+            job = self.jobs.pop(job_id, None)
+        if job:
+            job.discard()
+        return job
+
+    def _prune(self):
+        now = time.time()
+        expired = [job_id for job_id, job in self.jobs.items() if job.done and now - job.finished_at > self.ttl]
+        for job_id in expired:
+            self.jobs.pop(job_id).discard()
+
+    def running(self):
+        with self._lock:
+            return [job.id for job in self.jobs.values() if not job.done]
+
+    def cancel_all(self, reason='shutdown'):
+        with self._lock:
+            jobs = list(self.jobs.values())
+        for job in jobs:
+            job.cancel(reason)
+
+
+jobs = JobRegistry()
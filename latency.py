@@ -0,0 +1,153 @@
+"""
+Adaptive timeouts from observed portal latency
+Keeps a rolling window of durations for each kind of browser operation
+and derives timeouts (p99 x a safety factor, within floor/ceiling bounds)
+and poll intervals from it, persisted under the state directory between runs
+"""
+
+import json
+import math
+import os
+import threading
+import time
+from collections import deque
+
+from har import replaying
+from settings import state_path
+
+LATENCY_FILE = 'latency.json'
+
+SAFETY_FACTOR = float(os.environ.get('HIYA_TIMEOUT_SAFETY_FACTOR', 3))
+WINDOW = int(os.environ.get('HIYA_LATENCY_WINDOW', 200))
+# Fixed defaults are used until an operation has this many samples
+MIN_SAMPLES = int(os.environ.get('HIYA_LATENCY_MIN_SAMPLES', 20))
+SAVE_INTERVAL_SECONDS = 60
+
+# operation: (default, floor, ceiling) timeouts in milliseconds
+OPERATIONS = {
+    'goto': (60000, 10000, 120000),        # page.goto to domcontentloaded
+    'table': (30000, 5000, 90000),         # table body rendered
+    'rows': (10000, 2000, 30000),          # phone links present in the table
+    'page_change': (10000, 2000, 30000),   # new rows after a pagination click
+    'network_idle': (10000, 1000, 30000),  # table settled after sort/filter/search
+    'login_form': (10000, 3000, 30000),
+    'login': (30000, 10000, 90000),        # credentials/MFA submitted until the portal answers
+    'detail': (30000, 5000, 60000),        # detail page load during enrichment
+}
+
+MIN_POLL_MS = 50
+MAX_POLL_MS = 500
+
+
+def percentile(samples, pct):
+    """Nearest-rank percentile of a sorted list"""
+    if not samples:
+        return None
+    return samples[max(0, math.ceil(pct / 100 * len(samples)) - 1)]
+
+
+class LatencyStats:
+    """Rolling per-operation durations (seconds) and the timeouts derived from them"""
+
+    def __init__(self, path=None, window=WINDOW, factor=SAFETY_FACTOR, min_samples=MIN_SAMPLES):
+        self.path = path
+        self.window = window
+        self.factor = factor
+        self.min_samples = min_samples
+        self.samples = {}
+        self.timeouts = {}
+        self.saved_at = 0.0
+        self._loaded = False
+        self._lock = threading.Lock()
+
+    def _ensure_loaded(self):
+        if self._loaded:
+            return
+        self._loaded = True
+        self.path = self.path or state_path(LATENCY_FILE)
+        try:
+            with open(self.path, 'r', encoding='utf-8') as f:
+                stored = json.load(f)
+        except (OSError, ValueError):
+            return
+        for op, values in stored.get('samples', {}).items():
+            self.samples[op] = deque(values[-self.window:], maxlen=self.window)
+
+    def observe(self, op, seconds):
+        if replaying.get():
+            return
+        with self._lock:
+            self._ensure_loaded()
+            self.samples.setdefault(op, deque(maxlen=self.window)).append(round(seconds, 3))
+
+    def _sorted(self, op):
+        with self._lock:
+            self._ensure_loaded()
+            return sorted(self.samples.get(op, ()))
+
+    def timeout(self, op):
+        """Timeout in ms for an operation - p99 x factor within its bounds, or the default until warmed up"""
+        default, floor, ceiling = OPERATIONS[op]
+        samples = self._sorted(op)
+        if len(samples) < self.min_samples:
+            return default
+        return int(min(ceiling, max(floor, percentile(samples, 99) * 1000 * self.factor)))
+
+    def poll_interval(self, op):
+        """Polling interval in ms - a tenth of the typical duration, so fast periods notice changes sooner"""
+        samples = self._sorted(op)
+        if len(samples) < self.min_samples:
+            return MAX_POLL_MS // 2
+        return int(min(MAX_POLL_MS, max(MIN_POLL_MS, percentile(samples, 50) * 100)))
+
+    async def wait(self, op, action):
+        """Await action(timeout_ms) and record how long it took - a timeout counts as a sample at its limit"""
+        timeout = self.timeout(op)
+        started = time.monotonic()
+        try:
+            result = await action(timeout)
+        except Exception as e:
+            if type(e).__name__ == 'TimeoutError':
+                # Censored sample - pushes the next timeout up when the portal is slow
+                self.observe(op, timeout / 1000)
+                with self._lock:
+                    self.timeouts[op] = self.timeouts.get(op, 0) + 1
+            raise
+        self.observe(op, time.monotonic() - started)
+        return result
+
+    def save(self, force=False):
+        """Persist the windows (at most once a minute unless forced)"""
+        if replaying.get():
+            return
+        now = time.time()
+        with self._lock:
+            if not self._loaded or (not force and now - self.saved_at < SAVE_INTERVAL_SECONDS):
+                return
+            self.saved_at = now
+            data = {'saved_at': now, 'samples': {op: list(values) for op, values in self.samples.items()}}
+        tmp = f'{self.path}.tmp'
+        try:
+            with open(tmp, 'w', encoding='utf-8') as f:
+                json.dump(data, f)
+            os.replace(tmp, self.path)
+        except OSError as e:
+            print(f"⚠️  Could not save latency stats: {e}")
+
+    def metrics(self):
+        stats = {}
+        for op in OPERATIONS:
+            samples = self._sorted(op)
+            stats[op] = {
+                'samples': len(samples),
+                'p50_ms': round(percentile(samples, 50) * 1000) if samples else None,
+                'p90_ms': round(percentile(samples, 90) * 1000) if samples else None,
+                'p99_ms': round(percentile(samples, 99) * 1000) if samples else None,
+                'timeout_ms': self.timeout(op),
+                'poll_ms': self.poll_interval(op),
+                'timeouts': self.timeouts.get(op, 0),
+            }
+        return stats
+
+
+latency = LatencyStats()
@@ -0,0 +1,347 @@
+"""
+Load-test harness for the scraper API
+Starts api.py under gunicorn with HiyaScraper replaced by a stub backend,
+drives the endpoints with concurrent clients and reports throughput,
+latency percentiles, error rates and peak RSS per gunicorn configuration
+
+    python loadtest.py --config workers=1,threads=4 --config workers=2,threads=8 \\
+        --clients 16 --duration 60 --stub-latency 0.5 --stub-rows 50 --stub-failure-rate 0.05
+"""
+
+import argparse
+import asyncio
+import base64
+import json
+import math
+import os
+import random
+import shutil
+import socket
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+import urllib.error
+import urllib.request
+
+from memwatch import process_tree_rss
+
+# Placeholder session - the stub never sends it anywhere
+STUB_COOKIES = base64.b64encode(json.dumps([
+    {'name': 'appSession.0', 'value': 'loadtest', 'domain': 'business.hiya.com', 'path': '/', 'expires': -1},
+]).encode()).decode()
+
+DEFAULT_MIX = 'health=1,scrape=1,scrape-with-cookies=1,scrape-stream=1'
+
+
+def stub_app():
+    """Gunicorn app factory ('loadtest:stub_app()') - api.app with the browser and scraper stubbed out"""
+    import api
+    import service
+    from records import PhoneRecord
+    from runtime import runtime
+    from scraper import HiyaScraper
+    from sinks import RecordSink
+
+    latency = float(os.environ.get('LOADTEST_LATENCY', 0.5))
+    rows_per_page = int(os.environ.get('LOADTEST_ROWS_PER_PAGE', 50))
+    failure_rate = float(os.environ.get('LOADTEST_FAILURE_RATE', 0))
+
+    class StubScraper(HiyaScraper):
+        """HiyaScraper that fakes portal pages instead of driving Chromium"""
+
+        async def scrape(self, browser=None):
+            self.status = 'running'
+            self.error = None
+            self.record_count = 0
+            self.pages_completed = 0
+            all_data = RecordSink(self.memory_cap)
+            fail_at = random.randint(1, self.total_pages) if random.random() < failure_rate else None
+            try:
+                for page_number in range(1, self.total_pages + 1):
+                    self.check_cancelled()
+                    # Jittered per-page latency, like real portal round trips
+                    await asyncio.sleep(random.uniform(0.5, 1.5) * latency)
+                    if page_number == fail_at:
+                        raise Exception(f"Stub portal failure on page {page_number}")
+                    rows = [
+                        PhoneRecord(
+                            phone_number=f"(555) {page_number % 1000:03d}-{i:04d}",
+                            submitted_date='Jan 05, 2024',
+                            submitted_email='loadtest@example.com',
+                            registration_job_name='Load test',
+                            branded_call='Enabled',
+                            spam_labeling='Not Spam',
+                            spam_category='',
+                            registration_status='Approved',
+                        )
+                        for i in range(rows_per_page)
+                    ]
+                    await self.process_page_records(rows, all_data)
+                    self.pages_completed = page_number
+                self.reached_end = True
+                if self.change_tracker:
+                    self.change_report = self.change_tracker.finish(complete=not self.filters)
+                if self.index_loader:
+                    self.index_loader.commit(complete=True)
+                    self.index_loader = None
+                self.status = 'complete'
+            except (Exception, asyncio.CancelledError) as e:
+                if self.index_loader:
+                    self.index_loader.rollback()
+                    self.index_loader = None
+                self.error = str(e) or type(e).__name__
+                self.status = 'partial' if self.record_count else 'failed'
+                raise
+            finally:
+                self.close_output()
+            self.data = all_data
+            return all_data
+
+        async def check_session(self, browser):
+            return True
+
+    async def no_browser():
+        return None
+
+    # Every route builds its scraper through one of these - none may reach the live portal
+    api.HiyaScraper = StubScraper
+    service.HiyaScraper = StubScraper
+    runtime.get_browser = no_browser
+    return api.app
+
+
+def free_port():
+    with socket.socket() as sock:
+        sock.bind(('127.0.0.1', 0))
+        return sock.getsockname()[1]
+
+
+def parse_config(text):
+    """'workers=2,threads=8' -> {'workers': 2, 'threads': 8}"""
+    config = {'workers': 1, 'threads': 4}
+    for part in filter(None, text.split(',')):
+        key, _, value = part.partition('=')
+        config[key.strip()] = int(value)
+    return config
+
+
+def parse_mix(text):
+    mix = []
+    for part in filter(None, text.split(',')):
+        name, _, weight = part.partition('=')
+        if name not in ENDPOINTS:
+            raise ValueError(f"Unknown endpoint '{name}'. Choose from: {', '.join(ENDPOINTS)}")
+        mix.extend([name] * int(weight or 1))
+    return mix
+
+
+class Server:
+    """gunicorn running the stubbed app in a throwaway state directory"""
+
+    def __init__(self, config, args):
+        self.config = config
+        self.port = free_port()
+        self.base_url = f'http://127.0.0.1:{self.port}'
+        self.state_dir = tempfile.mkdtemp(prefix='hiya_loadtest_')
+        env = dict(os.environ)
+        # No PORT/RAILWAY_ENVIRONMENT, so the app does not think it is in production
+        env.pop('PORT', None)
+        env.pop('RAILWAY_ENVIRONMENT', None)
+        env.update({
+            'HIYA_PREWARM': '0',
+            # The stub cookies must never reach the live portal's session endpoint
+            'HIYA_PROBE': '0',
+            'HIYA_STATE_DIR': self.state_dir,
+            'HIYA_COOKIES': STUB_COOKIES,
+            'LOADTEST_LATENCY': str(args.stub_latency),
+            'LOADTEST_ROWS_PER_PAGE': str(args.stub_rows),
+            'LOADTEST_FAILURE_RATE': str(args.stub_failure_rate),
+        })
+        for name in ('HIYA_EMAIL', 'HIYA_PASSWORD', 'HIYA_SCHEDULE', 'HIYA_SCHEDULE_INTERVAL'):
+            env.pop(name, None)
+        self.command = [
+            sys.executable, '-m', 'gunicorn',
+            '--bind', f'127.0.0.1:{self.port}',
+            '--workers', str(config['workers']),
+            '--threads', str(config['threads']),
+            '--worker-class', 'gthread',
+            '--timeout', '1200',
+            '--log-level', 'warning',
+            'loadtest:stub_app()',
+        ]
+        self.env = env
+        self.process = None
+
+    def start(self, timeout=30):
+        self.process = subprocess.Popen(self.command, env=self.env, cwd=os.path.dirname(os.path.abspath(__file__)))
+        deadline = time.time() + timeout
+        while time.time() < deadline:
+            if self.process.poll() is not None:
+                raise Exception(f"gunicorn exited with status {self.process.returncode}")
+            try:
+                with urllib.request.urlopen(self.base_url + '/', timeout=2) as response:
+                    if response.status == 200:
+                        return
+            except Exception:
+                time.sleep(0.2)
+        raise Exception("gunicorn did not become ready in time")
+
+    def stop(self):
+        if self.process and self.process.poll() is None:
+            self.process.terminate()
+            try:
+                self.process.wait(30)
+            except subprocess.TimeoutExpired:
+                self.process.kill()
+        shutil.rmtree(self.state_dir, ignore_errors=True)
+
+
+def request(base_url, method, path, body=None, timeout=600):
+    """Send one request and read the full response - (ok, bytes read)"""
+    data = json.dumps(body).encode() if body is not None else None
+    req = urllib.request.Request(base_url + path, data=data, method=method,
+                                 headers={'Content-Type': 'application/json'} if data else {})
+    try:
+        with urllib.request.urlopen(req, timeout=timeout) as response:
+            payload = response.read()
+            if response.headers.get('Content-Type', '').startswith('text/event-stream'):
+                # Streams always answer 200 - the final event says how it went
+                return b'event: complete' in payload, len(payload)
+            return response.headers.get('X-Scrape-Status', 'complete') == 'complete', len(payload)
+    except urllib.error.HTTPError as e:
+        return False, len(e.read())
+
+
+def scrape_body(args, with_cookies=False):
+    body = {'pages': args.pages, 'format': args.format}
+    if with_cookies:
+        body['cookies'] = STUB_COOKIES
+    return body
+
+
+# Endpoint name -> (method, path, body builder)
+ENDPOINTS = {
+    'health': ('GET', '/', None),
+    'scrape': ('POST', '/scrape', lambda args: scrape_body(args)),
+    'scrape-with-cookies': ('POST', '/scrape-with-cookies', lambda args: scrape_body(args, with_cookies=True)),
+    'scrape-stream': ('POST', '/scrape-stream', lambda args: scrape_body(args)),
+}
+
+
+def percentile(values, pct):
+    if not values:
+        return None
+    ordered = sorted(values)
+    # Nearest-rank percentile
+    return ordered[max(0, math.ceil(pct / 100 * len(ordered)) - 1)]
+
+
+def run_clients(server, args, mix):
+    """Drive the server with args.clients concurrent clients for args.duration seconds"""
+    results = []
+    results_lock = threading.Lock()
+    peak_rss = [0]
+    stop = threading.Event()
+
+    def client():
+        while not stop.is_set():
+            name = random.choice(mix)
+            method, path, build_body = ENDPOINTS[name]
+            started = time.perf_counter()
+            try:
+                ok, size = request(server.base_url, method, path, build_body(args) if build_body else None)
+            except Exception:
+                ok, size = False, 0
+            elapsed = time.perf_counter() - started
+            with results_lock:
+                results.append((name, elapsed, ok, size))
+
+    def sample_rss():
+        while not stop.is_set():
+            rss = process_tree_rss(server.process.pid) or 0
+            peak_rss[0] = max(peak_rss[0], rss)
+            stop.wait(0.2)
+
+    threads = [threading.Thread(target=client, daemon=True) for _ in range(args.clients)]
+    threads.append(threading.Thread(target=sample_rss, daemon=True))
+    started = time.time()
+    for thread in threads:
+        thread.start()
+    stop.wait(args.duration)
+    stop.set()
+    # In-flight requests still finish and are counted
+    for thread in threads:
+        thread.join()
+    return results, time.time() - started, peak_rss[0]
+
+
+def summarize(config, results, wall_time, peak_rss):
+    report = {
+        'config': config,
+        'wall_seconds': round(wall_time, 1),
+        'peak_rss_mb': round(peak_rss / (1024 * 1024), 1),
+        'endpoints': {},
+    }
+    for name in sorted({result[0] for result in results}):
+        latencies = [r[1] for r in results if r[0] == name]
+        errors = sum(1 for r in results if r[0] == name and not r[2])
+        report['endpoints'][name] = {
+            'requests': len(latencies),
+            'throughput_rps': round(len(latencies) / wall_time, 2),
+            'error_rate': round(errors / len(latencies), 3),
+            'p50_ms': round(percentile(latencies, 50) * 1000),
+            'p90_ms': round(percentile(latencies, 90) * 1000),
+            'p99_ms': round(percentile(latencies, 99) * 1000),
+            'max_ms': round(max(latencies) * 1000),
+        }
+    return report
+
+
+def print_report(report):
+    config = ', '.join(f'{key}={value}' for key, value in report['config'].items())
+    print(f"\n📊 gunicorn {config} - peak RSS {report['peak_rss_mb']}MB over {report['wall_seconds']}s")
+    print(f"{'endpoint':<22}{'reqs':>7}{'rps':>8}{'err%':>7}{'p50':>8}{'p90':>8}{'p99':>8}{'max':>8}")
+    for name, stats in report['endpoints'].items():
+        print(f"{name:<22}{stats['requests']:>7}{stats['throughput_rps']:>8}{stats['error_rate'] * 100:>6.1f}%"
+              f"{stats['p50_ms']:>8}{stats['p90_ms']:>8}{stats['p99_ms']:>8}{stats['max_ms']:>8}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Load-test the scraper API against a stub scraper backend")
+    parser.add_argument('--config', action='append', default=[],
+                        help="gunicorn configuration, e.g. workers=1,threads=4 (repeatable)")
+    parser.add_argument('--clients', type=int, default=8, help="concurrent clients")
+    parser.add_argument('--duration', type=float, default=30, help="seconds to drive load per configuration")
+    parser.add_argument('--mix', default=DEFAULT_MIX, help="endpoint weights, e.g. health=2,scrape-stream=1")
+    parser.add_argument('--pages', type=int, default=5, help="pages requested per scrape")
+    parser.add_argument('--format', default='csv', help="export format requested")
+    parser.add_argument('--stub-latency', type=float, default=0.5, help="seconds per stub page")
+    parser.add_argument('--stub-rows', type=int, default=50, help="records per stub page")
+    parser.add_argument('--stub-failure-rate', type=float, default=0.0, help="fraction of stub scrapes that fail")
+    parser.add_argument('--json', help="write the reports to this file")
+    args = parser.parse_args()
+
+    mix = parse_mix(args.mix)
+    reports = []
+    for config in [parse_config(text) for text in (args.config or ['workers=1,threads=4'])]:
+        server = Server(config, args)
+        print(f"🚀 Starting gunicorn {config} on port {server.port}...")
+        server.start()
+        try:
+            results, wall_time, peak_rss = run_clients(server, args, mix)
+        finally:
+            server.stop()
+        report = summarize(config, results, wall_time, peak_rss)
+        print_report(report)
+        reports.append(report)
+
+    if args.json:
+        with open(args.json, 'w', encoding='utf-8') as f:
+            json.dump(reports, f, indent=2)
+        print(f"\n💾 Reports saved to {args.json}")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,156 @@
+"""
+Memory watchdog for long scrapes
+Samples the scrape's own renderer JS heap at page boundaries and tells the
+scraper when to recycle its page or context - at most a few times per run
+"""
+
+import os
+
+from settings import env_flag
+
+HEAP_LIMIT_MB = float(os.environ.get('HIYA_WATCHDOG_HEAP_MB', 384))
+# Heap the renderer has reserved (used plus free) - past this a new context is needed to give it back
+RENDERER_LIMIT_MB = float(os.environ.get('HIYA_WATCHDOG_RENDERER_MB', 768))
+RECYCLE_EVERY_PAGES = int(os.environ.get('HIYA_RECYCLE_EVERY_PAGES', 0))
+# Pages a fresh page/context gets before memory can recycle it again, and recycles allowed per run -
+# each recycle re-pages from the start of the table
+RECYCLE_COOLDOWN_PAGES = int(os.environ.get('HIYA_RECYCLE_COOLDOWN_PAGES', 5))
+MAX_RECYCLES = int(os.environ.get('HIYA_MAX_RECYCLES', 3))
+
+# performance.memory is Chromium-only; CDP metrics are the fallback
+JS_HEAP_SCRIPT = ("() => performance.memory ? "
+                  "[performance.memory.usedJSHeapSize, performance.memory.totalJSHeapSize] : null")
+
+PAGE_SIZE = os.sysconf('SC_PAGE_SIZE') if hasattr(os, 'sysconf') else 4096
+
+
+def _proc_children():
+    """Map of pid -> child pids from /proc"""
+    children = {}
+    for entry in os.listdir('/proc'):
+        if not entry.isdigit():
+            continue
+        try:
+            with open(f'/proc/{entry}/stat') as f:
+                stat = f.read()
+        except OSError:
+            continue
+        # The command name may contain spaces, so split after its closing paren
+        ppid = int(stat.rsplit(')', 1)[1].split()[1])
+        children.setdefault(ppid, []).append(int(entry))
+    return children
+
+
+def process_tree_rss(pid=None):
+    """Resident memory in bytes of a process (default: this one) plus its descendants, or None"""
+    pid = pid or os.getpid()
+    try:
+        import psutil
+        root = psutil.Process(pid)
+        processes = [root] + root.children(recursive=True)
+        total = 0
+        for process in processes:
+            try:
+                total += process.memory_info().rss
+            except psutil.Error:
+                continue
+        return total
+    except ImportError:
+        pass
+    except psutil.Error:
+        return None
+
+    if not os.path.isdir('/proc'):
+        return None
+    children = _proc_children()
+    pending = [pid]
+    total = 0
+    while pending:
+        pid = pending.pop()
+        pending.extend(children.get(pid, []))
+        try:
+            with open(f'/proc/{pid}/statm') as f:
+                total += int(f.read().split()[1]) * PAGE_SIZE
+        except OSError:
+            continue
+    return total
+
+
+async def js_heap(page):
+    """(used, total) JS heap bytes of the page's renderer - this scrape's alone - or (None, None)"""
+    try:
+        sizes = await page.evaluate(JS_HEAP_SCRIPT)
+        if sizes:
+            return sizes[0], sizes[1]
+    except Exception:
+        pass
+    try:
+        session = await page.context.new_cdp_session(page)
+        try:
+            await session.send('Performance.enable')
+            result = await session.send('Performance.getMetrics')
+            metrics = {metric['name']: metric['value'] for metric in result.get('metrics', [])}
+            return metrics.get('JSHeapUsedSize'), metrics.get('JSHeapTotalSize')
+        finally:
+            await session.detach()
+    except Exception:
+        return None, None
+
+
+class MemoryWatchdog:
+    """Decides at each page boundary whether the page or context needs recycling"""
+
+    def __init__(self, heap_limit_mb=HEAP_LIMIT_MB, renderer_limit_mb=RENDERER_LIMIT_MB,
+                 recycle_every=RECYCLE_EVERY_PAGES, cooldown_pages=RECYCLE_COOLDOWN_PAGES, max_recycles=MAX_RECYCLES):
+        self.heap_limit = heap_limit_mb * 1024 * 1024 if heap_limit_mb else None
+        self.renderer_limit = renderer_limit_mb * 1024 * 1024 if renderer_limit_mb else None
+        self.recycle_every = recycle_every
+        self.cooldown_pages = cooldown_pages
+        self.max_recycles = max_recycles
+        self.pages_since_recycle = 0
+        self.last_sample = None
+        self.recycles = []
+
+    async def check(self, page, page_number):
+        """Return None, 'page' or 'context' for the page just processed"""
+        self.pages_since_recycle += 1
+        heap, reserved = await js_heap(page) if self.heap_limit or self.renderer_limit else (None, None)
+        self.last_sample = {'page': page_number, 'js_heap_mb': to_mb(heap), 'renderer_heap_mb': to_mb(reserved)}
+
+        if self.max_recycles and len(self.recycles) >= self.max_recycles:
+            return None
+        if self.recycles and self.pages_since_recycle < self.cooldown_pages:
+            # Give the fresh page a chance to settle - back-to-back recycles only re-page the table
+            return None
+
+        scope = None
+        reason = None
+        if self.renderer_limit and reserved and reserved > self.renderer_limit:
+            # The renderer keeps heap it has grown into - a new context releases it with its caches
+            scope, reason = 'context', f"renderer heap {to_mb(reserved)}MB over {to_mb(self.renderer_limit)}MB"
+        elif self.heap_limit and heap and heap > self.heap_limit:
+            scope, reason = 'page', f"JS heap {to_mb(heap)}MB over {to_mb(self.heap_limit)}MB"
+        elif self.recycle_every and self.pages_since_recycle >= self.recycle_every:
+            scope, reason = 'page', f"{self.pages_since_recycle} pages since last recycle"
+
+        if scope:
+            if self.max_recycles and len(self.recycles) + 1 == self.max_recycles:
+                reason += f" (last of {self.max_recycles} recycles this run)"
+            print(f"♻️  Memory watchdog: {reason} - recycling {scope}")
+            self.recycles.append({'page': page_number, 'scope': scope, 'reason': reason})
+            self.pages_since_recycle = 0
+        return scope
+
+    def status(self):
+        return {'last_sample': self.last_sample, 'recycles': self.recycles}
+
+
+def to_mb(value):
+    return round(value / (1024 * 1024), 1) if value else None
+
+
+def default_watchdog():
+    """Watchdog configured from the environment, or None when HIYA_WATCHDOG=0"""
+    if not env_flag('HIYA_WATCHDOG', default=True):
+        return None
+    return MemoryWatchdog()
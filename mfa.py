@@ -0,0 +1,112 @@
+"""
+Pending 2FA logins
+Keeps the browser context of a login that stopped at the MFA prompt alive,
+keyed by an opaque token, so a second request can enter the code into the
+same page instead of starting over from the login form
+"""
+
+import asyncio
+import os
+import secrets
+import threading
+import time
+
+# Seconds a login waits for its 2FA code before its context is closed
+PENDING_TTL_SECONDS = float(os.environ.get('HIYA_MFA_PENDING_TTL_SECONDS', 300))
+# Logins allowed to wait for a code at once - each one holds an open browser context
+MAX_PENDING_LOGINS = int(os.environ.get('HIYA_MFA_MAX_PENDING', 5))
+
+
+class TooManyPendingLogins(Exception):
+    pass
+
+
+class MfaRequired(Exception):
+    """Raised when a login stopped at the MFA prompt and is waiting under a pending token"""
+
+    def __init__(self, token, expires_in):
+        super().__init__("2FA code required")
+        self.token = token
+        self.expires_in = expires_in
+
+
+class PendingLogin:
+    def __init__(self, token, scraper, context, page, expires_at):
+        self.token = token
+        self.scraper = scraper
+        self.context = context
+        self.page = page
+        self.expires_at = expires_at
+
+    @property
+    def expired(self):
+        return time.time() >= self.expires_at
+
+    async def close(self):
+        try:
+            await self.context.close()
+        except Exception:
+            pass
+
+
+class PendingLogins:
+    """Logins waiting for a 2FA code - added and closed on the browser runtime loop"""
+
+    def __init__(self, ttl=PENDING_TTL_SECONDS, limit=MAX_PENDING_LOGINS):
+        self.ttl = ttl
+        self.limit = limit
+        self.logins = {}
+        self._lock = threading.Lock()
+
+    async def add(self, scraper, context, page):
+        """Park a login at the MFA prompt and return its token"""
+        await self.prune()
+        with self._lock:
+            if len(self.logins) >= self.limit:
+                raise TooManyPendingLogins(f"Too many logins waiting for a 2FA code ({self.limit}) - try again shortly")
+            token = secrets.token_urlsafe(24)
+            self.logins[token] = PendingLogin(token, scraper, context, page, time.time() + self.ttl)
+        asyncio.get_running_loop().call_later(self.ttl, lambda: asyncio.ensure_future(self.prune()))
+        print(f"⏸️  Login for {scraper.email} waiting for a 2FA code ({len(self.logins)} pending)")
+        return token
+
+    async def take(self, token):
+        """Remove and return a live pending login, or None if the token is unknown or expired"""
+        with self._lock:
+            login = self.logins.pop(token, None)
+        if login and login.expired:
+            await login.close()
+            return None
+        return login
+
+    def __contains__(self, token):
+        with self._lock:
+            return token in self.logins
+
+    def restore(self, login):
+        """Put a login back (e.g. after a wrong code) until its original expiry"""
+        with self._lock:
+            self.logins[login.token] = login
+
+    async def prune(self):
+        """Close the contexts of logins whose code never arrived"""
+        with self._lock:
+            expired = [token for token, login in self.logins.items() if login.expired]
+            logins = [self.logins.pop(token) for token in expired]
+        for login in logins:
+            print(f"⌛ Pending 2FA login for {login.scraper.email} expired")
+            await login.close()
+
+    async def close_all(self):
+        with self._lock:
+            logins = list(self.logins.values())
+            self.logins.clear()
+        for login in logins:
+            await login.close()
+
+    def status(self):
+        with self._lock:
+            return {'pending': len(self.logins), 'limit': self.limit, 'ttl_seconds': self.ttl}
+
+
+pending_logins = PendingLogins()
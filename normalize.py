@@ -0,0 +1,80 @@
+"""
+Normalization of scraped display strings into typed columns
+E.164 phone numbers, ISO timestamps and enum codes, computed per page
+batch through memoised parsers so repeated values are parsed once
+"""
+
+import os
+import re
+import sys
+from functools import lru_cache
+
+from filters import parse_date
+
+# Country calling code assumed for numbers shown without one (NANP by default)
+DEFAULT_COUNTRY_CODE = os.environ.get('HIYA_DEFAULT_COUNTRY_CODE', '1')
+
+_NON_DIGITS = re.compile(r'\D')
+_NON_WORD = re.compile(r'[^0-9a-z]+')
+
+
+@lru_cache(maxsize=65536)
+def to_e164(raw):
+    """'(555) 123-4567' -> '+15551234567', or '' when the number cannot be normalized"""
+    raw = (raw or '').strip()
+    digits = _NON_DIGITS.sub('', raw)
+    if raw.startswith('+'):
+        pass
+    elif raw.startswith('00'):
+        digits = digits[2:]
+    elif DEFAULT_COUNTRY_CODE == '1':
+        if len(digits) == 10:
+            digits = '1' + digits
+        elif not (len(digits) == 11 and digits.startswith('1')):
+            return ''
+    elif digits:
+        # National format - drop the trunk prefix
+        digits = DEFAULT_COUNTRY_CODE + digits.lstrip('0')
+    # E.164 allows at most 15 digits including the country code
+    return f'+{digits}' if 8 <= len(digits) <= 15 else ''
+
+
+@lru_cache(maxsize=8192)
+def to_iso_timestamp(raw):
+    """Portal date string -> ISO 8601 timestamp, or '' when it is not recognised"""
+    parsed = parse_date(raw)
+    return parsed.isoformat() if parsed else ''
+
+
+@lru_cache(maxsize=4096)
+def to_enum_code(raw):
+    """'Pending Review' -> 'pending_review' (interned, since codes repeat on every row)"""
+    return sys.intern(_NON_WORD.sub('_', (raw or '').strip().lower()).strip('_'))
+
+
+def normalize_batch(records):
+    """Fill in the normalized columns for a page of PhoneRecords in one pass"""
+    for record in records:
+        record.normalized = (
+            to_e164(record.phone_number),
+            to_iso_timestamp(record.submitted_date),
+            to_enum_code(record.registration_status),
+            to_enum_code(record.spam_labeling),
+            to_enum_code(record.spam_category),
+        )
+    return records
+
+
+def cache_stats():
+    """Hit rates of the memoised parsers"""
+    stats = {}
+    for name, parser in (('e164', to_e164), ('timestamp', to_iso_timestamp), ('enum', to_enum_code)):
+        info = parser.cache_info()
+        lookups = info.hits + info.misses
+        stats[name] = {
+            'hits': info.hits,
+            'misses': info.misses,
+            'size': info.currsize,
+            'hit_rate': round(info.hits / lookups, 3) if lookups else None,
+        }
+    return stats
@@ -0,0 +1,222 @@
+"""
+HTTP session-validity probe
+One cookie-bearing request to the portal's session endpoint, without a
+browser, to tell whether a cookie set is still logged in before a scrape
+launches Chromium
+"""
+
+import hashlib
+import json
+import os
+import threading
+import time
+import urllib.error
+import urllib.request
+from urllib.parse import urljoin, urlparse
+
+from auth import is_login_url, is_mfa_url
+from ratelimit import throttle_sync, observe_response
+from scraper import CONTEXT_OPTIONS
+
+# The portal's auth session endpoint (appSession cookies) - answers 200 with the user while logged in
+PROBE_URL = os.environ.get('HIYA_PROBE_URL', 'https://business.hiya.com/api/auth/me')
+
+# Seconds a probe result is reused for the same cookies
+PROBE_CACHE_SECONDS = float(os.environ.get('HIYA_PROBE_CACHE_SECONDS', 60))
+# Seconds an unreachable-portal result is reused - short, but enough that an outage doesn't cost a timeout per call
+PROBE_UNKNOWN_CACHE_SECONDS = float(os.environ.get('HIYA_PROBE_UNKNOWN_CACHE_SECONDS', 10))
+PROBE_TIMEOUT_SECONDS = float(os.environ.get('HIYA_PROBE_TIMEOUT_SECONDS', 10))
+
+DEVICE_COOKIES = ('auth0-mf', 'auth0-mf_compat', 'did', 'did_compat')
+
+
+class NoRedirect(urllib.request.HTTPRedirectHandler):
+    """Surface redirects as responses - where the portal sends us is the answer"""
+
+    def redirect_request(self, req, fp, code, msg, headers, newurl):
+        return None
+
+
+_opener = urllib.request.build_opener(NoRedirect)
+
+
+def cookie_matches(cookie, host, now):
+    domain = cookie.get('domain', '').lstrip('.')
+    if domain and host != domain and not host.endswith('.' + domain):
+        return False
+    expires = cookie.get('expires', -1)
+    return expires == -1 or expires > now
+
+
+def cookie_header(cookies, url):
+    """Cookie header a browser would send to url - unexpired cookies whose domain matches"""
+    host = urlparse(url).hostname or ''
+    now = time.time()
+    return '; '.join(f"{cookie['name']}={cookie['value']}" for cookie in cookies
+                     if cookie.get('name') and cookie_matches(cookie, host, now))
+
+
+def has_device_trust(cookies):
+    now = time.time()
+    return any(cookie.get('name') in DEVICE_COOKIES and
+               (cookie.get('expires', -1) == -1 or cookie.get('expires', -1) > now) for cookie in cookies)
+
+
+def user_email(body):
+    """Lowercased email of the user in a session endpoint body, or None when it names no user"""
+    try:
+        user = json.loads(body.decode('utf-8')) if body else None
+    except ValueError:
+        return None
+    if not isinstance(user, dict):
+        return None
+    email = user.get('email') or (user.get('user') or {}).get('email')
+    return email.strip().lower() if isinstance(email, str) and email.strip() else None
+
+
+def classify(status, location, cookies, body=None):
+    """'valid', 'expired', 'mfa' or 'unknown' for a probe response"""
+    if 200 <= status < 300 and status != 204:
+        # A 2xx only proves a session when it carries the user - catch-all pages answer 200 too
+        return 'valid' if user_email(body) else 'unknown'
+    if 300 <= status < 400 and location:
+        if is_mfa_url(location):
+            return 'mfa'
+        if is_login_url(location):
+            # A re-login only skips 2FA while the device is still trusted
+            return 'expired' if has_device_trust(cookies) else 'mfa'
+        return 'unknown'
+    if status in (204, 401, 403):
+        return 'expired' if has_device_trust(cookies) else 'mfa'
+    return 'unknown'
+
+
+class SessionProbe:
+    """Probe results cached briefly per cookie set"""
+
+    def __init__(self, url=PROBE_URL, ttl=PROBE_CACHE_SECONDS, timeout=PROBE_TIMEOUT_SECONDS,
+                 unknown_ttl=PROBE_UNKNOWN_CACHE_SECONDS):
+        self.url = url
+        self.ttl = ttl
+        self.unknown_ttl = unknown_ttl
+        self.timeout = timeout
+        self.cache = {}
+        self.hits = 0
+        self.misses = 0
+        self.refreshing = set()
+        self._lock = threading.Lock()
+
+    def _request(self, header):
+        return urllib.request.Request(self.url, headers={
+            'Cookie': header,
+            'User-Agent': CONTEXT_OPTIONS['user_agent'],
+            'Accept': 'application/json',
+        })
+
+    def _fetch(self, header):
+        request = self._request(header)
+        throttle_sync(self.url)
+        try:
+            with _opener.open(request, timeout=self.timeout) as response:
+                return response.status, None, response.read()
+        except urllib.error.HTTPError as e:
+            # Redirects and error statuses both arrive here with NoRedirect
+            location = e.headers.get('Location')
+            return e.code, urljoin(self.url, location) if location else None, None
+
+    def _no_cookies(self, cookies):
+        return {'status': 'expired' if has_device_trust(cookies or []) else 'mfa', 'http_status': None,
+                'location': None, 'checked_at': time.time(), 'elapsed_ms': 0, 'cached': False}
+
+    def check(self, cookies):
+        """Classify a cookie set, reusing a recent result for the same cookies"""
+        header = cookie_header(cookies or [], self.url)
+        if not header:
+            return self._no_cookies(cookies)
+
+        key = hashlib.sha256(header.encode()).hexdigest()
+        now = time.time()
+        with self._lock:
+            self._expire(now)
+            cached = self.cache.get(key)
+            if cached:
+                self.hits += 1
+                return dict(cached, cached=True)
+            self.misses += 1
+
+        started = time.monotonic()
+        try:
+            status, location, body = self._fetch(header)
+            observe_response(self.url, status)
+            outcome = classify(status, location, cookies, body)
+        except (urllib.error.URLError, OSError) as e:
+            # The portal could not be reached - let the browser find out
+            print(f"⚠️  Session probe failed: {e}")
+            status, location, outcome = None, None, 'unknown'
+
+        result = {
+            'status': outcome,
+            'http_status': status,
+            'location': location,
+            'checked_at': now,
+            'elapsed_ms': round((time.monotonic() - started) * 1000),
+        }
+        with self._lock:
+            self.cache[key] = result
+        print(f"🩺 Session probe: {outcome} (HTTP {status}, {result['elapsed_ms']}ms)")
+        return dict(result, cached=False)
+
+    def peek(self, cookies):
+        """Cached result for a cookie set without waiting on the portal - a miss refreshes in the background"""
+        header = cookie_header(cookies or [], self.url)
+        if not header:
+            return self._no_cookies(cookies)
+
+        key = hashlib.sha256(header.encode()).hexdigest()
+        with self._lock:
+            self._expire(time.time())
+            cached = self.cache.get(key)
+            if cached:
+                return dict(cached, cached=True)
+            if key in self.refreshing:
+                return {'status': 'pending', 'cached': False}
+            self.refreshing.add(key)
+        threading.Thread(target=self._refresh, args=(key, cookies), daemon=True, name='session-probe').start()
+        return {'status': 'pending', 'cached': False}
+
+    def _refresh(self, key, cookies):
+        try:
+            self.check(cookies)
+        except Exception as e:
+            print(f"⚠️  Background session probe failed: {e}")
+        finally:
+            with self._lock:
+                self.refreshing.discard(key)
+
+    def account(self, cookies):
+        """Email of the portal user the cookies are logged in as, or None when the portal does not say"""
+        header = cookie_header(cookies or [], self.url)
+        if not header:
+            return None
+        throttle_sync(self.url)
+        try:
+            with _opener.open(self._request(header), timeout=self.timeout) as response:
+                observe_response(self.url, response.status)
+                return user_email(response.read())
+        except (urllib.error.URLError, OSError) as e:
+            print(f"⚠️  Could not read the session's user: {e}")
+            return None
+
+    def _expire(self, now):
+        expired = [key for key, result in self.cache.items()
+                   if now - result['checked_at'] > (self.unknown_ttl if result['status'] == 'unknown' else self.ttl)]
+        for key in expired:
+            del self.cache[key]
+
+    def stats(self):
+        with self._lock:
+            return {'cached': len(self.cache), 'hits': self.hits, 'misses': self.misses, 'ttl_seconds': self.ttl,
+                    'unknown_ttl_seconds': self.unknown_ttl}
+
+
+session_probe = SessionProbe()
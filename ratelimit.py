@@ -0,0 +1,165 @@
+"""
+Process-wide rate limiting for Hiya portal traffic
+Token buckets for auth and data requests, shared by every scrape, with
+adaptive backoff when the portal answers 429/5xx
+"""
+
+import asyncio
+import os
+import threading
+import time
+from urllib.parse import urlparse
+
+from har import replaying
+
+# Only these request types count as portal traffic - not images, scripts or fonts
+TRACKED_RESOURCE_TYPES = ('document', 'xhr', 'fetch')
+
+# Fraction of the full rate won back per second without a throttled response
+RECOVERY_PER_SECOND = float(os.environ.get('HIYA_RATE_RECOVERY_PER_SECOND', 0.02))
+
+
+class TokenBucket:
+    """Token bucket with multiplicative decrease on throttling and additive recovery over time"""
+
+    def __init__(self, name, rate, burst, min_rate=None):
+        self.name = name
+        self.max_rate = float(rate)
+        self.rate = float(rate)
+        self.min_rate = float(min_rate or rate / 8)
+        self.capacity = float(burst)
+        self.tokens = float(burst)
+        self.updated = time.monotonic()
+        self.recovered_at = self.updated
+        self.blocked_until = 0.0
+        self.consecutive_throttles = 0
+        self._lock = threading.Lock()
+
+        # Metrics
+        self.acquired = 0
+        self.waited = 0
+        self.total_wait = 0.0
+        self.max_wait = 0.0
+        self.throttled_responses = 0
+
+    def _recover(self, now):
+        """Raise the rate by the time passed since the last throttle or backoff - a burst of responses gains nothing"""
+        if self.rate < self.max_rate and now > self.blocked_until:
+            elapsed = now - max(self.recovered_at, self.blocked_until)
+            self.rate = min(self.max_rate, self.rate + self.max_rate * RECOVERY_PER_SECOND * elapsed)
+        self.recovered_at = now
+
+    def _reserve(self, tokens=1):
+        """Take tokens (possibly into debt) and return how long the caller must wait"""
+        with self._lock:
+            now = time.monotonic()
+            self._recover(now)
+            self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+            self.updated = now
+            self.tokens -= tokens
+            wait = max(0.0, -self.tokens / self.rate, self.blocked_until - now)
+            self.acquired += 1
+            if wait > 0:
+                self.waited += 1
+                self.total_wait += wait
+                self.max_wait = max(self.max_wait, wait)
+            return wait
+
+    async def acquire(self, tokens=1):
+        wait = self._reserve(tokens)
+        if wait > 0:
+            await asyncio.sleep(wait)
+        return wait
+
+    def acquire_sync(self, tokens=1):
+        """Blocking variant for direct HTTP requests made from worker threads"""
+        wait = self._reserve(tokens)
+        if wait > 0:
+            time.sleep(wait)
+        return wait
+
+    def on_response(self, status, retry_after=None):
+        """Adapt the rate to a portal response status"""
+        with self._lock:
+            if status == 429 or status >= 500:
+                self.throttled_responses += 1
+                self.consecutive_throttles += 1
+                self.rate = max(self.min_rate, self.rate / 2)
+                backoff = retry_after if retry_after is not None else min(60.0, 2.0 ** self.consecutive_throttles)
+                self.recovered_at = time.monotonic()
+                self.blocked_until = max(self.blocked_until, self.recovered_at + backoff)
+            elif status < 400:
+                self.consecutive_throttles = 0
+
+    def metrics(self):
+        with self._lock:
+            self._recover(time.monotonic())
+            return {
+                'rate': round(self.rate, 3),
+                'max_rate': self.max_rate,
+                'burst': self.capacity,
+                'acquired': self.acquired,
+                'waited': self.waited,
+                'total_wait_seconds': round(self.total_wait, 3),
+                'avg_wait_seconds': round(self.total_wait / self.waited, 3) if self.waited else 0.0,
+                'max_wait_seconds': round(self.max_wait, 3),
+                'throttled_responses': self.throttled_responses,
+                'backing_off': self.blocked_until > time.monotonic(),
+            }
+
+
+LIMITERS = {
+    'auth': TokenBucket('auth', rate=float(os.environ.get('HIYA_AUTH_RPS', 0.5)),
+                        burst=float(os.environ.get('HIYA_AUTH_BURST', 3))),
+    'data': TokenBucket('data', rate=float(os.environ.get('HIYA_DATA_RPS', 4)),
+                        burst=float(os.environ.get('HIYA_DATA_BURST', 8))),
+}
+
+
+def bucket_for(url):
+    """auth-console.hiya.com traffic goes to the auth bucket, everything else to data"""
+    host = urlparse(url).hostname or ''
+    return LIMITERS['auth'] if host.startswith('auth') else LIMITERS['data']
+
+
+async def throttle(url):
+    """Wait for permission to send a request to url"""
+    if replaying.get():
+        # Served from an archive - nothing reaches the portal
+        return 0
+    return await bucket_for(url).acquire()
+
+
+def throttle_sync(url):
+    return bucket_for(url).acquire_sync()
+
+
+def parse_retry_after(value):
+    try:
+        return float(value) if value else None
+    except ValueError:
+        return None
+
+
+def observe_response(url, status, retry_after=None):
+    """Feed a portal response back into its bucket"""
+    host = urlparse(url).hostname or ''
+    if not host.endswith('hiya.com'):
+        return
+    bucket_for(url).on_response(status, parse_retry_after(retry_after))
+
+
+def monitor_context(context):
+    """Watch a browser context's responses so throttling slows down every scrape"""
+    def on_response(response):
+        try:
+            if response.request.resource_type in TRACKED_RESOURCE_TYPES:
+                observe_response(response.url, response.status, response.headers.get('retry-after'))
+        except Exception:
+            pass
+
+    context.on('response', on_response)
+
+
+def metrics():
+    return {name: bucket.metrics() for name, bucket in LIMITERS.items()}
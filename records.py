@@ -0,0 +1,99 @@
+"""
+Compact record type for scraped Hiya phone rows
+Fixed slots instead of per-row dicts, with repeated values interned
+"""
+
+import hashlib
+import sys
+from collections.abc import Mapping
+
+from exporters import schema_fieldnames, NORMALIZED_SCHEMA
+
+FIELDS = tuple(schema_fieldnames())
+
+# Typed counterparts of the raw fields, filled in by normalize.normalize_batch
+NORMALIZED_FIELDS = tuple(schema_fieldnames(NORMALIZED_SCHEMA))
+
+# Fields that repeat heavily across rows - stored as interned strings so
+# every record shares a single copy of each distinct value
+INTERNED_FIELDS = frozenset([
+    'submitted_date',
+    'submitted_email',
+    'registration_job_name',
+    'branded_call',
+    'spam_labeling',
+    'spam_category',
+    'registration_status',
+])
+
+
+class PhoneRecord(Mapping):
+    """One phone row, exposed as a mapping over the schema fields plus any detail attributes"""
+
+    # detail_path is the row's /phones/<id> link, details holds attributes
+    # merged in from the detail page (None until enriched), normalized is
+    # a tuple of NORMALIZED_FIELDS values (None until normalized)
+    __slots__ = FIELDS + ('detail_path', 'details', 'normalized')
+
+    def __init__(self, detail_path='', details=None, **fields):
+        for name in FIELDS:
+            value = fields.pop(name, '') or ''
+            if name in INTERNED_FIELDS:
+                value = sys.intern(value)
+            setattr(self, name, value)
+        if fields:
+            raise TypeError(f"Unknown record fields: {', '.join(sorted(fields))}")
+        self.detail_path = detail_path
+        self.details = details
+        self.normalized = None
+
+    @classmethod
+    def from_dict(cls, data):
+        return cls(**{name: data.get(name, '') for name in FIELDS})
+
+    def __getitem__(self, name):
+        if name in FIELDS:
+            return getattr(self, name)
+        if self.normalized and name in NORMALIZED_FIELDS:
+            return self.normalized[NORMALIZED_FIELDS.index(name)]
+        if self.details and name in self.details:
+            return self.details[name]
+        raise KeyError(name)
+
+    def __iter__(self):
+        yield from FIELDS
+        if self.normalized:
+            yield from NORMALIZED_FIELDS
+        if self.details:
+            yield from self.details
+
+    def __len__(self):
+        return len(FIELDS) + (len(NORMALIZED_FIELDS) if self.normalized else 0) + len(self.details or ())
+
+    def __eq__(self, other):
+        if isinstance(other, PhoneRecord):
+            return (all(getattr(self, name) == getattr(other, name) for name in FIELDS)
+                    and (self.details or {}) == (other.details or {}))
+        return Mapping.__eq__(self, other)
+
+    __hash__ = None
+
+    def __repr__(self):
+        return f"PhoneRecord(phone_number={self.phone_number!r})"
+
+    def list_fields(self):
+        """Values of the list-view columns in schema order"""
+        return tuple(getattr(self, name) for name in FIELDS)
+
+    def fingerprint(self):
+        """Stable hash of the list-view fields - changes whenever the list row changes"""
+        return hashlib.blake2b('\x1f'.join(self.list_fields()).encode('utf-8'), digest_size=12).hexdigest()
+
+    def to_dict(self):
+        """Convert to a plain dict - only needed at output boundaries"""
+        data = {name: getattr(self, name) for name in FIELDS}
+        if self.normalized:
+            data.update(zip(NORMALIZED_FIELDS, self.normalized))
+        if self.details:
+            data.update(self.details)
+        return data
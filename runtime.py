@@ -0,0 +1,145 @@
+"""
+Shared browser runtime for the API process
+Owns one asyncio event loop on a background thread and a single Chromium
+instance that every request reuses, with optional prewarm at worker boot
+"""
+
+import asyncio
+import threading
+import time
+
+from scraper import launch_browser
+from settings import env_flag
+
+
+class BrowserRuntime:
+    """Background event loop plus a lazily launched, shared Chromium browser"""
+
+    def __init__(self):
+        self.loop = None
+        self.thread = None
+        self.playwright = None
+        self.browser = None
+        self.state = 'cold'  # cold -> warming -> ready, or failed
+        self.error = None
+        self.session_valid = None
+        self.warmed_at = None
+        self.warm_seconds = None
+        self._start_lock = threading.Lock()
+        self._browser_lock = None
+
+    def start(self):
+        """Start the background event loop thread (idempotent)"""
+        with self._start_lock:
+            if self.thread and self.thread.is_alive():
+                return
+            self.loop = asyncio.new_event_loop()
+            self._browser_lock = asyncio.Lock()
+            self.thread = threading.Thread(target=self._run_loop, name='browser-runtime', daemon=True)
+            self.thread.start()
+
+    def _run_loop(self):
+        asyncio.set_event_loop(self.loop)
+        self.loop.run_forever()
+
+    def submit(self, coro):
+        """Schedule a coroutine on the runtime loop, returning a concurrent Future"""
+        self.start()
+        return asyncio.run_coroutine_threadsafe(coro, self.loop)
+
+    async def call(self, coro):
+        """Await a coroutine on the runtime loop from another event loop (the ASGI server's)"""
+        return await asyncio.wrap_future(self.submit(coro))
+
+    def run(self, coro, timeout=None):
+        """Run a coroutine on the runtime loop and block until it finishes"""
+        if self._on_loop():
+            # Blocking the runtime loop on itself would deadlock - coroutines on it await instead
+            coro.close()
+            raise RuntimeError("runtime.run() called on the runtime loop - await the coroutine instead")
+        return self.submit(coro).result(timeout)
+
+    def _on_loop(self):
+        try:
+            return asyncio.get_running_loop() is self.loop
+        except RuntimeError:
+            return False
+
+    async def get_browser(self):
+        """Return the shared browser, launching (or relaunching) Chromium if needed"""
+        async with self._browser_lock:
+            if self.browser and self.browser.is_connected():
+                return self.browser
+
+            from playwright.async_api import async_playwright
+
+            started = time.time()
+            if self.playwright is None:
+                print("🚀 Starting Playwright driver...")
+                self.playwright = await async_playwright().start()
+            print("🚀 Launching shared browser...")
+            self.browser = await launch_browser(self.playwright, headless=True)
+            self.warm_seconds = round(time.time() - started, 2)
+            self.warmed_at = time.time()
+            self.state = 'ready'
+            self.error = None
+            print(f"✓ Shared browser ready in {self.warm_seconds}s")
+            return self.browser
+
+    async def scrape(self, scraper):
+        """Run a scraper against the shared browser"""
+        browser = await self.get_browser()
+        return await scraper.scrape(browser=browser)
+
+    async def _prewarm(self, validate_cookies=None):
+        try:
+            browser = await self.get_browser()
+            if validate_cookies:
+                from scraper import HiyaScraper
+
+                print("🔍 Prewarm: validating session cookies...")
+                self.session_valid = await HiyaScraper(cookies=validate_cookies).check_session(browser)
+                print(f"{'✅' if self.session_valid else '⚠️ '} Prewarm: session {'valid' if self.session_valid else 'invalid'}")
+        except Exception as e:
+            self.state = 'failed'
+            self.error = str(e)
+            print(f"❌ Browser prewarm failed: {e}")
+
+    def prewarm(self, validate_cookies=None):
+        """Launch the browser (and optionally validate cookies) in the background"""
+        if self.state == 'cold':
+            self.state = 'warming'
+        return self.submit(self._prewarm(validate_cookies))
+
+    def status(self):
+        return {
+            'state': self.state,
+            'error': self.error,
+            'session_valid': self.session_valid,
+            'warm_seconds': self.warm_seconds,
+            'warmed_at': self.warmed_at,
+        }
+
+    async def close(self):
+        """Close the browser and Playwright driver from the runtime loop"""
+        if self.browser:
+            await self.browser.close()
+            self.browser = None
+        if self.playwright:
+            await self.playwright.stop()
+            self.playwright = None
+        self.state = 'cold'
+
+    def shutdown(self, timeout=10):
+        """Close the browser and stop the loop"""
+        if not self.loop or not self.thread or not self.thread.is_alive():
+            return
+        try:
+            self.run(self.close(), timeout)
+        except Exception as e:
+            print(f"Error shutting down browser runtime: {e}")
+        self.loop.call_soon_threadsafe(self.loop.stop)
+        self.state = 'cold'
+
+
+runtime = BrowserRuntime()
@@ -0,0 +1,180 @@
+"""
+In-process scrape scheduler
+Runs background scrapes for configured accounts on fixed intervals with
+jitter and publishes the results as snapshots
+"""
+
+import json
+import os
+import random
+import re
+import threading
+import time
+from datetime import datetime
+
+from runtime import runtime
+from scraper import HiyaScraper, decode_cookies
+from snapshots import SnapshotStore
+from store import get_store
+
+UNITS = {'s': 1, 'm': 60, 'h': 3600, 'd': 86400}
+ALIASES = {'@hourly': 3600, '@daily': 86400, '@weekly': 7 * 86400}
+
+
+def parse_interval(value):
+    """Parse '900', '15m', '1h30m', '@hourly', '@every 10m' or '*/15' (minutes) into seconds"""
+    if isinstance(value, (int, float)):
+        return float(value)
+    text = str(value).strip().lower()
+    if text in ALIASES:
+        return float(ALIASES[text])
+    if text.startswith('@every '):
+        text = text[len('@every '):].strip()
+    if text.startswith('*/'):
+        return float(int(text[2:]) * 60)
+    if re.fullmatch(r'\d+(\.\d+)?', text):
+        return float(text)
+    parts = re.findall(r'(\d+(?:\.\d+)?)\s*([smhd])', text)
+    if not parts or ''.join(n + u for n, u in parts) != text.replace(' ', ''):
+        raise ValueError(f"Invalid schedule interval: {value!r}")
+    return float(sum(float(n) * UNITS[u] for n, u in parts))
+
+
+class ScheduledAccount:
+    """One account's schedule and how to build its scraper"""
+
+    def __init__(self, account='default', interval='30m', jitter='0', pages=20, enrich=False,
+                 cookies_env='HIYA_COOKIES', email_env='HIYA_EMAIL', password_env='HIYA_PASSWORD'):
+        self.account = account
+        self.interval = parse_interval(interval)
+        self.jitter = parse_interval(jitter)
+        self.pages = int(pages)
+        self.enrich = bool(enrich)
+        self.cookies_env = cookies_env
+        self.email_env = email_env
+        self.password_env = password_env
+        self.next_run = None
+        self.last_run = None
+        self.last_error = None
+        self.running = False
+
+    def schedule_next(self, now=None):
+        now = now or time.time()
+        delay = self.interval + random.uniform(-self.jitter, self.jitter)
+        self.next_run = now + max(1.0, delay)
+
+    def build_scraper(self):
+        cookies_b64 = os.environ.get(self.cookies_env)
+        if not cookies_b64:
+            raise Exception(f"No cookies configured in {self.cookies_env}")
+        scraper = HiyaScraper(
+            email=os.environ.get(self.email_env),
+            password=os.environ.get(self.password_env),
+            cookies=decode_cookies(cookies_b64)
+        )
+        scraper.account = self.account
+        scraper.total_pages = self.pages
+        scraper.enrich_details = self.enrich
+        return scraper
+
+    def status(self):
+        return {
+            'account': self.account,
+            'interval': self.interval,
+            'jitter': self.jitter,
+            'running': self.running,
+            'next_run': datetime.fromtimestamp(self.next_run).isoformat(timespec='seconds') if self.next_run else None,
+            'last_run': datetime.fromtimestamp(self.last_run).isoformat(timespec='seconds') if self.last_run else None,
+            'last_error': self.last_error,
+        }
+
+
+def run_snapshot(scraper, account):
+    """Scrape into a new snapshot for the account and publish it"""
+    store = SnapshotStore(account)
+    tmp_filename = store.new_path()
+    scraper.open_output(tmp_filename, 'ndjson', extras='pack' if scraper.enrich_details else 'ignore')
+    scraper.index_loader = get_store().loader(account)
+    try:
+        runtime.run(runtime.scrape(scraper))
+    except Exception:
+        try:
+            os.unlink(tmp_filename)
+        except OSError:
+            pass
+        raise
+    return store.publish(tmp_filename, scraper.record_count, complete=scraper.reached_end,
+                         pages=scraper.total_pages, enriched=scraper.enrich_details)
+
+
+class Scheduler:
+    """Background thread that runs due accounts one at a time"""
+
+    def __init__(self, accounts):
+        self.accounts = accounts
+        self.thread = None
+        self._stop = threading.Event()
+
+    def start(self):
+        if self.thread and self.thread.is_alive():
+            return
+        now = time.time()
+        for account in self.accounts:
+            # Run immediately if there is no snapshot yet, otherwise wait one interval
+            meta = SnapshotStore(account.account).latest()
+            if meta is None or meta['age'] >= account.interval:
+                account.next_run = now
+            else:
+                account.next_run = meta['created_at'] + account.interval
+        self.thread = threading.Thread(target=self._run, name='scrape-scheduler', daemon=True)
+        self.thread.start()
+        print(f"⏰ Scheduler started for {len(self.accounts)} account(s)")
+
+    def stop(self):
+        self._stop.set()
+
+    def _run(self):
+        while not self._stop.is_set():
+            now = time.time()
+            due = [account for account in self.accounts if account.next_run <= now]
+            for account in due:
+                self.run_account(account)
+            next_run = min(account.next_run for account in self.accounts)
+            self._stop.wait(max(1.0, min(60.0, next_run - time.time())))
+
+    def run_account(self, account):
+        print(f"⏰ Scheduled scrape for {account.account}")
+        account.running = True
+        try:
+            run_snapshot(account.build_scraper(), account.account)
+            account.last_error = None
+        except Exception as e:
+            account.last_error = str(e)
+            print(f"❌ Scheduled scrape for {account.account} failed: {e}")
+        finally:
+            account.running = False
+            account.last_run = time.time()
+            account.schedule_next()
+
+    def status(self):
+        return [account.status() for account in self.accounts]
+
+
+def load_schedule():
+    """Read scheduled accounts from HIYA_SCHEDULE (JSON list) or HIYA_SCHEDULE_INTERVAL"""
+    config = os.environ.get('HIYA_SCHEDULE')
+    if config:
+        entries = json.loads(config)
+        if isinstance(entries, dict):
+            entries = [entries]
+        return [ScheduledAccount(**entry) for entry in entries]
+
+    interval = os.environ.get('HIYA_SCHEDULE_INTERVAL')
+    if interval:
+        return [ScheduledAccount(
+            account=os.environ.get('HIYA_EMAIL') or 'default',
+            interval=interval,
+            jitter=os.environ.get('HIYA_SCHEDULE_JITTER', '0'),
+            pages=os.environ.get('HIYA_SCHEDULE_PAGES', 20),
+        )]
+    return []
@@ -5,12 +5,71 @@ Fixed version for Railway deployment
 """
 
 import asyncio
-import csv
+import base64
+import math
 import os
+import re
 from datetime import datetime
-from playwright.async_api import async_playwright, TimeoutError as PlaywrightTimeout
 import json
+import threading
 import time
+from exporters import normalize_format, format_extension, export_records, get_writer
+from records import PhoneRecord
+from normalize import normalize_batch
+from enrichment import DetailEnricher, default_cache
+from ratelimit import throttle, monitor_context
+from filters import QUERY_PARAMS
+from sinks import RecordSink
+from memwatch import default_watchdog
+from tracing import default_tracer
+from latency import latency
+import har
+from auth import (TABLE_SELECTOR, submit_credentials, wait_for_login, wait_for_landing,
+                  is_login_url)
+
+# Chromium flags needed inside the Railway container
+CHROMIUM_ARGS = [
+    '--no-sandbox',
+    '--disable-setuid-sandbox',
+    '--disable-dev-shm-usage',
+    '--disable-gpu'
+]
+
+PHONE_LINK_SELECTOR = f'{TABLE_SELECTOR} a[href*="/phones/"]'
+
+FIRST_ROW_SCRIPT = f"""() => {{
+    const row = document.querySelector('{TABLE_SELECTOR} tr');
+    return row ? row.innerText : null;
+}}"""
+
+# True once the table has rows again and the first one is not the marker
+PAGE_CHANGED_SCRIPT = f"""marker => {{
+    const row = document.querySelector('{TABLE_SELECTOR} tr a[href*="/phones/"]');
+    return !!row && row.closest('tr').innerText !== marker;
+}}"""
+
+CONTEXT_OPTIONS = {
+    'viewport': {'width': 1920, 'height': 1080},
+    'user_agent': 'Mozilla/5.0 (Macintosh; Intel Mac OS X 10_15_7) AppleWebKit/537.36'
+}
+
+def decode_cookies(cookies_b64):
+    """Decode a base64-encoded cookie JSON blob (as produced by /auth-and-capture)"""
+    return json.loads(base64.b64decode(cookies_b64).decode())
+
+def is_production_env():
+    return bool(os.environ.get('RAILWAY_ENVIRONMENT') or os.environ.get('PORT'))
+
+async def launch_browser(playwright, headless=True):
+    """Launch Chromium, adding container flags in production"""
+    return await playwright.chromium.launch(
+        headless=headless,
+        args=CHROMIUM_ARGS if is_production_env() else []
+    )
+
+class ScrapeCancelled(Exception):
+    """Raised at a page boundary once a scrape has been cancelled"""
+
 
 class HiyaScraper:
     def __init__(self, email=None, password=None, manual_login=False, cookies=None):
@@ -25,6 +84,78 @@ class HiyaScraper:
         self.total_pages = 20
         self.context = None  # Store browser context for cookie updates
         self.device_cookies = []  # Store device trust cookies separately
+        self.output = None  # Streaming writer that receives rows page by page
+        self.keep_data = True  # Also keep all rows in self.data
+        self.record_count = 0
+        self.enrich_details = False  # Visit /phones/<id> detail pages after list extraction
+        self.detail_concurrency = 4
+        self.enricher = None
+        self.change_tracker = None  # Diffs rows against the previous run when set
+        self.change_report = None
+        self.reached_end = False  # True once pagination reached the last page of the table
+        self.filters = None  # ScrapeFilters - pushed down to the portal where possible
+        self.sorted_newest_first = False
+        self.pin_sort = os.environ.get('HIYA_PIN_SORT', '1') != '0'  # Page oldest first when the scrape reads every page
+        self.sorted_oldest_first = None  # Decided once per scrape by prepare_table
+        self.seen_phones = set()  # De-duplication index for the current scrape
+        self.table_total = None  # Row count from the pagination caption when the last page was read
+        self.index_loader = None  # store.IndexLoader - indexes rows for the /phones query API
+        self.memory_cap = None  # Records kept in memory before self.data spills to disk (only with keep_data=True)
+        self.watchdog = default_watchdog()  # Recycles the page/context when memory runs high
+        self.tracer = default_tracer()  # Saves Playwright traces of slow pages (HIYA_TRACING=1)
+        self.page = None  # Page currently driving the table (replaced when recycled)
+        self.pages_completed = 0
+        self.status = 'pending'  # complete, partial (failed after some rows) or failed
+        self.error = None
+        self.cancelled = threading.Event()  # Set from any thread to stop at the next page boundary
+        self.session_handle = None  # sessions.SessionStore handle the cookies came from
+        self.session_verified = False  # Cookies were verified server-side recently - skip the login checks
+        self.account = None  # Server-verified account keying per-account state (snapshots, diffs, index)
+        self.har_mode = None  # 'record' portal traffic into har_path, or 'replay' the run from it
+        self.har_path = None
+
+    def record_har(self, path):
+        """Record this scrape's portal traffic into a scrubbed HAR archive"""
+        self.har_mode, self.har_path = 'record', path
+        return self
+
+    def replay_har(self, path):
+        """Serve this scrape entirely from a recorded HAR archive (no login, no live portal)"""
+        self.har_mode, self.har_path = 'replay', path
+        return self
+
+    async def new_context(self, browser, cookies=None):
+        """Open a browser context for the scrape, recording or replaying HAR traffic when enabled"""
+        options = dict(CONTEXT_OPTIONS)
+        if self.har_mode == 'record':
+            options.update(har.record_options(self.har_path))
+        context = await browser.new_context(**options)
+        if self.har_mode != 'replay':
+            monitor_context(context)
+        if self.har_mode == 'replay':
+            await har.replay(context, self.har_path)
+        elif cookies:
+            await context.add_cookies(cookies)
+        return context
+
+    def cancel(self):
+        """Ask a running scrape to stop at the next page boundary"""
+        self.cancelled.set()
+
+    def result_summary(self):
+        """Outcome of the last scrape - what was collected and why it stopped early, if it did"""
+        return {
+            'status': self.status,
+            'records': self.record_count,
+            'pages_completed': self.pages_completed,
+            'total_pages': self.total_pages,
+            'reached_end': self.reached_end,
+            'error': self.error,
+        }
+
+    def check_cancelled(self):
+        if self.cancelled.is_set():
+            raise ScrapeCancelled(f"Scrape cancelled after {self.pages_completed} pages")
 
     def check_cookies_expired(self):
         """Check if session cookies are expired or about to expire"""
@@ -77,38 +208,15 @@ class HiyaScraper:
         # Preserve device trust cookies
         self.separate_device_cookies()
 
-        # Navigate to login page
+        # Submit credentials and follow the portal to wherever it lands
         print("📍 Navigating to login page...")
-        await page.goto(self.login_url, wait_until="domcontentloaded", timeout=60000)
-        await asyncio.sleep(2)
-
-        # Wait for login form
-        print("⏳ Waiting for login form...")
-        await page.wait_for_selector('input[type="email"], input[type="text"]', timeout=10000)
-
-        # Fill in credentials
-        print(f"🔑 Entering credentials for: {self.email}")
-        email_input = page.locator('input[type="email"], input[name="username"], input[name="email"]').first
-        await email_input.fill(self.email)
-
-        password_input = page.locator('input[type="password"], input[name="password"]').first
-        await password_input.fill(self.password)
+        await submit_credentials(page, self.login_url, self.email, self.password)
 
-        # Click login button
-        print("👆 Clicking login button...")
-        login_button = page.locator('button[type="submit"], button:has-text("Log in"), button:has-text("Continue")').first
-        await login_button.click()
-
-        # Wait for navigation after login
         print("⏳ Waiting for authentication...")
-        await asyncio.sleep(5)
-
-        # Check current URL
-        current_url = page.url
-        print(f"📍 Current URL: {current_url}")
+        outcome = await wait_for_login(page)
 
         # Check if we're asked for 2FA
-        if "mfa" in current_url.lower() or "verify" in current_url.lower():
+        if outcome == 'mfa':
             print("⚠️  2FA verification page detected!")
             print("💡 This should NOT happen if device cookies are valid")
             print("🔧 Possible solutions:")
@@ -116,17 +224,7 @@ class HiyaScraper:
             print("   2. Ensure auth0-mf cookie is included in HIYA_COOKIES")
             raise Exception("2FA required but cannot be automated. Please refresh device cookies.")
 
-        # Wait for successful redirect to business portal
-        try:
-            await page.wait_for_url("**/business.hiya.com/**", timeout=15000)
-            print("✅ Login successful! Skipped 2FA via device trust cookies")
-        except PlaywrightTimeout:
-            await asyncio.sleep(3)
-            current_url = page.url
-            if "business.hiya.com" in current_url:
-                print("✅ Login successful!")
-            else:
-                raise Exception(f"Login failed - unexpected URL: {current_url}")
+        print("✅ Login successful! Skipped 2FA via device trust cookies")
 
         # Capture fresh cookies
         print("🍪 Capturing fresh session cookies...")
@@ -146,8 +244,9 @@ class HiyaScraper:
 
         # Navigate to phones page
         print("📍 Navigating to phones page...")
-        await page.goto(self.phones_url, wait_until="domcontentloaded", timeout=60000)
-        await asyncio.sleep(2)
+        await throttle(self.phones_url)
+        await self.goto(page, self.phones_url)
+        await self.wait_for(page, TABLE_SELECTOR)
 
         print("="*60)
         print("✅ SESSION REFRESH COMPLETE")
@@ -166,33 +265,20 @@ class HiyaScraper:
 
         # Wait for user to reach the phones page (or any hiya.com page with registration)
         max_wait_time = 300  # 5 minutes max
-        start_time = asyncio.get_event_loop().time()
-
-        while True:
-            current_url = page.url
-
-            # Check if we've reached the target page
-            if "business.hiya.com" in current_url and "registration" in current_url:
-                print("✓ Login detected! You've reached the Hiya portal")
-                await asyncio.sleep(2)  # Small delay to ensure page is fully loaded
-                return True
-
-            # Check timeout
-            elapsed = asyncio.get_event_loop().time() - start_time
-            if elapsed > max_wait_time:
-                raise Exception("Manual login timeout - please try again")
-
-            # Check every 2 seconds
-            await asyncio.sleep(2)
+        try:
+            await page.wait_for_url(
+                lambda url: "business.hiya.com" in url and "registration" in url,
+                wait_until="domcontentloaded",
+                timeout=max_wait_time * 1000
+            )
+        except Exception:
+            raise Exception("Manual login timeout - please try again")
 
-            # Print progress every 10 seconds
-            if int(elapsed) % 10 == 0 and int(elapsed) > 0:
-                remaining = int(max_wait_time - elapsed)
-                print(f"⏳ Waiting for login... ({remaining}s remaining)")
+        print("✓ Login detected! You've reached the Hiya portal")
+        return True
 
     async def login(self, page):
         """Handle login to Hiya - supports cookie, manual, and automatic modes"""
-
         # Cookie-based authentication (preferred method)
         if self.cookies:
             print("Using cookie-based authentication...")
@@ -203,96 +289,37 @@ class HiyaScraper:
         if self.manual_login:
             # Manual login mode - open login page and wait for user
             print("Opening login page for manual authentication...")
-            await page.goto(self.login_url, wait_until="domcontentloaded", timeout=60000)
+            await throttle(self.login_url)
+            await self.goto(page, self.login_url)
             await self.wait_for_manual_login(page)
             print("✓ Manual login successful!")
             return
 
         # Automatic login mode (keeping old logic for backwards compatibility)
         print("Navigating to login page...")
-        await page.goto(self.login_url, wait_until="domcontentloaded", timeout=60000)
-
-        # Wait for login form
-        await page.wait_for_selector('input[type="email"], input[type="text"]', timeout=10000)
-
-        # Fill in credentials
-        print("Entering credentials...")
-        email_input = page.locator('input[type="email"], input[name="username"], input[name="email"]').first
-        await email_input.fill(self.email)
-
-        password_input = page.locator('input[type="password"], input[name="password"]').first
-        await password_input.fill(self.password)
-
-        # Click login button
-        login_button = page.locator('button[type="submit"], button:has-text("Log in"), button:has-text("Continue")').first
-        await login_button.click()
+        await submit_credentials(page, self.login_url, self.email, self.password)
 
-        # Wait for navigation after login
+        # "Remember this device" prompts are clicked through while waiting
         print("Waiting for authentication...")
-        await asyncio.sleep(5)
+        outcome = await wait_for_login(page)
+        if outcome == 'mfa':
+            raise Exception("2FA required - use /auth-and-capture to log in with a code and capture device cookies")
 
-        # Check for "Remember this device" or verification page
-        current_url = page.url
-        print(f"Current URL after login: {current_url}")
-
-        # Look for common verification/remember device buttons
-        try:
-            # Check for "Remember this device", "Trust this device", "Continue", "Yes", "Verify" buttons
-            verification_buttons = [
-                'button:has-text("Remember")',
-                'button:has-text("Trust")',
-                'button:has-text("Yes")',
-                'button:has-text("Continue")',
-                'button:has-text("Verify")',
-                'button:has-text("Skip")',
-                'button[type="submit"]'
-            ]
-
-            for selector in verification_buttons:
-                button = page.locator(selector).first
-                if await button.count() > 0:
-                    try:
-                        is_visible = await button.is_visible()
-                        if is_visible:
-                            print(f"Found verification button: {selector}")
-                            await button.click()
-                            print("✓ Clicked verification button")
-                            await asyncio.sleep(3)
-                            break
-                    except:
-                        continue
-        except Exception as e:
-            print(f"No verification button found or already past verification: {e}")
-
-        # Wait for final navigation to complete
-        try:
-            await page.wait_for_url("**/registration/**", timeout=15000)
-            print("✓ Login successful!")
-        except PlaywrightTimeout:
-            # Sometimes redirects take different paths
-            await asyncio.sleep(5)
-            current_url = page.url
-            print(f"Final URL: {current_url}")
-            if "hiya.com" in current_url and "login" not in current_url:
-                print("✓ Login successful!")
-            else:
-                raise Exception("Login failed - still on login page")
+        print(f"✓ Login successful! ({page.url})")
     
     async def extract_table_data(self, page):
         """Extract data from the current page using MUI table structure"""
+        from playwright.async_api import TimeoutError as PlaywrightTimeout
         print("Extracting table data...")
         
         # Wait for table to be visible
-        await page.wait_for_selector('tbody.MuiTableBody-root', timeout=15000)
+        await self.wait_for(page, TABLE_SELECTOR)
         
         # Wait for actual phone number links to appear
         try:
-            await page.wait_for_selector('tbody.MuiTableBody-root a[href*="/phones/"]', timeout=10000)
-            # Reduced wait time - data should be loaded by now
-            await asyncio.sleep(1)
+            await self.wait_for(page, PHONE_LINK_SELECTOR, 'rows')
         except PlaywrightTimeout:
             print("⚠ Warning: Phone links not found, might be loading...")
-            await asyncio.sleep(2)
         
         # Get all table rows from tbody
         rows = await page.locator('tbody.MuiTableBody-root tr.MuiTableRow-root').all()
@@ -328,8 +355,10 @@ class HiyaScraper:
                 if len(cells) < 7:
                     continue
                 
-                # Extract phone number (2nd cell, inside <a> tag)
-                phone_number = await cells[1].locator('a').inner_text()
+                # Extract phone number and detail link (2nd cell, inside <a> tag)
+                phone_link = cells[1].locator('a')
+                phone_number = await phone_link.inner_text()
+                detail_path = await phone_link.get_attribute('href') or ''
                 
                 # Extract submitted date and email (3rd cell, has two spans)
                 spans = await cells[2].locator('span').all()
@@ -359,16 +388,17 @@ class HiyaScraper:
                 # Extract registration status (8th cell, if exists)
                 registration_status = await cells[7].inner_text() if len(cells) > 7 else ''
                 
-                row_data = {
-                    'phone_number': phone_number.strip(),
-                    'submitted_date': submitted_date.strip(),
-                    'submitted_email': submitted_email.strip(),
-                    'registration_job_name': job_name.strip(),
-                    'branded_call': branded_call.strip(),
-                    'spam_labeling': spam_labeling.strip(),
-                    'spam_category': spam_category.strip(),
-                    'registration_status': registration_status.strip(),
-                }
+                row_data = PhoneRecord(
+                    detail_path=detail_path,
+                    phone_number=phone_number.strip(),
+                    submitted_date=submitted_date.strip(),
+                    submitted_email=submitted_email.strip(),
+                    registration_job_name=job_name.strip(),
+                    branded_call=branded_call.strip(),
+                    spam_labeling=spam_labeling.strip(),
+                    spam_category=spam_category.strip(),
+                    registration_status=registration_status.strip(),
+                )
                 
                 data.append(row_data)
                 
@@ -393,20 +423,17 @@ class HiyaScraper:
             is_disabled = await next_button.is_disabled()
             if is_disabled:
                 print("Next button is disabled - reached last page")
+                self.reached_end = True
                 return False
             
             # Click the next button
             print("Clicking next page button...")
+            marker = await self.first_row_marker(page)
+            await throttle(self.phones_url)
             await next_button.click()
             
-            # Wait for page to load
-            await asyncio.sleep(3)
-            
-            # Wait for table to update with new data
-            await page.wait_for_selector('tbody.MuiTableBody-root', timeout=10000)
-            
-            # Additional wait for data to populate
-            await asyncio.sleep(2)
+            # Wait for the table to show the next page's rows
+            await self.wait_for_page_change(page, marker)
             
             return True
             
@@ -414,38 +441,312 @@ class HiyaScraper:
             print(f"Error clicking next button: {e}")
             return False
     
+    async def click_previous_page(self, page):
+        """Step back one page of the table"""
+        prev_button = page.locator('button[data-id="pagination-previous-button"], button[aria-label="Go to previous page"]').first
+        if await prev_button.count() == 0 or await prev_button.is_disabled():
+            return False
+        marker = await self.first_row_marker(page)
+        await throttle(self.phones_url)
+        await prev_button.click()
+        await self.wait_for_page_change(page, marker)
+        return True
+
+    async def read_table_total(self, page):
+        """Total row count from the pagination caption (e.g. '21–40 of 523'), or None"""
+        try:
+            caption = page.locator('.MuiTablePagination-displayedRows').first
+            if await caption.count() == 0:
+                return None
+            match = re.search(r'of\s+(?:more than\s+)?([\d,]+)', await caption.inner_text())
+            return int(match.group(1).replace(',', '')) if match else None
+        except Exception:
+            return None
+
+    async def reads_whole_table(self, page):
+        """Whether the page budget covers every page of the table, from the caption (e.g. '1–25 of 523')"""
+        try:
+            caption = page.locator('.MuiTablePagination-displayedRows').first
+            if await caption.count() == 0:
+                return False
+            match = re.search(r'([\d,]+)\s*[–-]\s*([\d,]+)\s+of\s+([\d,]+)', await caption.inner_text())
+        except Exception:
+            return False
+        if not match:
+            return False
+        first, last, total = (int(group.replace(',', '')) for group in match.groups())
+        per_page = last - first + 1
+        return per_page > 0 and math.ceil(total / per_page) <= self.total_pages
+
+    def take_unseen(self, records):
+        """Drop rows already collected this scrape - they reappear when rows shift across pages"""
+        unseen = []
+        for record in records:
+            phone = record['phone_number']
+            if phone not in self.seen_phones:
+                self.seen_phones.add(phone)
+                unseen.append(record)
+        return unseen
+
+    async def refetch_previous_page(self, page, all_data, page_number):
+        """Re-read the previous page to pick up rows that shifted back across the boundary"""
+        print(f"↩️  Table shrank while paging - re-reading page {page_number} for rows that moved back")
+        if not await self.click_previous_page(page):
+            print("⚠ Could not step back to re-read the boundary page")
+            return
+        recovered = await self.process_page_records(self.take_unseen(await self.extract_table_data(page)), all_data)
+        print(f"✓ Recovered {len(recovered)} shifted records from page {page_number}")
+        if not await self.click_next_page(page):
+            raise Exception(f"Could not return to page {page_number + 1} after re-reading page {page_number}")
+
+    async def wait_for_table_refresh(self, page):
+        """Wait for the table to settle after changing its sort, search or filters"""
+        try:
+            await latency.wait('network_idle', lambda timeout: page.wait_for_load_state("networkidle", timeout=timeout))
+        except Exception:
+            pass
+        await self.wait_for(page, TABLE_SELECTOR)
+
+    async def goto(self, page, url):
+        """Navigate with a timeout derived from recent page loads"""
+        return await latency.wait('goto', lambda timeout: page.goto(url, wait_until="domcontentloaded", timeout=timeout))
+
+    async def wait_for(self, page, selector, op='table'):
+        """Wait for a selector with a timeout derived from recent waits of the same kind"""
+        return await latency.wait(op, lambda timeout: page.wait_for_selector(selector, timeout=timeout))
+
+    async def first_row_marker(self, page):
+        """Text of the table's first row, to tell when a click has replaced the rows"""
+        try:
+            return await page.evaluate(FIRST_ROW_SCRIPT)
+        except Exception:
+            return None
+
+    async def wait_for_page_change(self, page, marker):
+        """Poll until the first row differs from marker instead of sleeping a fixed time"""
+        from playwright.async_api import TimeoutError as PlaywrightTimeout
+        try:
+            await latency.wait('page_change', lambda timeout: page.wait_for_function(
+                PAGE_CHANGED_SCRIPT, arg=marker, timeout=timeout, polling=latency.poll_interval('page_change')))
+        except PlaywrightTimeout:
+            print("⚠ Warning: Table rows did not change after paging, reading them anyway")
+        await self.wait_for(page, TABLE_SELECTOR)
+
+    async def sort_table(self, page, column_text, direction):
+        """Set a column's sort direction via its header (aria-sort 'ascending'/'descending')"""
+        header = page.locator(f'thead th:has-text("{column_text}")').first
+        if await header.count() == 0:
+            print(f"⚠ No '{column_text}' column header to sort by")
+            return False
+
+        for _ in range(3):
+            if await header.get_attribute('aria-sort') == direction:
+                print(f"✓ Table sorted by {column_text} ({direction})")
+                return True
+            sort_label = header.locator('.MuiTableSortLabel-root')
+            await throttle(self.phones_url)
+            if await sort_label.count() > 0:
+                await sort_label.first.click()
+            else:
+                await header.click()
+            await self.wait_for_table_refresh(page)
+
+        print(f"⚠ Could not sort by {column_text} ({direction})")
+        return False
+
+    async def search_table(self, page, text):
+        """Type into the table's search box, if the portal shows one"""
+        search_input = page.locator('input[type="search"], input[placeholder*="Search" i]').first
+        if await search_input.count() == 0:
+            return False
+        await throttle(self.phones_url)
+        await search_input.fill(text)
+        await search_input.press('Enter')
+        await self.wait_for_table_refresh(page)
+        print(f"✓ Searched table for '{text}'")
+        return True
+
+    async def apply_filters(self, page):
+        """Push filters down to the portal before pagination starts"""
+        pushed = []
+
+        query = self.filters.query_string()
+        if query:
+            await throttle(self.phones_url)
+            await self.goto(page, f"{self.phones_url}?{query}")
+            await self.wait_for_table_refresh(page)
+            pushed.append('query')
+
+        if self.filters.job_name and 'job_name' not in QUERY_PARAMS:
+            if await self.search_table(page, self.filters.job_name):
+                pushed.append('search')
+
+        if self.filters.date_from:
+            # Newest first, so pagination can stop once pages fall before date_from
+            self.sorted_newest_first = await self.sort_table(page, 'Submitted', 'descending')
+            if self.sorted_newest_first:
+                pushed.append('sort')
+
+        print(f"🔎 Filters {self.filters.to_dict()} - pushed down via: {', '.join(pushed) or 'none'}, "
+              "client-side filter applied to every page")
+        return pushed
+
+    async def prepare_table(self, page):
+        """Push filters down and pin the sort order before paging"""
+        if self.filters:
+            await self.apply_filters(page)
+        if self.sorted_oldest_first is None:
+            # A page-limited scrape keeps the portal's own order - oldest first would return the oldest rows
+            self.sorted_oldest_first = (self.pin_sort and not self.sorted_newest_first
+                                        and await self.reads_whole_table(page))
+        if self.sorted_oldest_first:
+            # Oldest first: registrations that arrive mid-scrape land on the last page
+            # instead of pushing every row we have not read yet across page boundaries
+            await self.sort_table(page, 'Submitted', 'ascending')
+
+    async def open_phones_page(self, page):
+        """Load the phones table in a page and restore the filters and sort order"""
+        await throttle(self.phones_url)
+        await self.goto(page, self.phones_url)
+        await self.wait_for(page, TABLE_SELECTOR)
+        await self.prepare_table(page)
+
+    async def recycle_page(self, page, scope, page_number):
+        """Replace the page (or whole context) and return a fresh page positioned at page_number"""
+        old_context = None
+        if scope == 'context' and self.har_mode == 'record':
+            # The archive is written when its context closes - keep recording into the same one
+            scope = 'page'
+        if scope == 'context':
+            # Carry the live session over - cookies may have been refreshed mid-run
+            cookies = await self.context.cookies()
+            old_context = self.context
+            self.context = await self.new_context(self.context.browser, cookies)
+            if self.tracer:
+                await self.tracer.attach(self.context)
+            if self.enricher:
+                await self.enricher.close()
+                self.enricher = DetailEnricher(self.context, self.base_url, concurrency=self.detail_concurrency,
+                                               cache=self.enricher.cache)
+
+        new_page = await self.context.new_page()
+        if old_context:
+            await old_context.close()
+        else:
+            await page.close()
+        self.page = new_page
+
+        await self.open_phones_page(new_page)
+
+        # MUI pagination has no addressable page URL, so step forward to where we were
+        for _ in range(page_number - 1):
+            if not await self.click_next_page(new_page):
+                return None
+        print(f"♻️  Resumed at page {page_number} on a fresh {scope}")
+        return new_page
+
+    async def process_page_records(self, page_data, all_data):
+        """Filter, normalize, enrich, diff and write out one page of extracted records"""
+        if self.filters:
+            page_data = self.filters.apply(page_data)
+        if not page_data:
+            return page_data
+
+        # Typed columns (E.164, ISO timestamps, enum codes) alongside the raw strings
+        normalize_batch(page_data)
+        if self.enricher:
+            # Merge detail-page attributes before the rows are written out
+            await self.enricher.enrich(page_data)
+        if self.change_tracker:
+            self.change_tracker.observe(page_data)
+        self.record_count += len(page_data)
+        if self.output:
+            # Stream the page out and flush on the page boundary
+            self.output.write_rows(page_data)
+            self.output.flush()
+        if self.index_loader:
+            self.index_loader.write_rows(page_data)
+        if self.keep_data:
+            all_data.extend(page_data)
+        return page_data
+
     async def handle_pagination(self, page):
         """Navigate through all pages using next button clicks"""
-        all_data = []
+        all_data = RecordSink(self.memory_cap)
+        self.record_count = 0
+        self.reached_end = False
+        self.pages_completed = 0
+        self.seen_phones = set()
+        self.table_total = None
         
         # Total pages is 20
         total_pages = self.total_pages
         current_page = 1
         
         while current_page <= total_pages:
+            self.check_cancelled()
             print(f"\n--- Processing Page {current_page} of {total_pages} ---")
+            if self.tracer:
+                await self.tracer.begin(current_page)
+
+            # Rows removed ahead of us shift later rows back onto the page we just read
+            total = await self.read_table_total(page)
+            if total is not None and self.table_total is not None and total < self.table_total and current_page > 1:
+                await self.refetch_previous_page(page, all_data, current_page - 1)
+            self.table_total = total
             
             # Extract data from current page
             page_data = await self.extract_table_data(page)
+            if self.tracer:
+                await self.tracer.finish(current_page)
             
             if page_data:
-                all_data.extend(page_data)
-                print(f"✓ Extracted {len(page_data)} records from page {current_page}")
+                # With the table sorted newest first, a page entirely older than
+                # the date filter means no later page can match either
+                past_range = self.sorted_newest_first and self.filters.older_than_range(page_data)
+
+                unseen = self.take_unseen(page_data)
+                if len(unseen) < len(page_data):
+                    print(f"↔️  {len(page_data) - len(unseen)} rows already collected on an earlier page (table shifted)")
+
+                kept = await self.process_page_records(unseen, all_data)
+                self.pages_completed = current_page
+                print(f"✓ Extracted {len(kept)} records from page {current_page}"
+                      + (f" ({len(unseen) - len(kept)} filtered out)" if len(kept) < len(unseen) else ""))
+
+                if past_range:
+                    print("Page is older than the requested date range, stopping pagination")
+                    self.reached_end = True
+                    break
             else:
                 print(f"⚠ No data found on page {current_page}")
                 # If we hit an empty page, we might be done
                 if current_page > 1:
                     print("No more data, stopping pagination")
+                    self.reached_end = True
                     break
             
-            print(f"Total records so far: {len(all_data)}")
+            print(f"Total records so far: {self.record_count}")
             
             # Check if we're on the last page
             if current_page >= total_pages:
                 print("Reached target page count")
                 break
             
-            # Click next page button
+            if self.watchdog:
+                scope = await self.watchdog.check(page, current_page)
+                if scope:
+                    # The fresh page is positioned on the next page directly
+                    page = await self.recycle_page(page, scope, current_page + 1)
+                    if page is None:
+                        print("Could not restore pagination position after recycling, stopping")
+                        break
+                    current_page += 1
+                    continue
+
+            # Click next page button - the next page's time includes waiting for it to load
+            if self.tracer:
+                await self.tracer.begin(current_page + 1)
             success = await self.click_next_page(page)
             
             if not success:
@@ -456,146 +757,229 @@ class HiyaScraper:
         
         return all_data
     
-    async def scrape(self):
-        """Main scraping logic"""
+    async def check_session(self, browser):
+        """Check whether the stored cookies reach the phones page without a login redirect"""
+        context = await browser.new_context(**CONTEXT_OPTIONS)
+        monitor_context(context)
+        try:
+            if self.cookies:
+                await context.add_cookies(self.cookies)
+            page = await context.new_page()
+            await throttle(self.phones_url)
+            await self.goto(page, self.phones_url)
+            # Logged-out users are sent to login client-side, after domcontentloaded
+            return await wait_for_landing(page) == 'table'
+        finally:
+            await context.close()
+
+    async def scrape(self, browser=None):
+        """Main scraping logic - reuses a shared browser when one is passed in"""
+        if browser is not None:
+            return await self._scrape_with_browser(browser)
+
+        from playwright.async_api import async_playwright
+
         async with async_playwright() as p:
             # Launch browser
             print("Launching browser...")
 
             # FIXED: Use headless mode for production, but NEVER for manual login
-            is_production = os.environ.get('RAILWAY_ENVIRONMENT') or os.environ.get('PORT')
-
-            # Force headless=False for manual login mode
-            use_headless = bool(is_production) and not self.manual_login
-
-            browser = await p.chromium.launch(
-                headless=use_headless,  # False for manual login or local, True for production
-                args=[
-                    '--no-sandbox',
-                    '--disable-setuid-sandbox',
-                    '--disable-dev-shm-usage',
-                    '--disable-gpu'
-                ] if is_production else []
-            )
+            use_headless = is_production_env() and not self.manual_login
 
-            self.context = await browser.new_context(
-                viewport={'width': 1920, 'height': 1080},
-                user_agent='Mozilla/5.0 (Macintosh; Intel Mac OS X 10_15_7) AppleWebKit/537.36'
-            )
+            browser = await launch_browser(p, headless=use_headless)
+            try:
+                return await self._scrape_with_browser(browser)
+            finally:
+                await browser.close()
 
-            # Load cookies if provided
-            if self.cookies:
-                print(f"Loading {len(self.cookies)} cookies into browser context...")
-                await self.context.add_cookies(self.cookies)
+    async def _scrape_with_browser(self, browser):
+        """Run the scrape in a fresh context on the given browser"""
+        is_production = is_production_env()
+        self.status = 'running'
+        self.error = None
+        self.sorted_oldest_first = None
 
-            page = await self.context.new_page()
+        # Load cookies if provided
+        if self.cookies and self.har_mode != 'replay':
+            print(f"Loading {len(self.cookies)} cookies into browser context...")
+        self.context = await self.new_context(browser, self.cookies)
+        if self.tracer:
+            await self.tracer.attach(self.context)
 
-            try:
-                # Check if cookies need refreshing
-                needs_refresh = False
-                if self.cookies:
-                    print("\n🔍 Checking cookie expiration status...")
-                    needs_refresh = self.check_cookies_expired()
-
-                    if needs_refresh:
-                        print("⚠️  Session cookies are expired or expiring soon")
-
-                        # Check if we have credentials for auto-refresh
-                        if self.email and self.password:
-                            print("✅ Credentials available - will attempt automatic session refresh")
-                            await self.refresh_session_cookies(page)
-                        else:
-                            print("❌ No credentials provided for automatic refresh")
-                            raise Exception("Cookies expired and no credentials available for auto-refresh. Please run capture_cookies.py or provide HIYA_EMAIL and HIYA_PASSWORD")
+        page = await self.context.new_page()
+        self.page = page
+        replay_token = har.replaying.set(self.har_mode == 'replay')
+
+        try:
+            if self.output:
+                self.output.open()
+
+            # Check if cookies need refreshing
+            needs_refresh = False
+            if self.cookies and self.har_mode != 'replay' and not self.session_verified:
+                print("\n🔍 Checking cookie expiration status...")
+                needs_refresh = self.check_cookies_expired()
+
+                if needs_refresh:
+                    print("⚠️  Session cookies are expired or expiring soon")
+
+                    # Check if we have credentials for auto-refresh
+                    if self.email and self.password:
+                        print("✅ Credentials available - will attempt automatic session refresh")
+                        await self.refresh_session_cookies(page)
                     else:
-                        print("✅ Session cookies are still valid")
-
-                # Login (or skip if using cookies)
-                if self.cookies and not needs_refresh:
-                    # Skip login, go directly to phones page
-                    print("Navigating directly to phones page with cookies...")
-                    await page.goto(self.phones_url, wait_until="domcontentloaded", timeout=60000)
-
-                    # Verify we're logged in by checking URL
-                    await asyncio.sleep(3)
-                    current_url = page.url
-
-                    if "login" in current_url or "auth" in current_url:
-                        print("⚠️  Redirected to login page - cookies may be invalid")
-
-                        # Try automatic refresh if credentials available
-                        if self.email and self.password:
-                            print("🔄 Attempting automatic session refresh...")
-                            await self.refresh_session_cookies(page)
-                        else:
-                            raise Exception("Cookies expired or invalid - please capture new cookies")
-
-                    if "business.hiya.com" not in current_url:
-                        raise Exception("Failed to access Hiya business portal - cookies may be expired")
-
-                    print("✓ Successfully authenticated with cookies!")
-                elif not needs_refresh:
-                    # Traditional login flow (no cookies provided)
-                    await self.login(page)
-
-                    # Navigate to phones page (only if not using cookies)
-                    print(f"\nNavigating to phones page...")
-                    await page.goto(self.phones_url, wait_until="domcontentloaded", timeout=60000)
-                
-                # Wait for table to appear
-                print("Waiting for table to load...")
-                await page.wait_for_selector('tbody.MuiTableBody-root', timeout=30000)
-                await asyncio.sleep(3)
-                
-                # FIXED: Only save screenshots locally, not in production
-                if not is_production:
-                    await page.screenshot(path="hiya_page_debug.png")
-                    print("✓ Screenshot saved as hiya_page_debug.png")
-                
-                # Extract all data with pagination
-                print("\nStarting data extraction...")
-                self.data = await self.handle_pagination(page)
-                
-                print(f"\n{'='*50}")
-                print(f"✓ Scraping complete!")
-                print(f"Total records extracted: {len(self.data)}")
-                print(f"{'='*50}\n")
-                
-            except Exception as e:
-                print(f"\n❌ Error during scraping: {e}")
-                # FIXED: Only save error screenshots locally
-                if not is_production:
-                    await page.screenshot(path="hiya_error.png")
-                    print("Error screenshot saved as hiya_error.png")
-                raise
+                        print("❌ No credentials provided for automatic refresh")
+                        raise Exception("Cookies expired and no credentials available for auto-refresh. Please run capture_cookies.py or provide HIYA_EMAIL and HIYA_PASSWORD")
+                else:
+                    print("✅ Session cookies are still valid")
+
+            # Login (or skip if using cookies)
+            if self.har_mode == 'replay':
+                # Every response comes from the archive - there is no session to check
+                print(f"📼 Replaying portal traffic from {self.har_path}")
+                await self.goto(page, self.phones_url)
+            elif self.cookies and not needs_refresh:
+                # Skip login, go directly to phones page
+                print("Navigating directly to phones page with cookies...")
+                await throttle(self.phones_url)
+                await self.goto(page, self.phones_url)
+
+                # Verify we're logged in - the table renders or the portal bounces us to auth
+                # (a recently verified session goes straight to the table wait, which still fails on a bounce)
+                landing = 'table' if self.session_verified else await wait_for_landing(page)
+
+                if landing == 'login' or is_login_url(page.url):
+                    print("⚠️  Redirected to login page - cookies may be invalid")
+
+                    # Try automatic refresh if credentials available
+                    if self.email and self.password:
+                        print("🔄 Attempting automatic session refresh...")
+                        await self.refresh_session_cookies(page)
+                    else:
+                        raise Exception("Cookies expired or invalid - please capture new cookies")
+
+                if "business.hiya.com" not in page.url:
+                    raise Exception("Failed to access Hiya business portal - cookies may be expired")
+
+                print("✓ Successfully authenticated with cookies!")
+            elif not needs_refresh:
+                # Traditional login flow (no cookies provided)
+                await self.login(page)
+
+                # Navigate to phones page (only if not using cookies)
+                print(f"\nNavigating to phones page...")
+                await throttle(self.phones_url)
+                await self.goto(page, self.phones_url)
             
-            finally:
-                await browser.close()
+            # Wait for table to appear
+            print("Waiting for table to load...")
+            await self.wait_for(page, TABLE_SELECTOR)
+            
+            # FIXED: Only save screenshots locally, not in production
+            if not is_production:
+                await page.screenshot(path="hiya_page_debug.png")
+                print("✓ Screenshot saved as hiya_page_debug.png")
+            
+            await self.prepare_table(page)
+
+            self.check_cancelled()
+
+            if self.enrich_details:
+                self.enricher = DetailEnricher(self.context, self.base_url, concurrency=self.detail_concurrency,
+                                               cache=default_cache(self.account))
+
+            # Extract all data with pagination
+            print("\nStarting data extraction...")
+            self.data = await self.handle_pagination(page)
+
+            if self.change_tracker:
+                # A filtered scrape never sees the whole table, so nothing counts as removed
+                self.change_report = self.change_tracker.finish(complete=self.reached_end and not self.filters)
+
+            if self.index_loader:
+                self.index_loader.commit(complete=self.reached_end)
+                self.index_loader = None
+            
+            self.status = 'complete'
+
+            print(f"\n{'='*50}")
+            print(f"✓ Scraping complete!")
+            print(f"Total records extracted: {self.record_count}")
+            print(f"{'='*50}\n")
+            
+        except (Exception, asyncio.CancelledError) as e:
+            print(f"\n❌ Error during scraping: {e}")
+            # Rows already streamed to the output survive as a partial result
+            self.error = str(e) or type(e).__name__
+            self.status = 'partial' if self.record_count else 'failed'
+            if self.index_loader:
+                self.index_loader.rollback()
+                self.index_loader = None
+            # FIXED: Only save error screenshots locally
+            if not is_production:
+                try:
+                    await self.page.screenshot(path="hiya_error.png")
+                    print("Error screenshot saved as hiya_error.png")
+                except Exception:
+                    pass
+            raise
         
+        finally:
+            if self.enricher:
+                await self.enricher.close()
+                self.enricher = None
+            self.close_output()
+            if self.tracer:
+                await self.tracer.close()
+            if self.session_handle and self.pages_completed:
+                # Keep rolling session cookies so the stored session stays current
+                try:
+                    self.cookies = await self.context.cookies()
+                except Exception:
+                    pass
+            await self.context.close()
+            self.page = None
+            latency.save()
+            if self.har_mode == 'record' and os.path.exists(self.har_path):
+                har.scrub_har(self.har_path)
+            har.replaying.reset(replay_token)
+
         return self.data
     
+    def open_output(self, filename, fmt='csv', extras='ignore', keep_data=False):
+        """Set up a schema-fixed writer that receives rows page by page during scrape()"""
+        # With keep_data=False rows are only streamed out and self.data stays empty
+        # The file is opened inside scrape(), whose cleanup is what closes it
+        self.output = get_writer(fmt, filename, extras=extras)
+        self.keep_data = keep_data
+        print(f"✓ Streaming {normalize_format(fmt)} output to {filename}")
+        return self.output
+
+    def close_output(self):
+        """Close the streaming writer opened by open_output()"""
+        if self.output:
+            self.output.close()
+            print(f"✓ {self.output.rows_written} records written to {self.output.filename}")
+            self.output = None
+
     def save_to_csv(self, filename=None):
         """Save scraped data to CSV"""
+        return self.export(filename, 'csv')
+
+    def export(self, filename=None, fmt='csv', extras='ignore'):
+        """Save scraped data in the requested format (csv, csv.gz, ndjson, parquet)"""
+        fmt = normalize_format(fmt)
+
         if not self.data:
             print("No data to save!")
             return
-        
+
         if filename is None:
             timestamp = datetime.now().strftime("%Y%m%d_%H%M%S")
-            filename = f"hiya_phones_{timestamp}.csv"
-        
-        # Get all unique keys from all records
-        fieldnames = set()
-        for record in self.data:
-            fieldnames.update(record.keys())
-        fieldnames = sorted(list(fieldnames))
-        
-        with open(filename, 'w', newline='', encoding='utf-8') as csvfile:
-            writer = csv.DictWriter(csvfile, fieldnames=fieldnames)
-            writer.writeheader()
-            writer.writerows(self.data)
-        
-        print(f"✓ Data saved to {filename}")
+            filename = f"hiya_phones_{timestamp}{format_extension(fmt)}"
+
+        count = export_records(self.data, filename, fmt, extras=extras)
+        print(f"✓ {count} records saved to {filename} ({fmt})")
         return filename
 
 
@@ -624,7 +1008,7 @@ async def main():
         # Print sample
         if data:
             print("\nSample of extracted data:")
-            print(json.dumps(data[0], indent=2))
+            print(json.dumps(data.first().to_dict(), indent=2))
             
     except Exception as e:
         print(f"\n❌ Scraping failed: {e}")
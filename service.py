@@ -0,0 +1,594 @@
+"""
+Framework-neutral pieces of the HTTP API
+Shared by the Flask (api.py) and ASGI (asgi.py) entry points so both
+serve the same routes with the same payloads and headers
+"""
+
+import base64
+import hashlib
+import hmac
+import json
+import os
+import tempfile
+import time
+from datetime import datetime
+
+from scraper import HiyaScraper, CONTEXT_OPTIONS, decode_cookies
+from runtime import runtime
+from changes import ChangeTracker
+from ratelimit import monitor_context, metrics as rate_limit_metrics
+from snapshots import SnapshotStore
+from filters import ScrapeFilters
+from store import get_store
+from exporters import normalize_format, format_extension
+from auth import submit_credentials, wait_for_login, submit_mfa_code, is_mfa_url
+from mfa import pending_logins, MfaRequired
+from sessions import get_sessions
+from probe import session_probe
+from latency import latency
+from settings import env_flag
+from jobs import jobs
+from normalize import cache_stats as normalization_cache_stats
+
+# Response headers the web front end reads (exposed through CORS)
+EXPOSED_HEADERS = ['X-Snapshot-Age', 'X-Snapshot-Created', 'X-Snapshot-Records', 'X-Change-Summary',
+                   'X-Scrape-Status', 'X-Scrape-Error', 'X-Pages-Completed', 'X-Records']
+
+# Seconds between SSE progress events while a scrape runs
+STREAM_PROGRESS_SECONDS = float(os.environ.get('HIYA_STREAM_PROGRESS_SECONDS', 2))
+
+# Probe cookies over plain HTTP before launching a browser for them
+PROBE_ENABLED = env_flag('HIYA_PROBE', default=True)
+
+# Lets a client read the configured account's stored results without a session (Authorization: Bearer <token>)
+API_TOKEN = os.environ.get('HIYA_API_TOKEN')
+
+NO_ENV_COOKIES_ERROR = 'No cookies configured. Please run capture_cookies.py and add HIYA_COOKIES to Railway environment variables.'
+
+
+def load_cookies_from_env():
+    """Load cookies from environment variable"""
+    cookies_b64 = os.environ.get('HIYA_COOKIES')
+    if not cookies_b64:
+        return None
+
+    try:
+        return decode_cookies(cookies_b64)
+    except Exception as e:
+        print(f"Error loading cookies from environment: {e}")
+        return None
+
+
+def check_cookie_health(cookies):
+    """Check the health status of cookies"""
+    if not cookies:
+        return {
+            'status': 'missing',
+            'message': 'No cookies configured',
+            'session_valid': False,
+            'device_trust_valid': False
+        }
+
+    current_time = time.time()
+
+    # Check session cookies
+    session_cookies = ['auth0', 'auth0_compat', 'appSession.0', 'appSession.1']
+    session_valid = False
+    session_expires_in = 0
+
+    for cookie in cookies:
+        if cookie.get('name') in session_cookies:
+            expires = cookie.get('expires', -1)
+            if expires == -1 or expires > current_time:
+                session_valid = True
+                if expires > 0:
+                    session_expires_in = max(session_expires_in, expires - current_time)
+
+    # Check device trust cookies (auth0-mf for 2FA skip)
+    device_cookies = ['auth0-mf', 'auth0-mf_compat', 'did', 'did_compat']
+    device_trust_valid = False
+    device_expires_in = 0
+
+    for cookie in cookies:
+        if cookie.get('name') in device_cookies:
+            expires = cookie.get('expires', -1)
+            if expires == -1 or expires > current_time:
+                device_trust_valid = True
+                if expires > 0:
+                    device_expires_in = max(device_expires_in, expires - current_time)
+
+    # Determine status
+    if session_valid and device_trust_valid:
+        status = 'healthy'
+        message = 'All cookies valid'
+    elif session_valid and not device_trust_valid:
+        status = 'warning'
+        message = 'Session valid but device trust expired (2FA may be required)'
+    elif not session_valid and device_trust_valid:
+        status = 'auto_refresh'
+        message = 'Session expired but can auto-refresh (device trusted)'
+    else:
+        status = 'expired'
+        message = 'All cookies expired'
+
+    return {
+        'status': status,
+        'message': message,
+        'session_valid': session_valid,
+        'session_expires_in_hours': round(session_expires_in / 3600, 1) if session_expires_in > 0 else 0,
+        'device_trust_valid': device_trust_valid,
+        'device_expires_in_days': round(device_expires_in / 86400, 1) if device_expires_in > 0 else 0
+    }
+
+
+def scrape_options(data):
+    """Export format and filters of a scrape request - raises ValueError when either is invalid"""
+    return normalize_format(data.get('format')), ScrapeFilters.from_dict(data.get('filters'))
+
+
+def configure_scraper(scraper, data):
+    """Apply the common scrape options from a request body"""
+    scraper.total_pages = data.get('pages', 20)
+    scraper.enrich_details = bool(data.get('enrich', False))
+    scraper.filters = ScrapeFilters.from_dict(data.get('filters'))
+    # Per-account state is only touched for an account the server has verified
+    if data.get('diff'):
+        if not scraper.account:
+            raise ValueError('Change tracking needs a verified account - exchange the cookies for a session '
+                             'with POST /sessions and scrape with it')
+        scraper.change_tracker = ChangeTracker(scraper.account)
+    if not scraper.filters and scraper.account:
+        # Unfiltered results replace the indexed copy served by /phones
+        scraper.index_loader = get_store().loader(scraper.account)
+    return scraper
+
+
+def scrape_headers(scraper):
+    """Headers describing a finished scrape - the change summary and whether the export is complete or partial"""
+    headers = {}
+    if scraper.change_report:
+        headers['X-Change-Summary'] = json.dumps(scraper.change_report['summary'])
+    summary = scraper.result_summary()
+    headers['X-Scrape-Status'] = summary['status']
+    headers['X-Pages-Completed'] = str(summary['pages_completed'])
+    headers['X-Records'] = str(summary['records'])
+    if summary['error']:
+        # Portal messages can carry curly quotes and the like - headers must stay latin-1 encodable
+        message = ' '.join(summary['error'].split())[:500]
+        headers['X-Scrape-Error'] = message.encode('ascii', errors='replace').decode('ascii')
+    return headers
+
+
+def snapshot_headers(meta):
+    """Headers reporting a served snapshot's age"""
+    return {
+        'X-Snapshot-Age': str(int(meta['age'])),
+        'X-Snapshot-Created': datetime.fromtimestamp(meta['created_at']).isoformat(timespec='seconds'),
+        'X-Snapshot-Records': str(meta['records']),
+    }
+
+
+def export_filename(fmt):
+    """Download name for an export"""
+    return f'hiya_phones_{datetime.now().strftime("%Y%m%d_%H%M%S")}{format_extension(fmt)}'
+
+
+# Formats that can be sent inline as text in SSE events
+TEXT_FORMATS = ('csv', 'ndjson')
+
+
+def open_export(scraper, fmt):
+    """Stream the scrape straight into a temporary file in the requested format, returning its path"""
+    with tempfile.NamedTemporaryFile(delete=False, suffix=format_extension(fmt)) as tmp:
+        filename = tmp.name
+
+    # Detail attributes are not part of the fixed schema - pack them into the extras column
+    scraper.open_output(filename, fmt, extras='pack' if scraper.enrich_details else 'ignore')
+    return filename
+
+
+def remove_file(filename):
+    try:
+        os.unlink(filename)
+    except OSError:
+        pass
+
+
+# Size of each SSE export chunk, so the stream never holds the whole export in memory
+STREAM_CHUNK_BYTES = int(os.environ.get('HIYA_STREAM_CHUNK_BYTES', 64 * 1024))
+
+
+def stream_export_events(filename, fmt):
+    """Yield an export file as SSE chunk events - whole lines for text formats, base64 for binary"""
+    index = 0
+    if fmt in TEXT_FORMATS:
+        with open(filename, 'r', encoding='utf-8', newline='') as f:
+            while True:
+                lines = f.readlines(STREAM_CHUNK_BYTES)
+                if not lines:
+                    break
+                yield f"event: chunk\ndata: {json.dumps({'index': index, 'content': ''.join(lines)})}\n\n"
+                index += 1
+    else:
+        # Multiple of 3 so every chunk base64-encodes without padding in the middle
+        size = STREAM_CHUNK_BYTES - STREAM_CHUNK_BYTES % 3
+        with open(filename, 'rb') as f:
+            while True:
+                block = f.read(size)
+                if not block:
+                    break
+                payload = {'index': index, 'content': base64.b64encode(block).decode(), 'encoding': 'base64'}
+                yield f"event: chunk\ndata: {json.dumps(payload)}\n\n"
+                index += 1
+    return index
+
+
+def fresh_snapshot(data, account):
+    """Return (store, meta) when the client accepts a snapshot of the account no older than data['max_age'] seconds"""
+    max_age = data.get('max_age')
+    if max_age is None or not account:
+        return None, None
+    store = SnapshotStore(account)
+    return store, store.fresh(float(max_age))
+
+
+def env_account():
+    """Account of the configured HIYA_COOKIES - the same name the default schedule uses"""
+    return os.environ.get('HIYA_EMAIL') or 'default'
+
+
+def env_scraper(cookies):
+    """Scraper for the configured cookies, with the credentials for auto-refresh"""
+    scraper = HiyaScraper(email=os.environ.get('HIYA_EMAIL'), password=os.environ.get('HIYA_PASSWORD'), cookies=cookies)
+    scraper.account = env_account()
+    return scraper
+
+
+class Unauthorized(Exception):
+    pass
+
+
+def authorized_account(session, authorization):
+    """Account a read request may see - its session's verified account, or the configured one for the API token"""
+    if session:
+        stored = get_sessions().get(session)
+        if not stored:
+            raise Unauthorized('Unknown or expired session. Please authenticate again.')
+        if not stored['account']:
+            raise Unauthorized('The portal did not say which account this session belongs to')
+        return stored['account']
+    if API_TOKEN and hmac.compare_digest((authorization or '').encode(), f'Bearer {API_TOKEN}'.encode()):
+        return env_account()
+    raise Unauthorized('Authentication required - send a session handle (X-Hiya-Session) or the API token')
+
+
+def session_scraper(handle):
+    """Scraper for a stored session handle - raises LookupError when the handle is unknown"""
+    store = get_sessions()
+    session = store.get(handle)
+    if not session:
+        raise LookupError('Unknown or expired session. Please authenticate again.')
+    scraper = HiyaScraper(cookies=session['cookies'])
+    scraper.session_handle = handle
+    scraper.session_verified = store.is_verified(session)
+    # Verified from the portal when the session was created - never taken from the request
+    scraper.account = session['account']
+    return scraper
+
+
+def create_session(cookies):
+    """Store cookies that were just verified, under the account the portal says they belong to"""
+    sessions = get_sessions()
+    handle = sessions.create(cookies, account=session_probe.account(cookies), verified=True)
+    return sessions.describe(handle, sessions.get(handle))
+
+
+async def verify_cookies(cookies):
+    """Whether cookies reach the phones page on the shared browser"""
+    browser = await runtime.get_browser()
+    return await HiyaScraper(cookies=cookies).check_session(browser)
+
+
+class SessionRejected(Exception):
+    """Raised by preflight() when the probe shows the scrape cannot log in"""
+
+    def __init__(self, message, probe):
+        super().__init__(message)
+        self.probe = probe
+
+    def payload(self):
+        return {'error': str(self), 'session': self.probe}
+
+
+def preflight(scraper):
+    """Probe a scraper's cookies over HTTP - fail fast when they cannot work, skip the browser's login checks when they do"""
+    if not PROBE_ENABLED or not scraper.cookies or scraper.session_verified or scraper.har_mode == 'replay':
+        return None
+
+    probe = session_probe.check(scraper.cookies)
+    status = probe['status']
+    if scraper.session_handle and status != 'unknown':
+        get_sessions().update(scraper.session_handle, verified=status == 'valid')
+
+    if status == 'valid':
+        scraper.session_verified = True
+    elif status == 'mfa':
+        raise SessionRejected("Session expired and this device is no longer trusted - 2FA required. "
+                              "Please re-authenticate.", probe)
+    elif status == 'expired' and not (scraper.email and scraper.password):
+        raise SessionRejected("Cookies expired or invalid - please capture new cookies", probe)
+    return probe
+
+
+def scraper_for_request(data):
+    """Scraper for a request body's session or cookies, falling back to the configured HIYA_COOKIES and credentials"""
+    if data.get('session'):
+        return session_scraper(data['session'])
+    if data.get('cookies'):
+        return HiyaScraper(cookies=decode_cookies(data['cookies']))
+    cookies = load_cookies_from_env()
+    if not cookies:
+        return None
+    return env_scraper(cookies)
+
+
+def sse_event(event, data):
+    return f"event: {event}\ndata: {json.dumps(data)}\n\n"
+
+
+def progress_payload(scraper):
+    return {'records': scraper.record_count, 'pages_completed': scraper.pages_completed,
+            'total_pages': scraper.total_pages}
+
+
+def final_stream_event(job, fmt, chunks):
+    """Closing SSE event after the export chunks - 'partial' when the scrape failed part-way"""
+    scraper = job.scraper
+    result = dict(scraper.result_summary(), format=fmt, chunks=chunks)
+    if fmt not in TEXT_FORMATS:
+        result['encoding'] = 'base64'
+    if scraper.change_report:
+        result['changes'] = scraper.change_report['summary']
+    return sse_event('complete' if job.status == 'complete' else 'partial', result)
+
+
+def home_payload(scheduler=None):
+    """Liveness payload with cookie health and the endpoint list"""
+    cookies = load_cookies_from_env()
+    cookie_health = check_cookie_health(cookies)
+
+    # Check if credentials are configured for auto-refresh
+    has_credentials = bool(os.environ.get('HIYA_EMAIL') and os.environ.get('HIYA_PASSWORD'))
+
+    response = {
+        'status': 'running',
+        'message': 'Hiya Scraper API is running',
+        'cookie_health': cookie_health,
+        # Liveness never waits on the portal - a cold cache reports 'pending' and refreshes in the background
+        'session_probe': session_probe.peek(cookies) if cookies and PROBE_ENABLED else None,
+        'auto_refresh_enabled': has_credentials,
+        'browser': runtime.state,
+        'scheduler': scheduler.status() if scheduler else None,
+        'running_jobs': len(jobs.running()),
+        'endpoints': {
+            'scrape': '/scrape (POST)',
+            'scrape_stream': '/scrape-stream (POST)',
+            'scrape_diff': '/scrape-diff (POST)',
+            'latest_diff': '/diff/latest (GET)',
+            'snapshot': '/snapshot (GET)',
+            'phones': '/phones (GET)',
+            'jobs': '/jobs (POST), /jobs/<id> (GET, DELETE), /jobs/<id>/result (GET)',
+            'traces': '/jobs/<id>/traces (GET), /jobs/<id>/traces/<name> (GET)',
+            'auth': '/auth-and-capture (POST), /auth-and-capture/verify (POST)',
+            'sessions': '/sessions (POST), /sessions/<handle> (GET, DELETE)',
+            'ready': '/ready (GET)',
+            'metrics': '/metrics (GET)'
+        }
+    }
+
+    # Add helpful messages based on status
+    if cookie_health['status'] == 'missing':
+        response['action_required'] = 'Run capture_cookies.py and set HIYA_COOKIES environment variable'
+    elif cookie_health['status'] == 'expired':
+        response['action_required'] = 'Run capture_cookies.py to refresh all cookies'
+    elif cookie_health['status'] == 'auto_refresh':
+        if has_credentials:
+            response['info'] = 'Session will auto-refresh on next scrape (credentials configured)'
+        else:
+            response['action_required'] = 'Set HIYA_EMAIL and HIYA_PASSWORD for auto-refresh, or run capture_cookies.py'
+    elif cookie_health['status'] == 'warning':
+        response['warning'] = f"Device trust expires in {cookie_health['device_expires_in_days']} days. Run capture_cookies.py before expiration."
+
+    return response
+
+
+def ready_payload(prewarm_enabled):
+    """Readiness payload - ready once the shared browser is warm"""
+    status = runtime.status()
+    status['prewarm_enabled'] = prewarm_enabled
+
+    if runtime.state == 'ready':
+        is_ready = True
+    elif prewarm_enabled:
+        # Still warming up, or the prewarm failed
+        is_ready = False
+    else:
+        # No prewarm configured - the browser launches on the first scrape
+        is_ready = runtime.state != 'failed'
+
+    status['ready'] = is_ready
+    return status
+
+
+def metrics_payload():
+    return {
+        'rate_limits': rate_limit_metrics(),
+        'browser': runtime.status(),
+        'normalization_cache': normalization_cache_stats(),
+        'pending_logins': pending_logins.status(),
+        'session_probe': session_probe.stats(),
+        'latency': latency.metrics(),
+    }
+
+
+def phones_etag(meta, query_string):
+    """ETag covering the data version and the exact query, so unchanged polls are 304s"""
+    return f'{meta["version"]}-{hashlib.sha1(query_string).hexdigest()[:16]}'
+
+
+def phones_payload(args, account, meta):
+    """Run a /phones query over the indexed results - raises ValueError for bad parameters"""
+    sort = args.get('sort', 'phone_number')
+    descending = sort.startswith('-')
+    filters = ScrapeFilters.from_dict(args)
+    items, next_cursor = get_store().query(
+        account,
+        filters=filters,
+        prefix=args.get('q'),
+        sort=sort.lstrip('-'),
+        descending=descending,
+        limit=args.get('limit', 100),
+        cursor=args.get('cursor'),
+    )
+    return {
+        'items': items,
+        'count': len(items),
+        'next_cursor': next_cursor,
+        'version': meta['version'],
+        'updated_at': datetime.fromtimestamp(meta['updated_at']).isoformat(timespec='seconds'),
+        'total_records': meta['records'],
+        'complete': bool(meta['complete']),
+    }
+
+
+def traces_payload(job):
+    """Slow-page traces saved for a job, or None when tracing was off for its scrape"""
+    tracer = job.scraper.tracer
+    if not tracer:
+        return None
+    return dict(tracer.status(), job_id=job.id)
+
+
+def encode_cookies(cookies):
+    return base64.b64encode(json.dumps(cookies, indent=2).encode()).decode()
+
+
+async def capture_login_cookies(context):
+    """Capture the Hiya cookies (session and device trust) from a logged-in context"""
+    print("🍪 Capturing cookies...")
+    all_cookies = await context.cookies()
+
+    # Filter for Hiya-related cookies
+    important_domains = ['hiya.com', 'auth-console.hiya.com', 'business.hiya.com']
+    filtered_cookies = [
+        cookie for cookie in all_cookies
+        if any(domain in cookie.get('domain', '') for domain in important_domains)
+    ]
+
+    print(f"✅ Captured {len(filtered_cookies)} cookies")
+
+    # Print cookie expiration info
+    for cookie in filtered_cookies:
+        if cookie.get('name') in ['auth0-mf', 'did', 'auth0']:
+            expires = cookie.get('expires', -1)
+            if expires > 0:
+                expire_date = datetime.fromtimestamp(expires)
+                print(f"   {cookie.get('name')}: expires {expire_date}")
+
+    return filtered_cookies
+
+
+def captured_payload(cookies):
+    return {
+        'status': 'success',
+        'cookies': encode_cookies(cookies),
+        'cookie_count': len(cookies),
+        'message': 'Authentication successful! Device remembered for 30 days.'
+    }
+
+
+def mfa_required_payload(e):
+    return {
+        'status': 'mfa_required',
+        'pending_token': e.token,
+        'expires_in': int(e.expires_in),
+        'message': '2FA code required - submit it with the pending_token to /auth-and-capture/verify'
+    }
+
+
+async def authenticate_and_capture(scraper, twofa_code=None):
+    """Authenticate with Hiya and capture cookies - without a code, an MFA prompt parks the login and raises MfaRequired"""
+    from playwright.async_api import TimeoutError as PlaywrightTimeout
+
+    # Use a fresh context on the shared (possibly prewarmed) browser
+    browser = await runtime.get_browser()
+
+    context = await browser.new_context(**CONTEXT_OPTIONS)
+    monitor_context(context)
+
+    page = await context.new_page()
+    parked = False
+
+    try:
+        print(f"🔐 Authenticating user: {scraper.email}")
+
+        # Submit credentials, then act on whichever outcome the portal shows first
+        await submit_credentials(page, scraper.login_url, scraper.email, scraper.password)
+        outcome = await wait_for_login(page)
+
+        if outcome == 'mfa':
+            print("📱 2FA required")
+
+            if not twofa_code:
+                # Keep the page on the MFA prompt for the follow-up request with the code
+                token = await pending_logins.add(scraper, context, page)
+                parked = True
+                raise MfaRequired(token, pending_logins.ttl)
+
+            await submit_mfa_code(page, scraper.login_url, twofa_code)
+
+        print("✅ Login successful!")
+        return await capture_login_cookies(context)
+
+    except PlaywrightTimeout as e:
+        print(f"❌ Timeout during authentication: {e}")
+        raise Exception("Authentication timeout. Please try again.")
+    except MfaRequired:
+        raise
+    except Exception as e:
+        print(f"❌ Authentication error: {e}")
+        raise
+    finally:
+        if not parked:
+            await context.close()
+
+
+async def verify_pending_login(token, twofa_code):
+    """Second step of a 2FA login - enter the code into the page parked by authenticate_and_capture"""
+    from playwright.async_api import TimeoutError as PlaywrightTimeout
+
+    login = await pending_logins.take(token)
+    if not login:
+        raise LookupError("Login session expired or not found. Please log in again.")
+
+    keep = False
+    try:
+        print(f"🔐 Verifying 2FA code for: {login.scraper.email}")
+        await submit_mfa_code(login.page, login.scraper.login_url, twofa_code)
+
+        print("✅ Login successful!")
+        return await capture_login_cookies(login.context)
+
+    except PlaywrightTimeout as e:
+        print(f"❌ Timeout during 2FA verification: {e}")
+        raise Exception("Authentication timeout. Please try again.")
+    except Exception as e:
+        print(f"❌ 2FA verification error: {e}")
+        # A rejected code leaves the prompt up - keep the login so another code can be tried
+        if not login.expired and is_mfa_url(login.page.url):
+            pending_logins.restore(login)
+            keep = True
+        raise
+    finally:
+        if not keep:
+            await login.close()
@@ -0,0 +1,156 @@
+"""
+Server-side session handles
+Exchanges a client's cookie blob for an opaque handle once, keeping the
+validated cookies, their expiry and when they were last verified on the
+server so later scrapes skip decoding and re-checking them
+"""
+
+import json
+import os
+import secrets
+import threading
+import time
+
+from settings import state_path
+
+SESSIONS_FILE = 'sessions.json'
+
+# A verified session is trusted without re-checking for this long
+VERIFY_INTERVAL_SECONDS = float(os.environ.get('HIYA_SESSION_VERIFY_SECONDS', 600))
+# Unused handles are forgotten after this long
+SESSION_TTL_SECONDS = float(os.environ.get('HIYA_SESSION_TTL_SECONDS', 30 * 86400))
+
+SESSION_COOKIES = ('auth0', 'auth0_compat', 'appSession.0', 'appSession.1')
+DEVICE_COOKIES = ('auth0-mf', 'auth0-mf_compat', 'did', 'did_compat')
+
+
+def cookie_expiry(cookies, names):
+    """Latest expiry among the named cookies - None for browser-session cookies or when none are present"""
+    expiries = [cookie.get('expires', -1) for cookie in cookies if cookie.get('name') in names]
+    if not expiries or any(expires == -1 for expires in expiries):
+        return None
+    return max(expiries)
+
+
+class SessionStore:
+    """Cookie sets keyed by opaque handles, persisted under the state directory"""
+
+    def __init__(self, path=None, verify_interval=VERIFY_INTERVAL_SECONDS, ttl=SESSION_TTL_SECONDS):
+        self.path = path or state_path(SESSIONS_FILE)
+        self.verify_interval = verify_interval
+        self.ttl = ttl
+        self._lock = threading.Lock()
+        self.sessions = self._load()
+
+    def _load(self):
+        try:
+            with open(self.path, 'r', encoding='utf-8') as f:
+                return json.load(f)
+        except (OSError, ValueError):
+            return {}
+
+    def _save(self):
+        tmp = f'{self.path}.tmp'
+        # Cookies are credentials - keep the file private to this user
+        fd = os.open(tmp, os.O_WRONLY | os.O_CREAT | os.O_TRUNC, 0o600)
+        with os.fdopen(fd, 'w', encoding='utf-8') as f:
+            json.dump(self.sessions, f)
+        os.replace(tmp, self.path)
+
+    def _prune(self):
+        now = time.time()
+        expired = [handle for handle, session in self.sessions.items() if now - session['last_used'] > self.ttl]
+        for handle in expired:
+            del self.sessions[handle]
+        return bool(expired)
+
+    def create(self, cookies, account=None, verified=False):
+        """Store a cookie set and return its new handle"""
+        handle = secrets.token_urlsafe(32)
+        now = time.time()
+        with self._lock:
+            self._prune()
+            self.sessions[handle] = {
+                'cookies': cookies,
+                'account': account,
+                'created_at': now,
+                'last_used': now,
+                'last_verified': now if verified else None,
+            }
+            self._save()
+        return handle
+
+    def get(self, handle):
+        """The session for a handle (touching its last use), or None"""
+        with self._lock:
+            session = self.sessions.get(handle)
+            if session:
+                session['last_used'] = time.time()
+            return session
+
+    def is_verified(self, session):
+        """Whether the cookies were verified recently enough, and have not expired since"""
+        if not session or not session['last_verified']:
+            return False
+        if time.time() - session['last_verified'] > self.verify_interval:
+            return False
+        expires = cookie_expiry(session['cookies'], SESSION_COOKIES)
+        return expires is None or expires > time.time()
+
+    def update(self, handle, cookies=None, verified=None):
+        """Refresh a session in place after a scrape - new cookies, and whether they still work"""
+        with self._lock:
+            session = self.sessions.get(handle)
+            if not session:
+                return None
+            if cookies:
+                session['cookies'] = cookies
+            if verified is not None:
+                session['last_verified'] = time.time() if verified else None
+            self._save()
+            return session
+
+    def delete(self, handle):
+        with self._lock:
+            session = self.sessions.pop(handle, None)
+            if session:
+                self._save()
+            return session is not None
+
+    def describe(self, handle, session):
+        """Session metadata for clients - never the cookies themselves"""
+        cookies = session['cookies']
+        return {
+            'session': handle,
+            'account': session['account'],
+            'created_at': session['created_at'],
+            'last_verified': session['last_verified'],
+            'verified': self.is_verified(session),
+            'session_expires_at': cookie_expiry(cookies, SESSION_COOKIES),
+            'device_expires_at': cookie_expiry(cookies, DEVICE_COOKIES),
+            'cookie_count': len(cookies),
+        }
+
+
+def remember_outcome(scraper):
+    """Refresh a scraper's session after a scrape - its latest cookies, and whether they got past the login"""
+    if not scraper.session_handle:
+        return
+    if scraper.pages_completed:
+        get_sessions().update(scraper.session_handle, cookies=scraper.cookies, verified=True)
+    elif scraper.status == 'failed':
+        # Could be the session or anything else - either way, check it properly next time
+        get_sessions().update(scraper.session_handle, verified=False)
+
+
+_store = None
+_store_lock = threading.Lock()
+
+
+def get_sessions():
+    """Process-wide session store, opened on first use"""
+    global _store
+    with _store_lock:
+        if _store is None:
+            _store = SessionStore()
+        return _store
@@ -0,0 +1,23 @@
+"""
+Shared runtime settings for the Hiya scraper
+Paths for state that persists between runs (caches, indexes, snapshots)
+"""
+
+import os
+
+# Directory for persistent scraper state - override with HIYA_STATE_DIR
+STATE_DIR = os.environ.get('HIYA_STATE_DIR', os.path.join(os.path.dirname(os.path.abspath(__file__)), '.hiya_state'))
+
+
+def state_path(*parts):
+    """Return a path inside the state directory, creating parent directories as needed"""
+    path = os.path.join(STATE_DIR, *parts)
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    return path
+
+
+def env_flag(name, default=False):
+    value = os.environ.get(name)
+    if value is None:
+        return default
+    return value.strip().lower() in ('1', 'true', 'yes', 'on')
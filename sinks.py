@@ -0,0 +1,84 @@
+"""
+Bounded-memory record buffers
+Keeps up to memory_cap records in memory and spills the rest to an
+append-only temporary file, replayed lazily in insertion order
+Only callers that keep rows in memory (HiyaScraper.keep_data=True, e.g. the
+CLI) buffer into a sink - the API streams rows straight to its output file
+"""
+
+import os
+import pickle
+import tempfile
+
+DEFAULT_MEMORY_CAP = int(os.environ.get('HIYA_MEMORY_CAP_RECORDS', 5000))
+
+
+class RecordSink:
+    """Append-only record buffer that spills to disk past memory_cap records"""
+
+    def __init__(self, memory_cap=None):
+        self.memory_cap = DEFAULT_MEMORY_CAP if memory_cap is None else memory_cap
+        self._buffer = []
+        self._spill_file = None
+        self._spill_path = None
+        self._spilled = 0
+
+    def append(self, record):
+        self.extend([record])
+
+    def extend(self, records):
+        self._buffer.extend(records)
+        if len(self._buffer) > self.memory_cap:
+            self._spill()
+
+    def _spill(self):
+        """Move the in-memory buffer to the end of the spill file"""
+        if self._spill_file is None:
+            fd, self._spill_path = tempfile.mkstemp(prefix='hiya_records_', suffix='.pkl')
+            self._spill_file = os.fdopen(fd, 'ab')
+            print(f"💾 Record buffer over {self.memory_cap} records - spilling to disk")
+        for record in self._buffer:
+            pickle.dump(record, self._spill_file, protocol=pickle.HIGHEST_PROTOCOL)
+        self._spill_file.flush()
+        self._spilled += len(self._buffer)
+        self._buffer = []
+
+    def __len__(self):
+        return self._spilled + len(self._buffer)
+
+    def __bool__(self):
+        return len(self) > 0
+
+    def __iter__(self):
+        """Replay spilled records from disk, then the in-memory tail"""
+        spilled = self._spilled
+        tail = list(self._buffer)
+        if spilled:
+            # Independent read handle, so appends can continue while replaying
+            with open(self._spill_path, 'rb') as f:
+                for _ in range(spilled):
+                    yield pickle.load(f)
+        yield from tail
+
+    def first(self):
+        return next(iter(self), None)
+
+    @property
+    def spilled(self):
+        return self._spilled
+
+    def close(self):
+        """Drop buffered records and delete the spill file"""
+        if self._spill_file is not None:
+            self._spill_file.close()
+            self._spill_file = None
+            try:
+                os.unlink(self._spill_path)
+            except OSError:
+                pass
+            self._spill_path = None
+        self._buffer = []
+        self._spilled = 0
+
+    def __del__(self):
+        self.close()
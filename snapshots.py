@@ -0,0 +1,99 @@
+"""
+Precomputed scrape snapshots
+The newest complete result per account, stored as NDJSON under the state
+directory and converted to the requested format on download
+"""
+
+import json
+import os
+import tempfile
+import time
+
+from changes import account_key
+from exporters import get_writer, normalize_format, format_extension
+from settings import state_path
+
+SNAPSHOT_FILE = 'snapshot.ndjson'
+META_FILE = 'meta.json'
+
+
+def read_rows(filename):
+    """Yield record dicts from an NDJSON snapshot, unpacking the extras column"""
+    with open(filename, 'r', encoding='utf-8') as f:
+        for line in f:
+            if not line.strip():
+                continue
+            row = json.loads(line)
+            extras = row.pop('extras', '')
+            if extras:
+                row.update(json.loads(extras))
+            yield row
+
+
+class SnapshotStore:
+    """Latest snapshot for one account"""
+
+    def __init__(self, account='default'):
+        self.account = account_key(account)
+
+    def _path(self, name):
+        return state_path('snapshots', self.account, name)
+
+    def new_path(self):
+        """Path for a snapshot that is being written - published with publish()"""
+        return self._path(f'{SNAPSHOT_FILE}.{os.getpid()}.{int(time.time() * 1000)}.tmp')
+
+    def publish(self, tmp_filename, records, complete=True, pages=None, enriched=False):
+        """Atomically replace the current snapshot with a freshly written one"""
+        os.replace(tmp_filename, self._path(SNAPSHOT_FILE))
+        meta = {
+            'account': self.account,
+            'created_at': time.time(),
+            'records': records,
+            'pages': pages,
+            'complete': complete,
+            'enriched': enriched,
+        }
+        meta_tmp = self._path(META_FILE + '.tmp')
+        with open(meta_tmp, 'w', encoding='utf-8') as f:
+            json.dump(meta, f)
+        os.replace(meta_tmp, self._path(META_FILE))
+        print(f"📸 Snapshot published for {self.account}: {records} records")
+        return meta
+
+    def latest(self):
+        """Metadata of the newest snapshot (with its age in seconds), or None"""
+        meta_file = self._path(META_FILE)
+        if not os.path.exists(meta_file) or not os.path.exists(self._path(SNAPSHOT_FILE)):
+            return None
+        with open(meta_file, 'r', encoding='utf-8') as f:
+            meta = json.load(f)
+        meta['age'] = max(0.0, time.time() - meta['created_at'])
+        return meta
+
+    def fresh(self, max_age):
+        """Newest snapshot if it is no older than max_age seconds, else None"""
+        meta = self.latest()
+        if meta and meta['age'] <= max_age:
+            return meta
+        return None
+
+    def rows(self):
+        return read_rows(self._path(SNAPSHOT_FILE))
+
+    def export(self, fmt='csv', filters=None):
+        """Return (filename, is_temporary) for the snapshot in the requested format"""
+        fmt = normalize_format(fmt)
+        if fmt == 'ndjson' and not filters:
+            # Stored format - serve the file itself
+            return self._path(SNAPSHOT_FILE), False
+
+        meta = self.latest() or {}
+        with tempfile.NamedTemporaryFile(delete=False, suffix=format_extension(fmt)) as tmp:
+            filename = tmp.name
+        with get_writer(fmt, filename, extras='pack' if meta.get('enriched') else 'ignore') as writer:
+            rows = self.rows()
+            if filters:
+                rows = (row for row in rows if filters.matches(row))
+            writer.write_rows(rows)
+        return filename, True
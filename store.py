@@ -0,0 +1,259 @@
+"""
+Indexed local copy of the latest scrape results
+SQLite database under the state directory that backs the read-only
+/phones query API without launching a browser
+"""
+
+import base64
+import json
+import re
+import sqlite3
+import threading
+import time
+import uuid
+
+from changes import account_key
+from filters import parse_date
+from records import FIELDS, NORMALIZED_FIELDS
+from settings import state_path
+
+SCHEMA_SQL = """
+CREATE TABLE IF NOT EXISTS phones (
+    account TEXT NOT NULL,
+    phone_number TEXT NOT NULL,
+    phone_digits TEXT NOT NULL,
+    submitted_at TEXT,
+    submitted_date TEXT,
+    submitted_email TEXT,
+    registration_job_name TEXT,
+    branded_call TEXT,
+    spam_labeling TEXT,
+    spam_category TEXT,
+    registration_status TEXT,
+    extras TEXT,
+    PRIMARY KEY (account, phone_number)
+);
+CREATE INDEX IF NOT EXISTS idx_phones_digits ON phones (account, phone_digits);
+CREATE INDEX IF NOT EXISTS idx_phones_submitted ON phones (account, submitted_at, phone_number);
+CREATE INDEX IF NOT EXISTS idx_phones_status ON phones (account, registration_status, phone_number);
+CREATE INDEX IF NOT EXISTS idx_phones_labeling ON phones (account, spam_labeling, phone_number);
+CREATE INDEX IF NOT EXISTS idx_phones_job ON phones (account, registration_job_name, phone_number);
+
+CREATE TABLE IF NOT EXISTS phones_staging (
+    load_id TEXT NOT NULL,
+    account TEXT NOT NULL,
+    phone_number TEXT NOT NULL,
+    phone_digits TEXT NOT NULL,
+    submitted_at TEXT,
+    submitted_date TEXT,
+    submitted_email TEXT,
+    registration_job_name TEXT,
+    branded_call TEXT,
+    spam_labeling TEXT,
+    spam_category TEXT,
+    registration_status TEXT,
+    extras TEXT
+);
+CREATE INDEX IF NOT EXISTS idx_staging_load ON phones_staging (load_id);
+
+CREATE TABLE IF NOT EXISTS results_meta (
+    account TEXT PRIMARY KEY,
+    version INTEGER NOT NULL,
+    updated_at REAL NOT NULL,
+    records INTEGER NOT NULL,
+    complete INTEGER NOT NULL
+);
+"""
+
+COLUMNS = ('phone_number', 'phone_digits', 'submitted_at') + tuple(f for f in FIELDS if f != 'phone_number') + ('extras',)
+
+# Sortable columns exposed by the API
+SORT_COLUMNS = ('phone_number', 'submitted_at', 'registration_status', 'spam_labeling',
+                'registration_job_name', 'spam_category')
+
+MAX_LIMIT = 1000
+
+
+def digits(phone_number):
+    return re.sub(r'\D', '', phone_number or '')
+
+
+def to_row(record):
+    """Flatten a record into the table's column values"""
+    submitted = parse_date(record['submitted_date'])
+    # Normalized columns are derived from the raw ones, so only detail attributes are extras
+    extras = {key: record[key] for key in record if key not in FIELDS and key not in NORMALIZED_FIELDS}
+    values = {
+        'phone_digits': digits(record['phone_number']),
+        'submitted_at': submitted.isoformat() if submitted else '',
+        'extras': json.dumps(extras, ensure_ascii=False, sort_keys=True) if extras else None,
+    }
+    return tuple(values[name] if name in values else record.get(name, '') for name in COLUMNS)
+
+
+def encode_cursor(values):
+    return base64.urlsafe_b64encode(json.dumps(values).encode()).decode().rstrip('=')
+
+
+def decode_cursor(cursor):
+    try:
+        padded = cursor + '=' * (-len(cursor) % 4)
+        values = json.loads(base64.urlsafe_b64decode(padded.encode()).decode())
+    except Exception:
+        raise ValueError("Invalid cursor")
+    # A (sort value, phone number) pair, as encode_cursor wrote it
+    if not isinstance(values, list) or len(values) != 2 or \
+            not all(value is None or isinstance(value, (str, int, float)) for value in values):
+        raise ValueError("Invalid cursor")
+    return values
+
+
+class IndexLoader:
+    """Streams one scrape's rows into staging, then swaps them in atomically on commit"""
+
+    def __init__(self, result_store, account):
+        self.result_store = result_store
+        self.account = account_key(account)
+        self.load_id = uuid.uuid4().hex
+        self.rows_written = 0
+
+    def write_rows(self, records):
+        rows = [(self.load_id, self.account) + to_row(record) for record in records]
+        if not rows:
+            return 0
+        placeholders = ', '.join('?' * (len(COLUMNS) + 2))
+        with self.result_store.connect() as conn:
+            conn.executemany(
+                f"INSERT INTO phones_staging (load_id, account, {', '.join(COLUMNS)}) VALUES ({placeholders})",
+                rows
+            )
+        self.rows_written += len(rows)
+        return len(rows)
+
+    def commit(self, complete=True):
+        """Replace the account's indexed results with a complete load, or merge a partial one into them"""
+        columns = ', '.join(COLUMNS)
+        with self.result_store.connect() as conn:
+            if complete:
+                conn.execute("DELETE FROM phones WHERE account = ?", (self.account,))
+            conn.execute(
+                f"INSERT OR REPLACE INTO phones (account, {columns}) "
+                f"SELECT account, {columns} FROM phones_staging WHERE load_id = ? ORDER BY rowid",
+                (self.load_id,)
+            )
+            conn.execute("DELETE FROM phones_staging WHERE load_id = ?", (self.load_id,))
+            records = conn.execute("SELECT COUNT(*) FROM phones WHERE account = ?", (self.account,)).fetchone()[0]
+            # A partial load only refreshes the rows it saw - the index stays as complete as it was
+            conn.execute(
+                "INSERT INTO results_meta (account, version, updated_at, records, complete) VALUES (?, 1, ?, ?, ?) "
+                "ON CONFLICT(account) DO UPDATE SET version = version + 1, updated_at = excluded.updated_at, "
+                "records = excluded.records, complete = CASE WHEN excluded.complete = 1 THEN 1 ELSE complete END",
+                (self.account, time.time(), records, int(complete))
+            )
+        print(f"🗂️  {'Indexed' if complete else 'Merged'} {self.rows_written} records for {self.account}")
+
+    def rollback(self):
+        with self.result_store.connect() as conn:
+            conn.execute("DELETE FROM phones_staging WHERE load_id = ?", (self.load_id,))
+
+
+class ResultStore:
+    """SQLite store of the latest results per account"""
+
+    def __init__(self, filename=None):
+        self.filename = filename or state_path('results.sqlite3')
+        self._local = threading.local()
+        with self.connect() as conn:
+            conn.executescript(SCHEMA_SQL)
+
+    def connect(self):
+        """Per-thread connection (WAL mode, so readers never block the loader)"""
+        conn = getattr(self._local, 'conn', None)
+        if conn is None:
+            conn = sqlite3.connect(self.filename, timeout=30)
+            conn.row_factory = sqlite3.Row
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            self._local.conn = conn
+        return conn
+
+    def loader(self, account):
+        return IndexLoader(self, account)
+
+    def meta(self, account):
+        row = self.connect().execute(
+            "SELECT version, updated_at, records, complete FROM results_meta WHERE account = ?",
+            (account_key(account),)
+        ).fetchone()
+        return dict(row) if row else None
+
+    def query(self, account, filters=None, prefix=None, sort='phone_number', descending=False,
+              limit=100, cursor=None):
+        """Filtered, sorted page of results with an opaque cursor for the next page"""
+        if sort not in SORT_COLUMNS:
+            raise ValueError(f"Cannot sort by '{sort}'. Choose one of: {', '.join(SORT_COLUMNS)}")
+        limit = max(1, min(int(limit), MAX_LIMIT))
+
+        where = ["account = ?"]
+        params = [account_key(account)]
+        if filters:
+            if filters.status:
+                where.append("registration_status = ? COLLATE NOCASE")
+                params.append(filters.status)
+            if filters.spam_labeling:
+                where.append("spam_labeling = ? COLLATE NOCASE")
+                params.append(filters.spam_labeling)
+            if filters.job_name:
+                where.append("registration_job_name LIKE ?")
+                params.append(f"%{filters.job_name}%")
+            if filters.date_from:
+                where.append("submitted_at >= ?")
+                params.append(filters.date_from.isoformat())
+            if filters.date_to:
+                where.append("submitted_at <= ?")
+                params.append(filters.date_to.isoformat())
+        if prefix:
+            prefix_digits = digits(prefix)
+            if prefix_digits:
+                # Range scan on the digits index instead of LIKE
+                where.append("phone_digits >= ? AND phone_digits < ?")
+                params.extend([prefix_digits, prefix_digits + ':'])
+
+        if cursor:
+            last_value, last_phone = decode_cursor(cursor)
+            op = '<' if descending else '>'
+            where.append(f"({sort}, phone_number) {op} (?, ?)")
+            params.extend([last_value, last_phone])
+
+        direction = 'DESC' if descending else 'ASC'
+        sql = (f"SELECT * FROM phones WHERE {' AND '.join(where)} "
+               f"ORDER BY {sort} {direction}, phone_number {direction} LIMIT ?")
+        rows = self.connect().execute(sql, params + [limit + 1]).fetchall()
+
+        next_cursor = None
+        if len(rows) > limit:
+            rows = rows[:limit]
+            last = rows[-1]
+            next_cursor = encode_cursor([last[sort], last['phone_number']])
+
+        items = []
+        for row in rows:
+            item = {name: row[name] for name in FIELDS}
+            item['submitted_at'] = row['submitted_at'] or None
+            if row['extras']:
+                item.update(json.loads(row['extras']))
+            items.append(item)
+        return items, next_cursor
+
+
+_store = None
+_store_lock = threading.Lock()
+
+
+def get_store():
+    """Process-wide ResultStore, created on first use"""
+    global _store
+    with _store_lock:
+        if _store is None:
+            _store = ResultStore()
+        return _store
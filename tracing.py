@@ -0,0 +1,233 @@
+"""
+Sampled Playwright tracing for slow table pages
+Traces a fraction of scrapes from the start and switches tracing on for the
+rest of any run once a page is slow, keeping trace chunks (network timing,
+DOM snapshots, console output) only for the pages that were slow, with
+cookies and credentials scrubbed from their network logs
+"""
+
+import asyncio
+import json
+import os
+import random
+import shutil
+import time
+import uuid
+import zipfile
+
+import har
+from settings import STATE_DIR, env_flag
+
+TRACE_SAMPLE_RATE = float(os.environ.get('HIYA_TRACE_SAMPLE_RATE', 0.1))
+# A page is slow past this many seconds, or this many times the run's median page time
+SLOW_PAGE_SECONDS = float(os.environ.get('HIYA_TRACE_SLOW_PAGE_SECONDS', 20))
+SLOW_PAGE_FACTOR = float(os.environ.get('HIYA_TRACE_SLOW_PAGE_FACTOR', 3))
+# Runs whose traces are kept on disk - older ones are deleted
+TRACE_RETENTION = int(os.environ.get('HIYA_TRACE_RETENTION', 20))
+
+TRACES_DIR = os.path.join(STATE_DIR, 'traces')
+
+
+def prune_traces(keep=TRACE_RETENTION):
+    """Delete all but the newest `keep` runs' trace directories"""
+    try:
+        runs = [os.path.join(TRACES_DIR, name) for name in os.listdir(TRACES_DIR)]
+    except OSError:
+        return
+    runs = sorted((path for path in runs if os.path.isdir(path)), key=os.path.getmtime, reverse=True)
+    for path in runs[keep:]:
+        shutil.rmtree(path, ignore_errors=True)
+
+
+def scrub_trace(path):
+    """Rewrite a trace zip without the session - headers, cookies and credentials in requests and JSON bodies"""
+    tmp = f'{path}.tmp'
+    with zipfile.ZipFile(path) as src:
+        items = src.infolist()
+        network = {item.filename: src.read(item) for item in items if item.filename.endswith('.network')}
+        json_resources = set()
+        for name, data in network.items():
+            network[name] = scrub_network(data, json_resources)
+        with zipfile.ZipFile(tmp, 'w', zipfile.ZIP_DEFLATED) as dst:
+            for item in items:
+                data = network.get(item.filename)
+                if data is None:
+                    data = src.read(item)
+                    if os.path.basename(item.filename) in json_resources:
+                        data = scrub_json_bytes(data)
+                dst.writestr(item, data)
+    os.replace(tmp, path)
+
+
+def scrub_network(data, json_resources):
+    """Scrub a trace's network log (one HAR entry per line), noting the JSON bodies it points at"""
+    lines = []
+    for line in data.decode('utf-8').splitlines():
+        try:
+            event = json.loads(line)
+        except ValueError:
+            lines.append(line)
+            continue
+        entry = event.get('snapshot') if event.get('type') == 'resource-snapshot' else None
+        if entry:
+            har.scrub_entry(entry)
+            content = entry.get('response', {}).get('content', {})
+            if content.get('_sha1') and 'json' in content.get('mimeType', ''):
+                json_resources.add(content['_sha1'])
+        lines.append(json.dumps(event))
+    return ('\n'.join(lines) + '\n').encode('utf-8')
+
+
+def scrub_json_bytes(data):
+    try:
+        return json.dumps(har.scrub_json(json.loads(data))).encode('utf-8')
+    except ValueError:
+        return b''
+
+
+class PageTracer:
+    """Times each table page and saves a trace chunk for the slow ones"""
+
+    def __init__(self, sample_rate=TRACE_SAMPLE_RATE, slow_seconds=SLOW_PAGE_SECONDS, slow_factor=SLOW_PAGE_FACTOR):
+        self.run_id = uuid.uuid4().hex
+        self.sampled = random.random() < sample_rate
+        self.slow_seconds = slow_seconds
+        self.slow_factor = slow_factor
+        self.context = None
+        self.active = False  # Tracing started on the current context
+        self.failed = False  # Tracing errored once - the rest of the run goes untraced
+        self.chunk_page = None  # Page number the open chunk (or timer) belongs to
+        self.started_at = None
+        self.durations = []
+        self.slow_pages = []
+        self.files = []
+
+    @property
+    def directory(self):
+        return os.path.join(TRACES_DIR, self.run_id)
+
+    async def attach(self, context):
+        """Trace a (new) context - right away for sampled runs, or once a page has been slow"""
+        self.context = context
+        self.active = False
+        self.chunk_page = None
+        if self.sampled or self.slow_pages:
+            await self._start()
+
+    async def _start(self):
+        if self.failed:
+            return
+        try:
+            await self.context.tracing.start(snapshots=True, screenshots=True, sources=False)
+            # start() opens a chunk of its own - drop it so chunks line up with pages
+            await self.context.tracing.stop_chunk()
+            self.active = True
+        except Exception as e:
+            print(f"⚠️  Could not start tracing: {e}")
+
+    async def _disable(self, error):
+        """Give up tracing for the rest of the run - a tracing or disk error must not fail the scrape"""
+        print(f"⚠️  Tracing failed, continuing without it: {error}")
+        self.failed = True
+        self.active = False
+        try:
+            await self.context.tracing.stop()
+        except Exception:
+            pass
+
+    async def begin(self, page_number):
+        """Start timing (and tracing) a page - a no-op if that page is already open"""
+        if self.chunk_page == page_number:
+            return
+        previous = self.chunk_page
+        self.chunk_page = page_number
+        self.started_at = time.monotonic()
+        if not self.active:
+            return
+        try:
+            if previous is not None:
+                await self.context.tracing.stop_chunk()
+            await self.context.tracing.start_chunk(title=f'page {page_number}')
+        except Exception as e:
+            await self._disable(e)
+
+    def is_slow(self, seconds):
+        if self.slow_seconds and seconds >= self.slow_seconds:
+            return True
+        if self.slow_factor and len(self.durations) >= 3:
+            median = sorted(self.durations)[len(self.durations) // 2]
+            return seconds >= median * self.slow_factor
+        return False
+
+    async def finish(self, page_number):
+        """Stop timing a page, keeping its trace chunk only if it was slow"""
+        if self.chunk_page != page_number:
+            return
+        seconds = time.monotonic() - self.started_at
+        slow = self.is_slow(seconds)
+        self.durations.append(seconds)
+        self.chunk_page = None
+
+        trace = None
+        if self.active:
+            try:
+                if slow:
+                    os.makedirs(self.directory, exist_ok=True)
+                    name = f'page-{page_number:03d}.zip'
+                    path = os.path.join(self.directory, name)
+                    await self.context.tracing.stop_chunk(path=path)
+                    # Traces are downloadable by job id - keep the session out of them
+                    try:
+                        await asyncio.to_thread(scrub_trace, path)
+                    except Exception:
+                        os.unlink(path)
+                        raise
+                    trace = name
+                    self.files.append(trace)
+                    prune_traces()
+                else:
+                    await self.context.tracing.stop_chunk()
+            except Exception as e:
+                await self._disable(e)
+
+        if slow:
+            print(f"🐢 Page {page_number} took {seconds:.1f}s" + (f" - trace saved as {trace}" if trace else
+                                                                    " - tracing the rest of the run"))
+            self.slow_pages.append({'page': page_number, 'seconds': round(seconds, 2), 'trace': trace})
+            if not self.active:
+                await self._start()
+
+    async def close(self):
+        """Discard any open chunk and stop tracing before the context closes"""
+        if not self.active:
+            return
+        try:
+            if self.chunk_page is not None:
+                await self.context.tracing.stop_chunk()
+            await self.context.tracing.stop()
+        except Exception as e:
+            print(f"⚠️  Could not stop tracing: {e}")
+        self.active = False
+        self.chunk_page = None
+
+    def path(self, name):
+        """Path of one of this run's trace files, or None if it is not one"""
+        if name not in self.files:
+            return None
+        path = os.path.join(self.directory, name)
+        return path if os.path.exists(path) else None
+
+    def status(self):
+        return {
+            'run_id': self.run_id,
+            'sampled': self.sampled,
+            'slow_pages': self.slow_pages,
+            'traces': [name for name in self.files if self.path(name)],
+        }
+
+
+def default_tracer():
+    """Tracer configured from the environment, or None unless HIYA_TRACING=1"""
+    if not env_flag('HIYA_TRACING'):
+        return None
+    return PageTracer()